@@ -0,0 +1,232 @@
+# ann_index.py - In-process nearest-neighbour indexes over patient embeddings
+
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2, matches DATA.PatientEmbeddings VECTOR(DECIMAL, 384)
+
+
+def parse_vector(value) -> np.ndarray:
+    """
+    Converts an IRIS VECTOR value into a float32 array.
+    The driver returns vectors either as a comma-separated string
+    (optionally wrapped in brackets) or as a sequence of numbers.
+    """
+    if isinstance(value, str):
+        return np.array(value.strip("[] ").split(","), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns indices of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class ExactIndex:
+    """
+    Brute-force inner-product search over an in-memory embedding matrix.
+    Returns the same ranking as the VECTOR_DOT_PRODUCT query, without the round-trip.
+    """
+    name = "exact"
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, patient_id: str) -> bool:
+        return patient_id in self._positions
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the stored embeddings, one row per entry in self.ids."""
+        return self._matrix[:len(self.ids)]
+
+    def get(self, patient_id: str) -> np.ndarray | None:
+        pos = self._positions.get(patient_id)
+        return None if pos is None else self._matrix[pos].copy()
+
+    def add(self, patient_ids: Sequence[str], embeddings) -> None:
+        """Inserts or replaces embeddings for the given patients."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            new_rows = []
+            for pid, emb in zip(patient_ids, embeddings):
+                pos = self._positions.get(pid)
+                if pos is None:
+                    pos = len(self.ids) + len(new_rows)
+                    self._positions[pid] = pos
+                    new_rows.append(pid)
+                self._ensure_capacity(pos + 1)
+                self._matrix[pos] = emb
+                self._on_row_updated(pos)
+            self.ids.extend(new_rows)
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._matrix.shape[0]:
+            return
+        # Grow geometrically so incremental indexing stays amortised O(1) per row
+        capacity = max(rows, 2 * self._matrix.shape[0], 1024)
+        grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        grown[:self._matrix.shape[0]] = self._matrix
+        self._matrix = grown
+
+    def _on_row_updated(self, pos: int) -> None:
+        pass
+
+    def build(self) -> None:
+        """Hook for indexes that need training after a bulk load."""
+        pass
+
+    def search(self, query, k: int = 5) -> List[Tuple[str, float]]:
+        """Returns up to k (patient_id, similarity) pairs, most similar first."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if not self.ids:
+                return []
+            scores = self.matrix @ query
+            top = _top_k(scores, k)
+            return [(self.ids[i], float(scores[i])) for i in top]
+
+    def search_batch(self, queries, k: int = 5, chunk_size: int = 256) -> List[List[Tuple[str, float]]]:
+        """
+        search() for many queries: one matrix product per chunk of queries
+        (chunk_size bounds the chunk x index score matrix held in memory).
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        results = []
+        with self._lock:
+            if not self.ids:
+                return [[] for _ in range(len(queries))]
+            matrix = self.matrix
+            for start in range(0, len(queries), chunk_size):
+                scores = queries[start:start + chunk_size] @ matrix.T
+                for row in scores:
+                    results.append([(self.ids[i], float(row[i])) for i in _top_k(row, k)])
+        return results
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file index: rows are bucketed by their nearest k-means centroid and
+    a query only scores the rows in its `nprobe` closest buckets.
+    New rows are assigned to the existing centroids; the quantizer is retrained
+    once the index has doubled since the last training.
+    """
+    name = "ivf"
+
+    def __init__(self, dim: int = EMBEDDING_DIM, nlist: int | None = None, nprobe: int = 16,
+                 train_sample: int = 20000, iterations: int = 10, seed: int = 0):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self.iterations = iterations
+        self.seed = seed
+        self._centroids: np.ndarray | None = None
+        self._assignment = np.zeros(0, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+        self._trained_size = 0
+
+    def _on_row_updated(self, pos: int) -> None:
+        if self._centroids is None:
+            return
+        if pos >= len(self._assignment):
+            grown = np.full(max(pos + 1, 2 * len(self._assignment)), -1, dtype=np.int32)
+            grown[:len(self._assignment)] = self._assignment
+            self._assignment = grown
+        old = self._assignment[pos]
+        new = int(np.argmax(self._centroids @ self._matrix[pos]))
+        if old == new:
+            return
+        if old >= 0:
+            self._lists[old].remove(pos)
+            self._list_arrays.pop(int(old), None)
+        self._lists[new].append(pos)
+        self._list_arrays.pop(new, None)
+        self._assignment[pos] = new
+
+    def add(self, patient_ids: Sequence[str], embeddings) -> None:
+        super().add(patient_ids, embeddings)
+        if self._centroids is None or len(self) >= 2 * self._trained_size:
+            self.build()
+
+    def build(self) -> None:
+        """Trains the coarse quantizer (spherical k-means) and rebuilds the inverted lists."""
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                return
+            data = self.matrix
+            nlist = self.nlist or max(1, int(np.sqrt(n)))
+            nlist = min(nlist, n)
+
+            rng = np.random.default_rng(self.seed)
+            sample = data if n <= self.train_sample else data[rng.choice(n, self.train_sample, replace=False)]
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(self.iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = sample[labels == c]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        centroids[c] = centroid / norm if norm > 0 else centroid
+
+            assignment = np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+            self._centroids = centroids
+            self._assignment = assignment
+            self._lists = [[] for _ in range(nlist)]
+            for pos, c in enumerate(assignment):
+                self._lists[c].append(pos)
+            self._list_arrays = {}
+            self._trained_size = n
+
+    def _list_array(self, c: int) -> np.ndarray:
+        arr = self._list_arrays.get(c)
+        if arr is None:
+            arr = np.array(self._lists[c], dtype=np.int64)
+            self._list_arrays[c] = arr
+        return arr
+
+    def search(self, query, k: int = 5) -> List[Tuple[str, float]]:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._centroids is None:
+                return super().search(query, k)
+            probe = _top_k(self._centroids @ query, min(self.nprobe, len(self._centroids)))
+            candidates = np.concatenate([self._list_array(int(c)) for c in probe])
+            if len(candidates) == 0:
+                return []
+            scores = self._matrix[candidates] @ query
+            top = _top_k(scores, k)
+            return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    def search_batch(self, queries, k: int = 5, chunk_size: int = 256) -> List[List[Tuple[str, float]]]:
+        # Each query probes its own lists, so there is no shared product to batch
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        return [self.search(query, k) for query in queries]
+
+
+INDEX_TYPES = {
+    ExactIndex.name: ExactIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def create_index(kind: str = "exact", **kwargs) -> ExactIndex:
+    """Instantiates an index by name (see INDEX_TYPES)."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}'. Available: {', '.join(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](**kwargs)
@@ -0,0 +1,139 @@
+# bench_store.py - Local store of evaluation/benchmark runs for tracking quality and speed across commits
+#
+# `python benchmark.py record` appends one run: backtest quality metrics (evaluate.summarize_results)
+# and latency percentiles of the API hot paths, tagged with the git commit. `python benchmark.py
+# compare` diffs two runs and flags metrics that got worse by more than a relative threshold.
+# The store is a plain SQLite file next to the scripts (not an IRIS table): one row per run and
+# one row per (run, metric).
+
+import json
+import os
+import sqlite3
+import subprocess
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Next to this module rather than in the working directory (ignored by git)
+BENCH_STORE_PATH = os.getenv(
+    "BENCH_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results.sqlite")
+)
+
+# Metric name prefixes checked for regressions; others (e.g. "count.") are informational
+CHECKED_PREFIXES = ("quality.", "throughput.", "latency.")
+# Metrics where smaller is better; all other checked metrics should not drop
+LOWER_IS_BETTER = {"quality.temporal_mae", "quality.temporal_rmse", "quality.time_span_diff"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    git_commit TEXT,
+    label TEXT,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+"""
+
+
+def current_git_commit() -> Optional[str]:
+    """Short hash of HEAD (with a + suffix for uncommitted changes), or None outside a checkout."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+
+def lower_is_better(name: str) -> bool:
+    return name.startswith("latency.") or name in LOWER_IS_BETTER
+
+
+class ResultStore:
+    """Runs and their metrics in a SQLite file (created on first use)."""
+
+    def __init__(self, path: str = BENCH_STORE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def save_run(self, metrics: Dict[str, float], label: Optional[str] = None, config: Optional[dict] = None,
+                 git_commit: Optional[str] = None) -> int:
+        """Stores one run (None metric values are skipped) and returns its run_id."""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (created_at, git_commit, label, config) VALUES (?, ?, ?, ?)",
+                (datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 git_commit if git_commit is not None else current_git_commit(),
+                 label, json.dumps(config or {}, sort_keys=True)),
+            )
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO metrics (run_id, name, value) VALUES (?, ?, ?)",
+                [(run_id, name, float(value)) for name, value in sorted(metrics.items()) if value is not None],
+            )
+        return run_id
+
+    def list_runs(self, limit: Optional[int] = 20, label: Optional[str] = None) -> List[dict]:
+        """Most recent runs first (all of them with limit=None)."""
+        query = "SELECT run_id, created_at, git_commit, label, config FROM runs"
+        params = []
+        if label is not None:
+            query += " WHERE label = ?"
+            params.append(label)
+        query += " ORDER BY run_id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            {"run_id": r[0], "created_at": r[1], "git_commit": r[2], "label": r[3], "config": json.loads(r[4] or "{}")}
+            for r in rows
+        ]
+
+    def get_metrics(self, run_id: int) -> Dict[str, float]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT name, value FROM metrics WHERE run_id = ? ORDER BY name", (run_id,)).fetchall()
+        if not rows:
+            raise KeyError(f"No metrics stored for run {run_id}")
+        return dict(rows)
+
+
+def compare_runs(baseline: Dict[str, float], candidate: Dict[str, float], threshold: float = 0.02,
+                 latency_threshold: float = 0.10) -> List[dict]:
+    """
+    Per metric present in both runs: values, relative change and whether it is a regression,
+    i.e. moved in the bad direction by more than `threshold` (quality, throughput) or
+    `latency_threshold` (latency, which is noisier) relative to the baseline.
+    """
+    rows = []
+    for name in sorted(baseline.keys() & candidate.keys()):
+        base, value = baseline[name], candidate[name]
+        if base:
+            change = (value - base) / abs(base)
+        else:
+            change = 0.0 if value == base else float("inf") * (1 if value > base else -1)
+        checked = name.startswith(CHECKED_PREFIXES)
+        limit = latency_threshold if name.startswith("latency.") else threshold
+        worse = change if lower_is_better(name) else -change
+        rows.append({
+            "name": name,
+            "baseline": base,
+            "candidate": value,
+            "change": change,
+            "regression": checked and worse > limit,
+        })
+    return rows
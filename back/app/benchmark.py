@@ -0,0 +1,623 @@
+# benchmark.py - Latency/quality benchmarks for the API hot paths
+
+import json
+import time
+import threading
+from random import sample
+from sqlalchemy import text
+from database import get_db_connection, get_batch_patient_timelines
+from processor import linearize_for_query, linearize_patient_history, linearize_patient_history_reference
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def print_latency(name: str, seconds: list):
+    ms = [s * 1000 for s in seconds]
+    print(f"{name:<28} p50={percentile(ms, 50):8.2f}ms  p95={percentile(ms, 95):8.2f}ms  "
+          f"p99={percentile(ms, 99):8.2f}ms  mean={sum(ms) / len(ms) if ms else 0:8.2f}ms")
+
+
+def bench_ann(queries: int = 100, top_k: int = 10, index_type: str = "ivf"):
+    """
+    Recall-vs-latency of the in-process ANN index against the exact SQL path.
+    Recall@k = share of the exact SQL top-k that the index also returns.
+    """
+    from vector_engine import vector_engine
+
+    print(f"\n{'='*70}")
+    print(f"ANN BENCHMARK ({index_type}, top_k={top_k}, queries={queries})")
+    print(f"{'='*70}")
+
+    t0 = time.time()
+    index = vector_engine.load_index(index_type)
+    print(f"Index load: {len(index)} embeddings in {time.time()-t0:.2f}s")
+
+    with get_db_connection() as conn:
+        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."PatientEmbeddings"')).fetchall()
+        patient_ids = [row[0] for row in result]
+
+    query_ids = sample(patient_ids, min(queries, len(patient_ids)))
+    events_map = get_batch_patient_timelines(query_ids)
+    texts = [linearize_for_query(events_map[pid]) for pid in query_ids if events_map[pid]]
+    embeddings = vector_engine.model.encode(texts, show_progress_bar=False)
+
+    sql_times, ann_times, recalls = [], [], []
+    for emb in embeddings:
+        t0 = time.perf_counter()
+        exact = vector_engine.search_embedding(emb, top_k=top_k, search="sql")
+        sql_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        approx = vector_engine.search_embedding(emb, top_k=top_k, search="ann")
+        ann_times.append(time.perf_counter() - t0)
+
+        exact_ids = {pid for pid, _ in exact}
+        if exact_ids:
+            recalls.append(len(exact_ids & {pid for pid, _ in approx}) / len(exact_ids))
+
+    print_latency("SQL VECTOR_DOT_PRODUCT", sql_times)
+    print_latency(f"In-process {index_type}", ann_times)
+    if recalls:
+        print(f"Recall@{top_k}: {sum(recalls) / len(recalls):.1%} over {len(recalls)} queries")
+    print(f"{'='*70}")
+
+
+def bench_encoder(concurrency: int = 16, requests_per_client: int = 10, max_batch_size: int = 32,
+                  max_wait_ms: float = 5.0):
+    """
+    Query-encoding throughput under concurrent load: direct model.encode per request
+    (serialised, as on the event loop) vs the micro-batching encoder.
+    """
+    from vector_engine import vector_engine
+    from encoder import BatchingEncoder
+
+    print(f"\n{'='*70}")
+    print(f"ENCODER BENCHMARK (clients={concurrency}, requests/client={requests_per_client})")
+    print(f"{'='*70}")
+
+    # Distinct texts per request so neither path benefits from caching
+    texts = [f"[PROFILE] Events:{i} Span:{i % 400}d Hosp:{i % 7} Intensity:HIGH [TRAJECTORY] STABLE"
+             for i in range(concurrency * requests_per_client)]
+
+    lock = threading.Lock()
+
+    def direct(text_rep):
+        with lock:
+            return vector_engine.model.encode(text_rep)
+
+    batching = BatchingEncoder(vector_engine.model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    for name, encode in (("Direct (serialised)", direct), ("Micro-batched", batching.encode)):
+        latencies = []
+
+        def client(offset):
+            for j in range(requests_per_client):
+                t0 = time.perf_counter()
+                encode(texts[offset * requests_per_client + j])
+                latencies.append(time.perf_counter() - t0)
+
+        threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+        print_latency(name, latencies)
+        print(f"{'':<28} throughput={len(texts) / wall:8.1f} req/s")
+
+    print(f"Batching stats: {batching.stats()}")
+    print(f"{'='*70}")
+
+
+def bench_linearize(patients: int = 1000, batch_size: int = 200):
+    """
+    Profile linearisation: per-event reference implementation vs the columnar engine
+    (single-patient and batch API), checking that all three produce identical strings.
+    """
+    from linearizer import linearize_batch
+
+    print(f"\n{'='*70}")
+    print(f"LINEARIZE BENCHMARK (patients={patients})")
+    print(f"{'='*70}")
+
+    with get_db_connection() as conn:
+        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."Pacienti"')).fetchall()
+        patient_ids = [row[0] for row in result]
+    sampled = sample(patient_ids, min(patients, len(patient_ids)))
+    timelines = {}
+    for i in range(0, len(sampled), batch_size):
+        timelines.update(get_batch_patient_timelines(sampled[i:i + batch_size]))
+    events = sum(len(t) for t in timelines.values())
+    print(f"Loaded {len(timelines)} timelines, {events} events")
+
+    pids = list(timelines)
+    histories = [timelines[pid] for pid in pids]
+    # Warm the per-label feature tables so the engine timings show the steady state
+    linearize_batch(histories, pids)
+
+    results = {}
+    for name, run in (
+        ("Reference (per event)", lambda: [linearize_patient_history_reference(h, p) for h, p in zip(histories, pids)]),
+        ("Engine (per patient)", lambda: [linearize_patient_history(h, p) for h, p in zip(histories, pids)]),
+        ("Engine (batch)", lambda: linearize_batch(histories, pids)),
+    ):
+        t0 = time.perf_counter()
+        results[name] = run()
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<28} {elapsed:8.3f}s  {len(pids) / elapsed:10.1f} patients/s  "
+              f"{events / elapsed:12.0f} events/s")
+
+    reference = results["Reference (per event)"]
+    for name, profiles in results.items():
+        mismatches = sum(a != b for a, b in zip(reference, profiles))
+        if mismatches:
+            print(f"WARNING: {name} differs from the reference for {mismatches} patients")
+    print(f"{'='*70}")
+
+
+def bench_pool(configs: list, levels: list, duration: float = 5.0):
+    """
+    Load test of the timeline loader against different connection pool settings.
+    For each (pool_size, max_overflow) config, ramps the number of concurrent clients and
+    reports throughput, latency and pool wait; the saturation point is the first level
+    where throughput grows by less than 10% (or checkouts start timing out).
+    """
+    import database
+
+    with get_db_connection() as conn:
+        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."Pacienti"')).fetchall()
+        patient_ids = [row[0] for row in result]
+
+    original_engine, original_metrics = database.engine, database.pool_metrics
+    print(f"\n{'='*70}")
+    print(f"CONNECTION POOL LOAD TEST (levels={levels}, {duration:.0f}s per level)")
+    print(f"{'='*70}")
+    try:
+        for pool_size, max_overflow in configs:
+            database.engine = database.create_db_engine(pool_size=pool_size, max_overflow=max_overflow)
+            database.pool_metrics = database.PoolMetrics()
+            database.pool_metrics.attach(database.engine)
+            print(f"\npool_size={pool_size} max_overflow={max_overflow}")
+            print(f"{'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+                  f"{'wait avg':>9} {'wait max':>9} {'timeouts':>9}")
+
+            previous_throughput, saturation = 0.0, None
+            for clients in levels:
+                database.pool_metrics.reset()
+                latencies, errors = [], []
+                deadline = time.perf_counter() + duration
+
+                def client():
+                    while time.perf_counter() < deadline:
+                        t0 = time.perf_counter()
+                        try:
+                            # Bypass the event cache so every request hits IRIS
+                            get_batch_patient_timelines(sample(patient_ids, 1), use_cache=False)
+                        except Exception as e:
+                            errors.append(e)
+                            continue
+                        latencies.append(time.perf_counter() - t0)
+
+                threads = [threading.Thread(target=client) for _ in range(clients)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+                stats = database.get_pool_stats()
+                throughput = len(latencies) / duration
+                ms = [s * 1000 for s in latencies]
+                print(f"{clients:>8} {throughput:>9.1f} {percentile(ms, 50):>9.1f} {percentile(ms, 99):>9.1f} "
+                      f"{stats['avg_wait_ms'] or 0:>9.1f} {stats['max_wait_ms']:>9.1f} {stats['timeouts']:>9}")
+                if saturation is None and previous_throughput and (
+                        throughput < previous_throughput * 1.1 or stats["timeouts"]):
+                    saturation = clients
+                previous_throughput = max(previous_throughput, throughput)
+            print(f"Saturation point: {saturation if saturation else f'not reached (>{levels[-1]} clients)'}")
+            database.engine.dispose()
+    finally:
+        database.engine, database.pool_metrics = original_engine, original_metrics
+    print(f"{'='*70}")
+
+
+def bench_timeline_query(patients: int = 500, group_size: int = 20, repeats: int = 3):
+    """
+    Timeline loading, three queries per batch ("split") vs one UNION ALL ordered on the server
+    ("union"), for the lightest and the heaviest patients of a sample: per-patient fetches
+    (the /history path) and one batch fetch per group (the indexer path).
+    """
+    from database import _fetch_patient_timelines, get_patient_event_counts
+
+    print(f"\n{'='*70}")
+    print(f"TIMELINE QUERY BENCHMARK (sample={patients}, group={group_size}, repeats={repeats})")
+    print(f"{'='*70}")
+
+    with get_db_connection() as conn:
+        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."Pacienti"')).fetchall()
+        patient_ids = [row[0] for row in result]
+    counts = get_patient_event_counts(sample(patient_ids, min(patients, len(patient_ids))))
+    ranked = sorted((pid for pid, n in counts.items() if n), key=counts.get)
+    groups = {"light": ranked[:group_size], "heavy": ranked[-group_size:]}
+
+    for group, pids in groups.items():
+        events = [counts[pid] for pid in pids]
+        print(f"\n{group}: {len(pids)} patients, {min(events)}-{max(events)} events each")
+        results = {}
+        for mode in ("split", "union"):
+            single = []
+            for _ in range(repeats):
+                for pid in pids:
+                    t0 = time.perf_counter()
+                    _fetch_patient_timelines([pid], query_mode=mode)
+                    single.append(time.perf_counter() - t0)
+            print_latency(f"{mode} (per patient)", single)
+
+            batch = []
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                results[mode] = _fetch_patient_timelines(pids, query_mode=mode)
+                batch.append(time.perf_counter() - t0)
+            print_latency(f"{mode} (batch)", batch)
+
+        # Same-day events may come back in a different order, so compare per-day contents
+        def day_contents(timeline):
+            return sorted(map(repr, timeline.to_api_dicts()))
+        mismatches = sum(day_contents(results["split"][pid]) != day_contents(results["union"][pid]) for pid in pids)
+        if mismatches:
+            print(f"WARNING: union timelines differ from split for {mismatches} patients")
+    print(f"{'='*70}")
+
+
+def bench_serialize(queries: int = 20, top_k: int = 5, repeats: int = 5):
+    """
+    Response encoding on real payloads: /futures trajectories and /history timelines of sampled
+    patients, stdlib JSONResponse vs FastJSONResponse, plus gzip size and time.
+    """
+    import gzip
+    from fastapi.responses import JSONResponse
+    from responses import FastJSONResponse, GZIP_LEVEL, orjson
+    from vector_engine import vector_engine
+
+    print(f"\n{'='*70}")
+    print(f"SERIALIZATION BENCHMARK (queries={queries}, top_k={top_k}, encoder={'orjson' if orjson else 'stdlib'})")
+    print(f"{'='*70}")
+
+    with get_db_connection() as conn:
+        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."PatientEmbeddings"')).fetchall()
+        patient_ids = [row[0] for row in result]
+    query_ids = sample(patient_ids, min(queries, len(patient_ids)))
+    timelines = get_batch_patient_timelines(query_ids)
+
+    payloads = {"futures": [], "history": []}
+    for pid in query_ids:
+        history = timelines[pid]
+        if not history:
+            continue
+        snapshot = max(1, len(history) // 2)
+        payloads["futures"].append(vector_engine.get_future_trajectories(
+            history, snapshot_events=snapshot, top_k=top_k, patient_id=pid))
+        payloads["history"].append({"received_health_services": history.to_api_dicts()})
+
+    stdlib, fast = JSONResponse(content=None), FastJSONResponse(content=None)
+    for kind, documents in payloads.items():
+        if not documents:
+            continue
+        bodies = [stdlib.render(doc) for doc in documents]
+        sizes = sorted(len(body) for body in bodies)
+        print(f"\n{kind}: {len(documents)} responses, size p50={percentile(sizes, 50) / 1024:.0f}KiB "
+              f"max={sizes[-1] / 1024:.0f}KiB")
+        mismatches = sum(json.loads(stdlib.render(doc)) != json.loads(fast.render(doc)) for doc in documents)
+        if mismatches:
+            print(f"WARNING: {mismatches} {kind} documents encode differently")
+
+        for name, response in (("JSONResponse (stdlib)", stdlib), ("FastJSONResponse", fast)):
+            times = []
+            for _ in range(repeats):
+                for doc in documents:
+                    t0 = time.perf_counter()
+                    response.render(doc)
+                    times.append(time.perf_counter() - t0)
+            print_latency(name, times)
+
+        times, compressed = [], 0
+        for body in bodies:
+            t0 = time.perf_counter()
+            compressed += len(gzip.compress(body, compresslevel=GZIP_LEVEL))
+            times.append(time.perf_counter() - t0)
+        print_latency(f"gzip level {GZIP_LEVEL}", times)
+        print(f"{'':<28} compressed to {compressed / sum(sizes):.1%} of {sum(sizes) / 1024:.0f}KiB")
+    print(f"{'='*70}")
+
+
+def bench_lcs(lengths: list, pairs: int = 5, vocabulary: int = 500, reference_max: int = 2000, seed: int = 0):
+    """
+    LCS kernels on synthetic label-id sequences (the predicted sequence is the actual one with
+    ~30% of events replaced or dropped): full-table reference vs two-row DP vs bit-parallel vs
+    the size-based dispatch evaluate.py uses, checking equal lengths. The quadratic kernels are
+    skipped above reference_max events.
+    """
+    import numpy as np
+    from sequence_metrics import lcs_length, lcs_length_full_table, lcs_length_two_row, lcs_length_bit_parallel
+
+    print(f"\n{'='*70}")
+    print(f"LCS BENCHMARK (pairs={pairs} per length, vocabulary={vocabulary})")
+    print(f"{'='*70}")
+
+    rng = np.random.default_rng(seed)
+    # Zipf-like label frequencies, as in real histories a few labels dominate
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    for length in lengths:
+        cases = []
+        for _ in range(pairs):
+            actual = rng.choice(vocabulary, size=length, p=weights)
+            predicted = actual.copy()
+            replaced = rng.random(length) < 0.15
+            predicted[replaced] = rng.choice(vocabulary, size=int(replaced.sum()), p=weights)
+            predicted = predicted[rng.random(length) >= 0.15]
+            cases.append((actual, predicted))
+
+        print(f"\n{length} events:")
+        results = {}
+        for name, kernel in (
+            ("Full table (reference)", lcs_length_full_table),
+            ("Two-row DP", lcs_length_two_row),
+            ("Bit-parallel", lcs_length_bit_parallel),
+            ("lcs_length (dispatch)", lcs_length),
+        ):
+            if kernel in (lcs_length_full_table, lcs_length_two_row) and length > reference_max:
+                print(f"{name:<28} skipped (> {reference_max} events)")
+                continue
+            times = []
+            for actual, predicted in cases:
+                a, b = actual.tolist(), predicted.tolist()
+                t0 = time.perf_counter()
+                results.setdefault(name, []).append(kernel(a, b))
+                times.append(time.perf_counter() - t0)
+            print_latency(name, times)
+
+        expected = results["lcs_length (dispatch)"]
+        for name, lengths_found in results.items():
+            if lengths_found != expected:
+                print(f"WARNING: {name} lengths differ from lcs_length")
+    print(f"{'='*70}")
+
+
+def _latency_metrics(name: str, seconds: list) -> dict:
+    ms = [x * 1000 for x in seconds]
+    return {f"latency.{name}.p{pct}": percentile(ms, pct) for pct in (50, 95, 99)}
+
+
+def bench_record(sample_size: int = 100, seed: int = 0, snapshot_pct: float = 0.5, batch: bool = False,
+                 queries: int = 50, top_k: int = 10, search: str = "ann", index_type: str = None,
+                 label: str = None, store_path: str = None) -> int:
+    """
+    Records one run in the bench_store: quality of a seeded backtest (as evaluate.py, sequential
+    or batch) and p50/p95/p99 latencies (ms) of get_patient_events (uncached),
+    linearize_patient_history, encoding a query profile and the similarity search.
+    Returns the run_id.
+    """
+    from bench_store import ResultStore, BENCH_STORE_PATH
+    from database import event_cache, get_patient_events
+    from evaluate import (
+        evaluate_patients, evaluate_patients_batch, get_indexed_patient_ids, sample_patients, summarize_results,
+    )
+    from vector_engine import vector_engine, ANN_INDEX_TYPE
+
+    index_type = index_type or ANN_INDEX_TYPE
+    config = {"sample_size": sample_size, "seed": seed, "snapshot_pct": snapshot_pct, "batch": batch,
+              "queries": queries, "top_k": top_k, "search": search, "index": index_type}
+    print(f"\n{'='*70}")
+    print(f"RECORD RUN {config}")
+    print(f"{'='*70}")
+
+    patient_ids = get_indexed_patient_ids()
+    test_patients = sample_patients(patient_ids, sample_size, seed)
+
+    # Quality first: before an ANN index is loaded, sequential evaluation searches like run_evaluation
+    t0 = time.perf_counter()
+    if batch:
+        results, skipped, no_predictions = evaluate_patients_batch(test_patients, snapshot_pct)
+    else:
+        results, skipped, no_predictions = evaluate_patients(test_patients, snapshot_pct)
+    elapsed = time.perf_counter() - t0
+    metrics = {f"quality.{name}": value for name, value in summarize_results(results).items()}
+    metrics.update({
+        "count.evaluated": len(results),
+        "count.skipped": skipped,
+        "count.no_predictions": no_predictions,
+        "throughput.patients_per_s": len(test_patients) / elapsed if elapsed else None,
+    })
+    print(f"Backtest: {len(results)} evaluated in {elapsed:.1f}s")
+
+    if search == "ann":
+        vector_engine.load_index(index_type)
+    query_ids = test_patients[:queries]
+    vector_engine.model.encode("warm-up", show_progress_bar=False)
+    fetch_times, linearize_times, encode_times, search_times = [], [], [], []
+    for pid in query_ids:
+        event_cache.invalidate([pid])
+        t0 = time.perf_counter()
+        events = get_patient_events(pid)
+        fetch_times.append(time.perf_counter() - t0)
+        if not events:
+            continue
+
+        t0 = time.perf_counter()
+        linearize_patient_history(events, pid)
+        linearize_times.append(time.perf_counter() - t0)
+
+        profile = linearize_for_query(events)
+        t0 = time.perf_counter()
+        embedding = vector_engine.model.encode(profile, show_progress_bar=False)
+        encode_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        vector_engine.search_embedding(embedding, top_k=top_k, search=search)
+        search_times.append(time.perf_counter() - t0)
+
+    for name, times in (("get_patient_events", fetch_times), ("linearize_patient_history", linearize_times),
+                        ("encode", encode_times), ("similarity_search", search_times)):
+        if times:
+            print_latency(name, times)
+            metrics.update(_latency_metrics(name, times))
+
+    store = ResultStore(store_path or BENCH_STORE_PATH)
+    run_id = store.save_run(metrics, label=label, config=config)
+    print(f"\nRun {run_id} stored in {store.path} ({len([v for v in metrics.values() if v is not None])} metrics)")
+    print(f"{'='*70}")
+    return run_id
+
+
+def bench_compare(baseline: int = None, candidate: int = None, threshold: float = 0.02,
+                  latency_threshold: float = 0.10, label: str = None, store_path: str = None) -> bool:
+    """
+    Compares two stored runs (default: the two most recent, optionally of one label) and
+    prints every shared metric, marking regressions. Returns True if there are none.
+    """
+    from bench_store import ResultStore, BENCH_STORE_PATH, compare_runs
+
+    store = ResultStore(store_path or BENCH_STORE_PATH)
+    runs = {run["run_id"]: run for run in store.list_runs(limit=None)}
+    if baseline is None or candidate is None:
+        ids = [run["run_id"] for run in store.list_runs(limit=None, label=label)]
+        if candidate is None and ids:
+            candidate = ids[0]
+        if baseline is None:
+            baseline = next((run_id for run_id in ids if candidate is not None and run_id < candidate), None)
+        if baseline is None or candidate is None:
+            raise SystemExit("Need two stored runs to compare (see: benchmark.py record)")
+
+    print(f"\n{'='*86}")
+    for role, run_id in (("Baseline", baseline), ("Candidate", candidate)):
+        run = runs.get(run_id, {})
+        print(f"{role + ':':<11} run {run_id} ({run.get('created_at')}, commit {run.get('git_commit')}, "
+              f"label {run.get('label')})")
+    print(f"Thresholds: {threshold:.0%} quality/throughput, {latency_threshold:.0%} latency")
+    print(f"{'-'*86}")
+    rows = compare_runs(store.get_metrics(baseline), store.get_metrics(candidate), threshold, latency_threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['name']:<44} {row['baseline']:>10.4g} {row['candidate']:>10.4g} {row['change']:>+8.1%}  {flag}")
+    regressions = [row["name"] for row in rows if row["regression"]]
+    print(f"{'-'*86}")
+    print(f"{len(regressions)} regression(s)" + (f": {', '.join(regressions)}" if regressions else ""))
+    print(f"{'='*86}")
+    return not regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark API hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ann_parser = subparsers.add_parser("ann", help="ANN index recall/latency vs exact SQL search")
+    ann_parser.add_argument("--queries", type=int, default=100, help="Number of query patients")
+    ann_parser.add_argument("--top-k", type=int, default=10, help="Neighbours per query")
+    ann_parser.add_argument("--index", default="ivf", help="Index type (exact, ivf)")
+
+    encoder_parser = subparsers.add_parser("encoder", help="Concurrent query encoding, direct vs micro-batched")
+    encoder_parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    encoder_parser.add_argument("--requests", type=int, default=10, help="Requests per client")
+    encoder_parser.add_argument("--max-batch-size", type=int, default=32, help="Encoder max batch size")
+    encoder_parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Encoder batching window")
+
+    linearize_parser = subparsers.add_parser("linearize", help="Reference vs columnar profile linearisation")
+    linearize_parser.add_argument("--patients", type=int, default=1000, help="Patients to linearise")
+
+    pool_parser = subparsers.add_parser("pool", help="Connection pool saturation, SQLAlchemy defaults vs tuned")
+    pool_parser.add_argument("--levels", default="1,2,4,8,16,32,64", help="Comma-separated client counts")
+    pool_parser.add_argument("--duration", type=float, default=5.0, help="Seconds per level")
+    pool_parser.add_argument("--tuned-size", type=int, default=None, help="Tuned pool_size (default: DB_POOL_SIZE)")
+    pool_parser.add_argument("--tuned-overflow", type=int, default=None,
+                             help="Tuned max_overflow (default: DB_MAX_OVERFLOW)")
+
+    timeline_parser = subparsers.add_parser("timeline", help="Three-query vs UNION ALL timeline loading")
+    timeline_parser.add_argument("--patients", type=int, default=500,
+                                 help="Patients sampled to pick light/heavy groups")
+    timeline_parser.add_argument("--group-size", type=int, default=20, help="Patients per light/heavy group")
+    timeline_parser.add_argument("--repeats", type=int, default=3, help="Repetitions per measurement")
+
+    serialize_parser = subparsers.add_parser("serialize", help="stdlib vs fast JSON encoding of API payloads")
+    serialize_parser.add_argument("--queries", type=int, default=20, help="Query patients")
+    serialize_parser.add_argument("--top-k", type=int, default=5, help="Trajectories per query")
+
+    lcs_parser = subparsers.add_parser("lcs", help="Full-table vs two-row vs bit-parallel LCS")
+    lcs_parser.add_argument("--lengths", default="100,1000,10000", help="Comma-separated sequence lengths")
+    lcs_parser.add_argument("--pairs", type=int, default=5, help="Sequence pairs per length")
+    lcs_parser.add_argument("--reference-max", type=int, default=2000,
+                            help="Longest sequences timed with the quadratic kernels")
+
+    record_parser = subparsers.add_parser("record", help="Store a run: backtest quality + hot path latencies")
+    record_parser.add_argument("--sample", type=int, default=100, help="Patients in the backtest")
+    record_parser.add_argument("--seed", type=int, default=0, help="Seed of the patient sample")
+    record_parser.add_argument("--snapshot", type=float, default=0.5, help="Snapshot percentage (0.0-1.0)")
+    record_parser.add_argument("--batch", action="store_true", help="Batch backtest (see evaluate.py --batch)")
+    record_parser.add_argument("--queries", type=int, default=50, help="Patients timed on the hot paths")
+    record_parser.add_argument("--top-k", type=int, default=10, help="Neighbours per similarity search")
+    record_parser.add_argument("--search", default="ann", choices=["ann", "sql"], help="Similarity search backend")
+    record_parser.add_argument("--index", default=None, help="ANN index type (default: ANN_INDEX_TYPE)")
+    record_parser.add_argument("--label", default=None, help="Free-form run label, e.g. a branch name")
+    record_parser.add_argument("--store", default=None, help="SQLite file (default: BENCH_STORE_PATH)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two stored runs and flag regressions")
+    compare_parser.add_argument("--baseline", type=int, default=None, help="Baseline run_id (default: previous run)")
+    compare_parser.add_argument("--candidate", type=int, default=None, help="Candidate run_id (default: latest run)")
+    compare_parser.add_argument("--threshold", type=float, default=0.02,
+                                help="Relative drop flagged for quality/throughput metrics")
+    compare_parser.add_argument("--latency-threshold", type=float, default=0.10,
+                                help="Relative increase flagged for latency percentiles")
+    compare_parser.add_argument("--label", default=None, help="Default runs are the latest two with this label")
+    compare_parser.add_argument("--store", default=None, help="SQLite file (default: BENCH_STORE_PATH)")
+
+    runs_parser = subparsers.add_parser("runs", help="List stored runs")
+    runs_parser.add_argument("--limit", type=int, default=20, help="Most recent runs to list")
+    runs_parser.add_argument("--label", default=None, help="Only runs with this label")
+    runs_parser.add_argument("--store", default=None, help="SQLite file (default: BENCH_STORE_PATH)")
+
+    args = parser.parse_args()
+
+    if args.command == "ann":
+        bench_ann(queries=args.queries, top_k=args.top_k, index_type=args.index)
+    elif args.command == "encoder":
+        bench_encoder(concurrency=args.concurrency, requests_per_client=args.requests,
+                      max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    elif args.command == "linearize":
+        bench_linearize(patients=args.patients)
+    elif args.command == "pool":
+        import database
+        tuned = (args.tuned_size if args.tuned_size is not None else database.DB_POOL_SIZE,
+                 args.tuned_overflow if args.tuned_overflow is not None else database.DB_MAX_OVERFLOW)
+        # (5, 10) are the SQLAlchemy QueuePool defaults the engine used before
+        bench_pool(configs=[(5, 10), tuned], levels=[int(x) for x in args.levels.split(",")],
+                   duration=args.duration)
+    elif args.command == "timeline":
+        bench_timeline_query(patients=args.patients, group_size=args.group_size, repeats=args.repeats)
+    elif args.command == "serialize":
+        bench_serialize(queries=args.queries, top_k=args.top_k)
+    elif args.command == "lcs":
+        bench_lcs(lengths=[int(x) for x in args.lengths.split(",")], pairs=args.pairs,
+                  reference_max=args.reference_max)
+    elif args.command == "record":
+        bench_record(sample_size=args.sample, seed=args.seed, snapshot_pct=args.snapshot, batch=args.batch,
+                     queries=args.queries, top_k=args.top_k, search=args.search, index_type=args.index,
+                     label=args.label, store_path=args.store)
+    elif args.command == "compare":
+        ok = bench_compare(baseline=args.baseline, candidate=args.candidate, threshold=args.threshold,
+                           latency_threshold=args.latency_threshold, label=args.label, store_path=args.store)
+        # Non-zero exit status for CI
+        raise SystemExit(0 if ok else 1)
+    elif args.command == "runs":
+        from bench_store import ResultStore, BENCH_STORE_PATH
+        for run in ResultStore(args.store or BENCH_STORE_PATH).list_runs(limit=args.limit, label=args.label):
+            print(f"{run['run_id']:>5}  {run['created_at']}  {run['git_commit'] or '-':<10} "
+                  f"{run['label'] or '-':<16} {json.dumps(run['config'], sort_keys=True)}")
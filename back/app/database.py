@@ -1,11 +1,16 @@
 import os
-from sqlalchemy import create_engine, text
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from pydantic import BaseModel
 
 from dto.response.HealthService import HealthServiceType
 from dto.response.SuggestResult import SuggestResult, SuggestResultType
+from timeline import PatientTimeline, TimelineBuilder
+from cache import LRUCache
 
 # --- Configuration ---
 # Update these with your actual IRIS credentials and port
@@ -18,16 +23,130 @@ IRIS_NAMESPACE = "FHIRSERVER"
 
 CONNECTION_STRING = f"iris://{IRIS_USER}:{IRIS_PASSWORD}@{IRIS_HOST}:{IRIS_PORT}/{IRIS_NAMESPACE}"
 
-engine = create_engine(CONNECTION_STRING)
+# Connection pool (QueuePool). /futures fans out to several queries per request, so the
+# SQLAlchemy defaults (5 + 10 overflow) saturate quickly under concurrent traffic
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+
+def create_db_engine(pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW,
+                     pool_timeout: float = DB_POOL_TIMEOUT, pool_recycle: int = DB_POOL_RECYCLE,
+                     pool_pre_ping: bool = DB_POOL_PRE_PING):
+    return create_engine(
+        CONNECTION_STRING,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+    )
+
+
+class PoolMetrics:
+    """Checkout wait times, timeouts and connection churn of the engine's pool, for /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.wait_seconds = 0.0
+            self.max_wait_seconds = 0.0
+
+    def record_checkout(self, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def attach(self, db_engine):
+        """Counts new DBAPI connections and invalidations (e.g. failed pre-pings) of an engine."""
+        def on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                self.connects += 1
+
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            with self._lock:
+                self.invalidations += 1
+
+        event.listen(db_engine, "connect", on_connect)
+        event.listen(db_engine, "invalidate", on_invalidate)
+
+    def stats(self, db_engine) -> Dict[str, Any]:
+        pool = db_engine.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size(),
+                "max_overflow": getattr(pool, "_max_overflow", None),
+                "timeout_seconds": pool.timeout(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # QueuePool.overflow() is negative while fewer than pool_size connections exist
+                "overflow": max(0, pool.overflow()),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 2) if self.checkouts else None,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+
+
+engine = create_db_engine()
+pool_metrics = PoolMetrics()
+pool_metrics.attach(engine)
+
+# Per-patient timeline cache (memory-accounted LRU + TTL)
+EVENT_CACHE_MAX_BYTES = int(os.getenv("EVENT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+EVENT_CACHE_TTL_SECONDS = float(os.getenv("EVENT_CACHE_TTL_SECONDS", 3600))
+_TIMELINE_ENTRY_OVERHEAD = 1024  # Approximate bytes for array headers + key/bookkeeping
+
+event_cache = LRUCache(
+    "patient_events",
+    max_bytes=EVENT_CACHE_MAX_BYTES,
+    ttl=EVENT_CACHE_TTL_SECONDS,
+    sizeof=lambda timeline: timeline.nbytes + _TIMELINE_ENTRY_OVERHEAD,
+)
+
+# Source of the daily care aggregates:
+# - "daily": pre-materialised DATA.PeceDaily (built by load_data.sql, medication names resolved)
+# - "raw": GROUP BY over DATA.Pece at request time, medication names resolved in Python
+PECE_SOURCE = os.getenv("PECE_SOURCE", "daily")
+
+# How timelines are read from IRIS:
+# - "union": one UNION ALL statement ordered by (patient, day) on the server, no Python sort
+# - "split": one query per table, merged and stable-sorted per patient in Python
+TIMELINE_QUERY_MODE = os.getenv("TIMELINE_QUERY_MODE", "union")
 
 # Cache for medication dictionary
 _medication_dict: Optional[Dict[str, str]] = None
 
+# One name per medication code; empty codes and names are ignored, duplicates resolve to the
+# greatest name. Shared by the raw path (_care_label) and the DATA.PeceDaily INSERT in
+# load_data.sql / pece_daily.py, so both PECE_SOURCEs produce the same labels.
+MEDICATION_DICTIONARY_SQL = """
+    SELECT KOD, MAX(NAZEV) AS NAZEV FROM DATA.CiselnikHVLP
+    WHERE KOD IS NOT NULL AND KOD <> '' AND NAZEV IS NOT NULL AND NAZEV <> ''
+    GROUP BY KOD
+"""
+
 def _get_medication_dictionary() -> Dict[str, str]:
     """
     Loads the medication dictionary (CiselnikHVLP) into memory.
     Cached to avoid repeated database queries.
-    Returns a dict mapping KOD -> NAZEV.
+    Returns a dict mapping KOD -> NAZEV (MEDICATION_DICTIONARY_SQL: the greatest name per code).
     """
     global _medication_dict
     if _medication_dict is not None:
@@ -36,8 +155,7 @@ def _get_medication_dictionary() -> Dict[str, str]:
     _medication_dict = {}
     try:
         with get_db_connection() as conn:
-            query = text('SELECT KOD, NAZEV FROM "DATA"."CiselnikHVLP"')
-            result = conn.execute(query).fetchall()
+            result = conn.execute(text(MEDICATION_DICTIONARY_SQL)).fetchall()
             for row in result:
                 kod = row[0]
                 nazev = row[1]
@@ -82,230 +200,373 @@ class PatientEvent(BaseModel):
     label: str
     detail: Dict[str, Any] = {}
 
+    @property
+    def department(self) -> Optional[str]:
+        return self.detail.get("department")
+
 def get_db_connection():
-    return engine.connect()
+    # Time spent here is the wait for a free pooled connection (plus connect/pre-ping)
+    t0 = time.perf_counter()
+    try:
+        conn = engine.connect()
+    except PoolTimeoutError:
+        pool_metrics.record_timeout()
+        raise
+    pool_metrics.record_checkout(time.perf_counter() - t0)
+    return conn
+
+def get_pool_stats() -> Dict[str, Any]:
+    return pool_metrics.stats(engine)
+
+def timeline_to_events(timeline: PatientTimeline) -> List[PatientEvent]:
+    """Materialises a columnar timeline into PatientEvent objects (API boundary only)."""
+    return [
+        PatientEvent(date=event.date, type=event.type, label=event.label, detail=event.detail)
+        for event in timeline
+    ]
 
 def get_patient_events(patient_id: str) -> List[PatientEvent]:
     """
     Fetches patient history from DATA.Hospitalizace, DATA.Lazne, and DATA.Pece.
     Normalizes them into a list of PatientEvent objects.
     """
-    events = []
-    
-    with get_db_connection() as conn:
-        # 1. Fetch Hospitalizations
-        # Assuming DNY_OD_ZAKLADNI_HOSP is the day offset
-        query_hosp = text('SELECT DNY_OD_ZAKLADNI_HOSP, DRG_NAZEV, UKONCENI FROM "DATA"."Hospitalizace" WHERE ID_PACIENT = :pid')
-        result_hosp = conn.execute(query_hosp, {"pid": patient_id}).fetchall()
-        for row in result_hosp:
-            events.append(PatientEvent(
-                date=row[0] if row[0] is not None else 0,
-                type=HealthServiceType.HOSPITALIZATION,
-                label=row[1] or "Unknown Hospitalization",
-                detail={"termination": row[2]}
-            ))
-
-        # 2. Fetch Spa (Lazne)
-        query_lazne = text('SELECT DNY_OD_ZAKLADNI_HOSP, NAZEV_INDIKACNI_SKUPINA, TYP_LECBY FROM "DATA"."Lazne" WHERE ID_PACIENT = :pid')
-        result_lazne = conn.execute(query_lazne, {"pid": patient_id}).fetchall()
-        for row in result_lazne:
-            events.append(PatientEvent(
-                date=row[0] if row[0] is not None else 0,
-                type=HealthServiceType.SPA,
-                label=row[1] or "Unknown Spa Treatment",
-                detail={"type": row[2]}
-            ))
-
-        # 3. Fetch Care (Pece)
-        # Aggregated by day, type (TYPVYK), KOD, and label to reduce volume
-        # KOD is included for medication lookup in Python (faster than SQL JOIN)
-        query_pece = text("""
-            SELECT 
-                DNY_OD_ZAKLADNI_PECE, 
-                COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care') AS label,
-                COUNT(*), 
-                MIN(ODB_NAZEV),
-                TYPVYK,
-                KOD
-            FROM "DATA"."Pece" 
-            WHERE ID_PACIENT = :pid
-            GROUP BY DNY_OD_ZAKLADNI_PECE, COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care'), TYPVYK, KOD
-        """)
-        result_pece = conn.execute(query_pece, {"pid": patient_id}).fetchall()
-        
-        # Load medication dictionary once
-        med_dict = _get_medication_dictionary()
-        
-        for row in result_pece:
-            count = row[2]
-            label = row[1]
-            typvyk = row[4]
-            kod = row[5]
-            
-            # For medications, try to resolve code to descriptive name
-            if typvyk in ("1", "2") and kod:
-                resolved_name = med_dict.get(str(kod))
-                if resolved_name:
-                    label = resolved_name
-                elif not label or label == "Unknown Care":
-                    label = "Unknown Medication"
-            
-            if count > 1:
-                label = f"{label} ({count} items)"
-                
-            events.append(PatientEvent(
-                date=row[0] if row[0] is not None else 0,
-                type=_map_typvyk_to_health_service_type(typvyk),
-                label=label,
-                detail={"department": row[3], "count": count}
-            ))
-
-    # Sort events by date
-    events.sort(key=lambda x: x.date)
-    return events
+    return timeline_to_events(get_patient_timeline(patient_id))
 
 def get_batch_patient_events(patient_ids: List[str]) -> Dict[str, List[PatientEvent]]:
     """
     Fetches patient history for a batch of patients.
     Returns a dictionary mapping patient_id -> list of PatientEvent objects.
     """
-    events_map: Dict[str, List[PatientEvent]] = {pid: [] for pid in patient_ids}
-    
-    if not patient_ids:
-        return events_map
-        
-    # SQLAlchemy handling of list IN clause might vary, usually assumes tuple or list expansion
-    # For IRIS/SQLAlchemy, we might need to be careful with large lists in IN clause.
-    # But for batch size 500 it should be fine.
-    
+    timelines = get_batch_patient_timelines(patient_ids)
+    return {pid: timeline_to_events(timeline) for pid, timeline in timelines.items()}
+
+def get_patient_timeline(patient_id: str, use_cache: bool = True) -> PatientTimeline:
+    """Fetches one patient's history as a columnar PatientTimeline."""
+    return get_batch_patient_timelines([patient_id], use_cache=use_cache)[patient_id]
+
+def get_batch_patient_timelines(patient_ids: List[str], use_cache: bool = True) -> Dict[str, PatientTimeline]:
+    """
+    Fetches patient history for a batch of patients as columnar timelines.
+    Cached timelines are served from event_cache; only the missing patients hit IRIS.
+    Returns a dictionary mapping patient_id -> PatientTimeline sorted by date.
+    """
+    if not use_cache:
+        return _fetch_patient_timelines(patient_ids)
+
+    timelines = event_cache.get_many(patient_ids)
+    missing = [pid for pid in dict.fromkeys(patient_ids) if pid not in timelines]
+    if missing:
+        fetched = _fetch_patient_timelines(missing)
+        for pid, timeline in fetched.items():
+            event_cache.put(pid, timeline)
+        timelines.update(fetched)
+    return {pid: timelines[pid] for pid in patient_ids}
+
+def invalidate_patient_cache(patient_ids: Optional[List[str]] = None) -> int:
+    """
+    Drops cached timelines for the given patients, or everything when None.
+    Call after a data reload (load_data.sql) so stale histories are not served;
+    a full invalidation also reloads the medication dictionary.
+    """
+    global _medication_dict
+    if patient_ids is None:
+        _medication_dict = None
+    return event_cache.invalidate(patient_ids)
+
+def _in_clause(patient_ids: List[str]) -> tuple[str, Dict[str, str]]:
+    """
+    Creates dynamic placeholders for an IN clause, e.g. ":p0, :p1, :p2",
+    together with the matching bind parameters.
+    """
+    bindparams = {f"p{i}": pid for i, pid in enumerate(patient_ids)}
+    placeholders = ", ".join([f":p{i}" for i in range(len(patient_ids))])
+    return placeholders, bindparams
+
+def get_patient_event_counts(patient_ids: List[str]) -> Dict[str, int]:
+    """
+    Returns the number of timeline events per patient (hospitalisations + spa stays +
+    daily Pece aggregates) without fetching the events themselves.
+    Cached timelines are counted locally; the rest are counted in one query.
+    """
+    counts = {pid: len(timeline) for pid, timeline in event_cache.get_many(patient_ids).items()}
+    missing = [pid for pid in dict.fromkeys(patient_ids) if pid not in counts]
+    if not missing:
+        return counts
+
+    placeholders, bindparams = _in_clause(missing)
+    query = text(f"""
+        SELECT c.ID_PACIENT, SUM(c.N)
+        FROM (
+            SELECT ID_PACIENT, COUNT(*) AS N
+            FROM "DATA"."Hospitalizace" WHERE ID_PACIENT IN ({placeholders})
+            GROUP BY ID_PACIENT
+            UNION ALL
+            SELECT ID_PACIENT, COUNT(*) AS N
+            FROM "DATA"."Lazne" WHERE ID_PACIENT IN ({placeholders})
+            GROUP BY ID_PACIENT
+            UNION ALL
+            {_pece_count_query(placeholders)}
+        ) c
+        GROUP BY c.ID_PACIENT
+    """)
     with get_db_connection() as conn:
-        # Create dynamic placeholders for IN clause
-        # e.g. :p0, :p1, :p2 ...
-        bindparams = {f"p{i}": pid for i, pid in enumerate(patient_ids)}
-        placeholders = ", ".join([f":p{i}" for i in range(len(patient_ids))])
-        
-        # 1. Fetch Hospitalizations
-        query_hosp = text(f'SELECT ID_PACIENT, DNY_OD_ZAKLADNI_HOSP, DRG_NAZEV, UKONCENI FROM "DATA"."Hospitalizace" WHERE ID_PACIENT IN ({placeholders})')
-        result_hosp = conn.execute(query_hosp, bindparams).fetchall()
-        for row in result_hosp:
-            pid = row[0]
-            if pid in events_map:
-                events_map[pid].append(PatientEvent(
-                    date=row[1] if row[1] is not None else 0,
-                    type=HealthServiceType.HOSPITALIZATION,
-                    label=row[2] or "Unknown Hospitalization",
-                    detail={"termination": row[3]}
-                ))
-
-        # 2. Fetch Spa (Lazne)
-        query_lazne = text(f'SELECT ID_PACIENT, DNY_OD_ZAKLADNI_HOSP, NAZEV_INDIKACNI_SKUPINA, TYP_LECBY FROM "DATA"."Lazne" WHERE ID_PACIENT IN ({placeholders})')
-        result_lazne = conn.execute(query_lazne, bindparams).fetchall()
-        for row in result_lazne:
-            pid = row[0]
-            if pid in events_map:
-                events_map[pid].append(PatientEvent(
-                    date=row[1] if row[1] is not None else 0,
-                    type=HealthServiceType.SPA,
-                    label=row[2] or "Unknown Spa Treatment",
-                    detail={"type": row[3]}
-                ))
-
-        # 3. Fetch Care (Pece)
-        # Aggregated by day, type (TYPVYK), KOD, and label to reduce volume
-        # KOD is included for medication lookup in Python (faster than SQL JOIN)
-        query_pece = text(f"""
+        for row in conn.execute(query, bindparams).fetchall():
+            counts[row[0]] = int(row[1])
+    for pid in missing:
+        counts.setdefault(pid, 0)
+    return counts
+
+def _pece_count_query(placeholders: str, pece_source: Optional[str] = None) -> str:
+    """Per-patient count of daily care aggregates (one UNION ALL branch of get_patient_event_counts)."""
+    if (pece_source or PECE_SOURCE) == "daily":
+        return f"""SELECT ID_PACIENT, COUNT(*) AS N
+            FROM "DATA"."PeceDaily" WHERE ID_PACIENT IN ({placeholders})
+            GROUP BY ID_PACIENT"""
+    return f"""SELECT g.ID_PACIENT, COUNT(*) AS N
+            FROM (
+                SELECT DISTINCT ID_PACIENT, DNY_OD_ZAKLADNI_PECE,
+                    COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care') AS label, TYPVYK, KOD
+                FROM "DATA"."Pece" WHERE ID_PACIENT IN ({placeholders})
+            ) g
+            GROUP BY g.ID_PACIENT"""
+
+def _pece_select(placeholders: str, pece_source: Optional[str] = None, from_day: Optional[int] = None,
+                 to_day: Optional[int] = None) -> str:
+    """
+    Daily care aggregates (ID_PACIENT, day, label, count, department, TYPVYK, KOD).
+    From DATA.PeceDaily the label is already medication-resolved; from raw DATA.Pece
+    the rows are aggregated by day, type (TYPVYK), KOD and label at request time.
+    from_day / to_day restrict the days (see _day_window).
+    """
+    window = _day_window("DNY_OD_ZAKLADNI_PECE", from_day, to_day)
+    if (pece_source or PECE_SOURCE) == "daily":
+        return f"""
+            SELECT ID_PACIENT, DNY_OD_ZAKLADNI_PECE AS EVENT_DAY, LABEL AS EVENT_LABEL,
+                POCET AS EVENT_COUNT, ODB_NAZEV AS EVENT_DEPT, TYPVYK, KOD
+            FROM "DATA"."PeceDaily"
+            WHERE ID_PACIENT IN ({placeholders}){window}
+        """
+    # KOD is included for medication lookup in Python (faster than SQL JOIN)
+    return f"""
             SELECT 
                 ID_PACIENT, 
-                DNY_OD_ZAKLADNI_PECE, 
-                COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care') AS label,
-                COUNT(*), 
-                MIN(ODB_NAZEV),
+                DNY_OD_ZAKLADNI_PECE AS EVENT_DAY, 
+                COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care') AS EVENT_LABEL,
+                COUNT(*) AS EVENT_COUNT, 
+                MIN(ODB_NAZEV) AS EVENT_DEPT,
                 TYPVYK,
                 KOD
             FROM "DATA"."Pece" 
-            WHERE ID_PACIENT IN ({placeholders})
+            WHERE ID_PACIENT IN ({placeholders}){window}
             GROUP BY ID_PACIENT, DNY_OD_ZAKLADNI_PECE, COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care'), TYPVYK, KOD
-        """)
-        result_pece = conn.execute(query_pece, bindparams).fetchall()
-        
-        # Load medication dictionary once
-        med_dict = _get_medication_dictionary()
-        
-        for row in result_pece:
-            pid = row[0]
-            if pid in events_map:
-                count = row[3]
-                label = row[2]
-                typvyk = row[5]
-                kod = row[6]
-                
-                # For medications, try to resolve code to descriptive name
-                if typvyk in ("1", "2") and kod:
-                    resolved_name = med_dict.get(str(kod))
-                    if resolved_name:
-                        label = resolved_name
-                    elif not label or label == "Unknown Care":
-                        label = "Unknown Medication"
-                
-                if count > 1:
-                    label = f"{label} ({count} items)"
-                    
-                events_map[pid].append(PatientEvent(
-                    date=row[1] if row[1] is not None else 0,
-                    type=_map_typvyk_to_health_service_type(typvyk),
-                    label=label,
-                    detail={"department": row[4], "count": count}
-                ))
-
-    # Sort events for each patient
-    for pid in events_map:
-        events_map[pid].sort(key=lambda x: x.date)
-        
-    return events_map
+        """
 
-def search_suggestions(query_text: str) -> List[SuggestResult]:
+def _day_window(column: str, from_day: Optional[int], to_day: Optional[int]) -> str:
     """
-    Searches for patients, DRGs, and service providers/departments matching the query.
+    AND-conditions limiting a day column to [from_day, to_day] (bound as :from_day / :to_day).
+    Missing days count as day 0, as in TimelineBuilder.
     """
-    results: List[SuggestResult] = []
+    conditions = ""
+    if from_day is not None:
+        conditions += f" AND COALESCE({column}, 0) >= :from_day"
+    if to_day is not None:
+        conditions += f" AND COALESCE({column}, 0) <= :to_day"
+    return conditions
 
-    # Return empty list for very short queries to avoid massive scans
-    if not query_text or len(query_text) < 2:
-        return results
+def _window_params(from_day: Optional[int], to_day: Optional[int]) -> Dict[str, int]:
+    params = {}
+    if from_day is not None:
+        params["from_day"] = from_day
+    if to_day is not None:
+        params["to_day"] = to_day
+    return params
 
-    search_pattern = f"%{query_text}%"
+def _pece_query(placeholders: str, pece_source: Optional[str] = None):
+    return text(_pece_select(placeholders, pece_source))
+
+def _timeline_queries(patient_ids: List[str], pece_source: Optional[str] = None):
+    """
+    The three per-table timeline queries (Hospitalizace, Lazne, daily care aggregates) for a
+    batch of patients, with their shared bind parameters. Independent of each other, so they
+    can run on one connection back-to-back or on separate connections concurrently.
+    """
+    # SQLAlchemy handling of list IN clause might vary, usually assumes tuple or list expansion
+    # For IRIS/SQLAlchemy, we might need to be careful with large lists in IN clause.
+    # But for batch size 500 it should be fine.
+    placeholders, bindparams = _in_clause(patient_ids)
+    query_hosp = text(f'SELECT ID_PACIENT, DNY_OD_ZAKLADNI_HOSP, DRG_NAZEV, UKONCENI FROM "DATA"."Hospitalizace" WHERE ID_PACIENT IN ({placeholders})')
+    query_lazne = text(f'SELECT ID_PACIENT, DNY_OD_ZAKLADNI_HOSP, NAZEV_INDIKACNI_SKUPINA, TYP_LECBY FROM "DATA"."Lazne" WHERE ID_PACIENT IN ({placeholders})')
+    # Aggregated by day, type (TYPVYK), KOD, and label to reduce volume
+    query_pece = _pece_query(placeholders, pece_source)
+    return (query_hosp, query_lazne, query_pece), bindparams
+
+def fetch_rows(query, bindparams: Dict[str, Any]) -> list:
+    """Runs one query on its own pooled connection."""
+    with get_db_connection() as conn:
+        return conn.execute(query, bindparams).fetchall()
+
+def _build_patient_timelines(patient_ids: List[str], hosp_rows, lazne_rows, pece_rows,
+                             pece_source: Optional[str] = None) -> Dict[str, PatientTimeline]:
+    """Turns the rows of the three timeline queries into one columnar timeline per patient."""
+    pece_source = pece_source or PECE_SOURCE
+    builders: Dict[str, TimelineBuilder] = {pid: TimelineBuilder() for pid in patient_ids}
+
+    # 1. Hospitalizations
+    for row in hosp_rows:
+        builder = builders.get(row[0])
+        if builder is not None:
+            builder.append(
+                row[1], HealthServiceType.HOSPITALIZATION,
+                row[2] or "Unknown Hospitalization",
+                extra=row[3]
+            )
+
+    # 2. Spa (Lazne)
+    for row in lazne_rows:
+        builder = builders.get(row[0])
+        if builder is not None:
+            builder.append(
+                row[1], HealthServiceType.SPA,
+                row[2] or "Unknown Spa Treatment",
+                extra=row[3]
+            )
+
+    # 3. Care (Pece)
+    # Load medication dictionary once (PeceDaily labels are resolved already)
+    med_dict = _get_medication_dictionary() if pece_source == "raw" else None
+
+    for row in pece_rows:
+        builder = builders.get(row[0])
+        if builder is None:
+            continue
+        count = row[3]
+        typvyk = row[5]
+        builder.append(
+            row[1], _map_typvyk_to_health_service_type(typvyk), _care_label(row[2], count, typvyk, row[6], med_dict),
+            department=row[4], count=count
+        )
+
+    # Sort events for each patient (stable, by date)
+    return {pid: builder.build() for pid, builder in builders.items()}
+
+def _care_label(label: str, count: int, typvyk: Optional[str], kod, med_dict: Optional[Dict[str, str]]) -> str:
+    """Display label of a daily care aggregate."""
+    # For medications, try to resolve code to descriptive name
+    if med_dict is not None and typvyk in ("1", "2") and kod:
+        resolved_name = med_dict.get(str(kod))
+        if resolved_name:
+            label = resolved_name
+        elif not label or label == "Unknown Care":
+            label = "Unknown Medication"
+
+    if count > 1:
+        label = f"{label} ({count} items)"
+    return label
+
+def _fetch_patient_timelines(patient_ids: List[str], pece_source: Optional[str] = None,
+                             query_mode: Optional[str] = None) -> Dict[str, PatientTimeline]:
+    """
+    Fetches patient history for a batch of patients from DATA.Hospitalizace,
+    DATA.Lazne and the daily care aggregates (see PECE_SOURCE) as columnar
+    timelines (no per-row pydantic objects).
+    In "split" mode the three queries run back-to-back on one connection
+    (database_async.py runs them concurrently); "union" mode is one round-trip,
+    see iter_patient_timelines.
+    """
+    pece_source = pece_source or PECE_SOURCE
+    if not patient_ids:
+        return {}
+    if (query_mode or TIMELINE_QUERY_MODE) == "union":
+        return dict(iter_patient_timelines(patient_ids, pece_source))
 
+    queries, bindparams = _timeline_queries(patient_ids, pece_source)
     with get_db_connection() as conn:
-        # 1. Search Patients (ID)
+        hosp_rows, lazne_rows, pece_rows = (conn.execute(query, bindparams).fetchall() for query in queries)
+    return _build_patient_timelines(patient_ids, hosp_rows, lazne_rows, pece_rows, pece_source)
+
+def get_patient_timeline_window(patient_id: str, from_day: Optional[int] = None,
+                                to_day: Optional[int] = None) -> PatientTimeline:
+    """
+    Events of one patient with from_day <= date <= to_day (either bound optional).
+    Sliced from the cached full timeline when there is one; otherwise the window is
+    applied in SQL and the partial timeline is not cached.
+    """
+    if from_day is None and to_day is None:
+        return get_patient_timeline(patient_id)
+    cached = event_cache.get_many([patient_id]).get(patient_id)
+    if cached is not None:
+        return cached.window(from_day, to_day)
+    return dict(iter_patient_timelines([patient_id], from_day=from_day, to_day=to_day))[patient_id]
+
+def _page_start_day(patient_id: str, limit: int, from_day: Optional[int], to_day: Optional[int]) -> Optional[int]:
+    """
+    Day of the limit-th newest event in the window, or None when the window holds fewer
+    than limit events (one TOP query over the day columns only).
+    """
+    placeholders, bindparams = _in_clause([patient_id])
+    bindparams.update(_window_params(from_day, to_day))
+    query = text(f"""
+        SELECT TOP {int(limit)} COALESCE(u.EVENT_DAY, 0) AS EVENT_DAY
+        FROM ({_timeline_union_branches(placeholders, PECE_SOURCE, from_day, to_day)}) u
+        ORDER BY 1 DESC
+    """)
+    days = [row[0] for row in fetch_rows(query, bindparams)]
+    return int(days[-1]) if len(days) >= limit else None
+
+def get_patient_history_page(patient_id: str, limit: int, before_day: Optional[int] = None,
+                             from_day: Optional[int] = None,
+                             to_day: Optional[int] = None) -> Tuple[PatientTimeline, Optional[int]]:
+    """
+    One page of a patient's history, walking from the newest events towards older ones.
+    A page holds the newest `limit` events before `before_day` (within the optional window)
+    plus the rest of the oldest day on it, so pages always end on a day boundary and never
+    depend on the order of same-day events. Returns the page (in date order) and the
+    before_day of the next page, or None when this page reached the start of the window.
+    """
+    if before_day is not None:
+        to_day = before_day - 1 if to_day is None else min(to_day, before_day - 1)
+    if from_day is not None and to_day is not None and from_day > to_day:
+        return PatientTimeline.empty(), None
+
+    cached = event_cache.get_many([patient_id]).get(patient_id)
+    if cached is not None:
+        # Slice the timeline already in hand; a second cache probe could miss after an eviction
+        window = cached.window(from_day, to_day)
+        start_day = int(window.date[-limit]) if len(window) >= limit else None
+    else:
+        start_day = _page_start_day(patient_id, limit, from_day, to_day)
+        window = None
+
+    if start_day is None:
+        page = window if window is not None else get_patient_timeline_window(patient_id, from_day, to_day)
+        return page, None
+    if window is not None:
+        return window.window(from_day=start_day), start_day
+    return get_patient_timeline_window(patient_id, start_day, to_day), start_day
+
+def _suggestion_queries() -> List[tuple]:
+    """(result type, LIKE query) per suggestion type, in result order."""
+    pece_table = "DATA.PeceDaily" if PECE_SOURCE == "daily" else "DATA.Pece"
+    return [
         # Using string matching on ID (casting to VARCHAR for LIKE operator)
-        try:
-            sql_patient = text("SELECT TOP 5 ID_PACIENT FROM DATA.Pacienti WHERE CAST(ID_PACIENT AS VARCHAR) LIKE :q")
-            rows = conn.execute(sql_patient, {"q": search_pattern}).fetchall()
-            for r in rows:
-                results.append(SuggestResult(label=str(r[0]), type=SuggestResultType.PATIENT))
-        except Exception as e:
-            print(f"Error searching patients: {e}")
-
-        # 2. Search DRGs (DATA.Hospitalizace.DRG_NAZEV)
-        try:
-            sql_drg = text("SELECT TOP 5 DISTINCT DRG_NAZEV FROM DATA.Hospitalizace WHERE DRG_NAZEV LIKE :q")
-            rows = conn.execute(sql_drg, {"q": search_pattern}).fetchall()
-            for r in rows:
-                if r[0]:
-                    results.append(SuggestResult(label=r[0], type=SuggestResultType.DRG))
-        except Exception as e:
-            print(f"Error searching DRG: {e}")
-
-        # 3. Search Service Providers / Departments (DATA.Pece.ODB_NAZEV)
-        try:
-            sql_prov = text("SELECT TOP 5 DISTINCT ODB_NAZEV FROM DATA.Pece WHERE ODB_NAZEV LIKE :q")
-            rows = conn.execute(sql_prov, {"q": search_pattern}).fetchall()
-            for r in rows:
-                if r[0]:
-                    results.append(SuggestResult(label=r[0], type=SuggestResultType.SERVICE_PROVIDER))
-        except Exception as e:
-             print(f"Error searching providers: {e}")
+        (SuggestResultType.PATIENT, text("SELECT TOP 5 ID_PACIENT FROM DATA.Pacienti WHERE CAST(ID_PACIENT AS VARCHAR) LIKE :q")),
+        (SuggestResultType.DRG, text("SELECT TOP 5 DISTINCT DRG_NAZEV FROM DATA.Hospitalizace WHERE DRG_NAZEV LIKE :q")),
+        (SuggestResultType.SERVICE_PROVIDER, text(f"SELECT TOP 5 DISTINCT ODB_NAZEV FROM {pece_table} WHERE ODB_NAZEV LIKE :q")),
+    ]
+
+def search_suggestion_type(result_type: SuggestResultType, query, search_pattern: str, conn=None) -> List[SuggestResult]:
+    """Runs one suggestion query (on its own connection unless one is given); errors yield no results."""
+    try:
+        if conn is None:
+            rows = fetch_rows(query, {"q": search_pattern})
+        else:
+            rows = conn.execute(query, {"q": search_pattern}).fetchall()
+    except Exception as e:
+        print(f"Error searching {result_type.value}: {e}")
+        return []
+    return [SuggestResult(label=str(r[0]), type=result_type) for r in rows if r[0]]
 
+def merge_suggestions(results: List[SuggestResult]) -> List[SuggestResult]:
     # Deduplicate results just in case (by label+type)
     unique_results = []
     seen = set()
@@ -315,4 +576,128 @@ def search_suggestions(query_text: str) -> List[SuggestResult]:
             seen.add(key)
             unique_results.append(res)
 
-    return unique_results[:20]  # Return top 20 matches total
\ No newline at end of file
+    return unique_results[:20]  # Return top 20 matches total
+
+# Typed NULL for the columns a UNION ALL branch does not have
+_NULL_TEXT = "CAST(NULL AS VARCHAR(2000))"
+
+def _timeline_union_branches(placeholders: str, pece_source: Optional[str] = None,
+                             from_day: Optional[int] = None, to_day: Optional[int] = None) -> str:
+    """
+    The three UNION ALL branches (Hospitalizace, Lazne, care) with columns ID_PACIENT, EVENT_DAY,
+    SRC, EVENT_LABEL, EXTRA (UKONCENI / TYP_LECBY), EVENT_COUNT, EVENT_DEPT, TYPVYK, KOD;
+    the day window is applied inside every branch so it can use the (ID_PACIENT, day) indexes.
+    """
+    return f"""
+            SELECT ID_PACIENT, DNY_OD_ZAKLADNI_HOSP AS EVENT_DAY, 0 AS SRC, DRG_NAZEV AS EVENT_LABEL,
+                UKONCENI AS EXTRA, 1 AS EVENT_COUNT, {_NULL_TEXT} AS EVENT_DEPT, {_NULL_TEXT} AS TYPVYK,
+                {_NULL_TEXT} AS KOD
+            FROM "DATA"."Hospitalizace"
+            WHERE ID_PACIENT IN ({placeholders}){_day_window("DNY_OD_ZAKLADNI_HOSP", from_day, to_day)}
+            UNION ALL
+            SELECT ID_PACIENT, DNY_OD_ZAKLADNI_HOSP, 1, NAZEV_INDIKACNI_SKUPINA,
+                TYP_LECBY, 1, {_NULL_TEXT}, {_NULL_TEXT}, {_NULL_TEXT}
+            FROM "DATA"."Lazne"
+            WHERE ID_PACIENT IN ({placeholders}){_day_window("DNY_OD_ZAKLADNI_HOSP", from_day, to_day)}
+            UNION ALL
+            SELECT p.ID_PACIENT, p.EVENT_DAY, 2, p.EVENT_LABEL,
+                {_NULL_TEXT}, p.EVENT_COUNT, p.EVENT_DEPT, p.TYPVYK, p.KOD
+            FROM ({_pece_select(placeholders, pece_source, from_day, to_day)}) p
+    """
+
+def _timeline_union_query(patient_ids: List[str], pece_source: Optional[str] = None,
+                          from_day: Optional[int] = None, to_day: Optional[int] = None):
+    """
+    Hospitalisations, spa stays and daily care aggregates of a batch of patients as one
+    UNION ALL statement ordered by (ID_PACIENT, day, SRC). SRC discriminates the branch
+    (0 = Hospitalizace, 1 = Lazne, 2 = care) and also orders same-day events the way the
+    stable sort of the split path does; missing days sort as day 0, as in TimelineBuilder.
+    Columns: ID_PACIENT, day, SRC, label, extra (UKONCENI / TYP_LECBY), count, department, TYPVYK, KOD.
+    """
+    placeholders, bindparams = _in_clause(patient_ids)
+    bindparams.update(_window_params(from_day, to_day))
+    query = text(f"""
+        SELECT u.ID_PACIENT, COALESCE(u.EVENT_DAY, 0) AS EVENT_DAY, u.SRC, u.EVENT_LABEL, u.EXTRA,
+            u.EVENT_COUNT, u.EVENT_DEPT, u.TYPVYK, u.KOD
+        FROM ({_timeline_union_branches(placeholders, pece_source, from_day, to_day)}) u
+        ORDER BY 1, 2, 3
+    """)
+    return query, bindparams
+
+def _group_union_rows(rows, patient_ids: List[str], med_dict: Optional[Dict[str, str]]):
+    """
+    Turns (ID_PACIENT, day)-ordered union rows into (patient_id, timeline) pairs, emitting each
+    patient as soon as its row group ends; patients without rows follow as empty timelines.
+    Rows are already in date order, so the timelines are built without a sort.
+    """
+    wanted = set(patient_ids)
+    current, builder = None, None
+    for row in rows:
+        pid = row[0]
+        if pid != current:
+            if builder is not None:
+                yield current, builder.build(presorted=True)
+                wanted.discard(current)
+            current, builder = pid, (TimelineBuilder() if pid in wanted else None)
+        if builder is None:
+            continue
+        src = row[2]
+        if src == 0:
+            builder.append(row[1], HealthServiceType.HOSPITALIZATION, row[3] or "Unknown Hospitalization", extra=row[4])
+        elif src == 1:
+            builder.append(row[1], HealthServiceType.SPA, row[3] or "Unknown Spa Treatment", extra=row[4])
+        else:
+            count, typvyk = row[5], row[7]
+            builder.append(
+                row[1], _map_typvyk_to_health_service_type(typvyk), _care_label(row[3], count, typvyk, row[8], med_dict),
+                department=row[6], count=count
+            )
+    if builder is not None:
+        yield current, builder.build(presorted=True)
+        wanted.discard(current)
+    for pid in dict.fromkeys(patient_ids):
+        if pid in wanted:
+            yield pid, PatientTimeline.empty()
+
+def iter_patient_timelines(patient_ids: List[str], pece_source: Optional[str] = None,
+                           fetch_size: int = 5000, from_day: Optional[int] = None,
+                           to_day: Optional[int] = None) -> Iterator[Tuple[str, PatientTimeline]]:
+    """
+    Streams (patient_id, timeline) pairs for a batch of patients from the single UNION ALL
+    query, fetching rows in chunks of fetch_size, so callers can process one patient group
+    while the rest of the result is still being read. from_day / to_day limit the timelines
+    to a window of days.
+    """
+    pece_source = pece_source or PECE_SOURCE
+    if not patient_ids:
+        return
+    med_dict = _get_medication_dictionary() if pece_source == "raw" else None
+    query, bindparams = _timeline_union_query(patient_ids, pece_source, from_day, to_day)
+
+    def rows(result):
+        while True:
+            chunk = result.fetchmany(fetch_size)
+            if not chunk:
+                return
+            yield from chunk
+
+    with get_db_connection() as conn:
+        yield from _group_union_rows(rows(conn.execute(query, bindparams)), patient_ids, med_dict)
+
+def search_suggestions(query_text: str) -> List[SuggestResult]:
+    """
+    Searches for patients, DRGs, and service providers/departments matching the query.
+    """
+    # Return empty list for very short queries to avoid massive scans
+    if not query_text or len(query_text) < 2:
+        return []
+
+    search_pattern = f"%{query_text}%"
+
+    results: List[SuggestResult] = []
+    with get_db_connection() as conn:
+        # Patients (ID), DRGs (DATA.Hospitalizace.DRG_NAZEV), service providers / departments (ODB_NAZEV)
+        for result_type, query in _suggestion_queries():
+            results.extend(search_suggestion_type(result_type, query, search_pattern, conn))
+
+    return merge_suggestions(results)
@@ -0,0 +1,102 @@
+# database_async.py - Awaitable IRIS access for the FastAPI handlers
+#
+# sqlalchemy-iris ships no asyncio driver, so every query still runs on a blocking DBAPI
+# connection. Each query is submitted to the bounded io pool on its own pooled connection,
+# which lets a handler await it without holding an event-loop thread and (in the "split"
+# TIMELINE_QUERY_MODE) lets the three timeline tables (Hospitalizace, Lazne, Pece) be read
+# concurrently instead of back-to-back.
+# The sync functions in database.py remain the API for evaluate.py and the indexing scripts.
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from database import (
+    PECE_SOURCE, TIMELINE_QUERY_MODE, PatientEvent, event_cache, fetch_rows, timeline_to_events,
+    _fetch_patient_timelines, _timeline_queries, _build_patient_timelines, _get_medication_dictionary,
+    _suggestion_queries, search_suggestion_type, merge_suggestions,
+    get_patient_timeline_window, get_patient_history_page,
+)
+from dto.response.SuggestResult import SuggestResult
+from executors import io_pool, cpu_pool
+from timeline import PatientTimeline
+
+
+async def _fetch_patient_timelines_async(patient_ids: List[str]) -> Dict[str, PatientTimeline]:
+    """
+    Async counterpart of database._fetch_patient_timelines: in "union" mode the single
+    statement runs on the io pool, in "split" mode one concurrent query per table.
+    """
+    if not patient_ids:
+        return {}
+    pece_source = PECE_SOURCE
+    if TIMELINE_QUERY_MODE == "union":
+        return await io_pool.run(_fetch_patient_timelines, patient_ids, pece_source, "union")
+    queries, bindparams = _timeline_queries(patient_ids, pece_source)
+    fetches = [io_pool.run(fetch_rows, query, bindparams) for query in queries]
+    if pece_source == "raw":
+        # Load the medication dictionary alongside, so building the timelines never touches IRIS
+        fetches.append(io_pool.run(_get_medication_dictionary))
+    hosp_rows, lazne_rows, pece_rows = (await asyncio.gather(*fetches))[:3]
+    return await cpu_pool.run(_build_patient_timelines, patient_ids, hosp_rows, lazne_rows, pece_rows, pece_source)
+
+
+async def get_batch_patient_timelines_async(patient_ids: List[str], use_cache: bool = True) -> Dict[str, PatientTimeline]:
+    """Async database.get_batch_patient_timelines (same event_cache)."""
+    if not use_cache:
+        return await _fetch_patient_timelines_async(patient_ids)
+
+    timelines = event_cache.get_many(patient_ids)
+    missing = [pid for pid in dict.fromkeys(patient_ids) if pid not in timelines]
+    if missing:
+        fetched = await _fetch_patient_timelines_async(missing)
+        for pid, timeline in fetched.items():
+            event_cache.put(pid, timeline)
+        timelines.update(fetched)
+    return {pid: timelines[pid] for pid in patient_ids}
+
+
+async def get_patient_timeline_async(patient_id: str, use_cache: bool = True) -> PatientTimeline:
+    """Async database.get_patient_timeline."""
+    return (await get_batch_patient_timelines_async([patient_id], use_cache=use_cache))[patient_id]
+
+
+async def get_patient_events_async(patient_id: str) -> List[PatientEvent]:
+    """Async database.get_patient_events."""
+    return timeline_to_events(await get_patient_timeline_async(patient_id))
+
+
+async def get_batch_patient_events_async(patient_ids: List[str]) -> Dict[str, List[PatientEvent]]:
+    """Async database.get_batch_patient_events."""
+    timelines = await get_batch_patient_timelines_async(patient_ids)
+    return {pid: timeline_to_events(timeline) for pid, timeline in timelines.items()}
+
+
+async def get_patient_history_async(patient_id: str, limit: Optional[int] = None, before_day: Optional[int] = None,
+                                    from_day: Optional[int] = None,
+                                    to_day: Optional[int] = None) -> Tuple[PatientTimeline, Optional[int]]:
+    """
+    History for /history: the full timeline, a day window of it, or one page
+    (see database.get_patient_history_page). Returns the events and the next page's before_day.
+    """
+    if limit is None and before_day is None:
+        if from_day is None and to_day is None:
+            return await get_patient_timeline_async(patient_id), None
+        return await io_pool.run(get_patient_timeline_window, patient_id, from_day, to_day), None
+    if limit is None:
+        if to_day is None or to_day >= before_day:
+            to_day = before_day - 1
+        return await io_pool.run(get_patient_timeline_window, patient_id, from_day, to_day), None
+    return await io_pool.run(get_patient_history_page, patient_id, limit, before_day, from_day, to_day)
+
+
+async def search_suggestions_async(query_text: str) -> List[SuggestResult]:
+    """Async database.search_suggestions; the patient, DRG and provider LIKE queries run concurrently."""
+    if not query_text or len(query_text) < 2:
+        return []
+
+    search_pattern = f"%{query_text}%"
+    per_type = await asyncio.gather(*(
+        io_pool.run(search_suggestion_type, result_type, query, search_pattern)
+        for result_type, query in _suggestion_queries()
+    ))
+    return merge_suggestions([result for results in per_type for result in results])
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class HistoryBucket(BaseModel):
+    start_day: int  # First day of the bucket (inclusive, same reference as delta_days)
+    end_day: int  # Last day of the bucket (inclusive)
+    total: int  # Number of health services in the bucket
+    types: dict[str, int]  # HealthServiceType -> count
+    categories: dict[str, int]  # Department category (see processor.DEPT_CATEGORIES) -> count
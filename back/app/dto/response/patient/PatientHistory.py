@@ -1,6 +1,11 @@
+from typing import Optional
+
 from pydantic import BaseModel
 from dto.response.HealthService import HealthService
+from dto.response.patient.HistoryBucket import HistoryBucket
 
 
 class PatientHistory(BaseModel):
-    received_health_services: list[HealthService]
\ No newline at end of file
+    received_health_services: list[HealthService]
+    next_cursor: Optional[str] = None  # Cursor of the next (older) page when paginating
+    buckets: Optional[list[HistoryBucket]] = None  # Per-bucket counts when a resolution is requested
@@ -0,0 +1,140 @@
+# embedding_store.py - Bulk writes to DATA.PatientEmbeddings
+
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+INSERT_SQL = text(
+    "INSERT INTO DATA.PatientEmbeddings (ID_PACIENT, Embedding, EVENT_COUNT, MAX_DAY, PROFILE_HASH) "
+    "VALUES (:pid, TO_VECTOR(:embedding, DECIMAL), :event_count, :max_day, :profile_hash)"
+)
+
+_NO_FINGERPRINT = (None, None, None)
+
+# Staged mode: rows are written to a tab-separated file inside docker/data (mounted as /data
+# in the IRIS container), bulk-loaded into DATA.PatientEmbeddingsStaging and converted in one statement
+STAGING_HOST_DIR = os.getenv(
+    "EMBEDDING_STAGING_HOST_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docker", "data")
+)
+STAGING_SERVER_DIR = os.getenv("EMBEDDING_STAGING_SERVER_DIR", "/data")
+STAGING_FILE = "embeddings_staging.tsv"
+
+
+def serialize_embedding(embedding) -> str:
+    """
+    Compact TO_VECTOR input: comma-separated float32 values with 7 significant digits
+    (about half the size of str(list) of Python floats).
+    """
+    return ",".join(map("{:.7g}".format, np.asarray(embedding, dtype=np.float32).tolist()))
+
+
+class EmbeddingWriter:
+    """
+    Writes embeddings with executemany in chunks.
+    In upsert mode existing rows for the same patients are deleted first (same transaction),
+    so re-indexing changed patients does not need a table drop.
+    """
+
+    def __init__(self, conn, upsert: bool = False, chunk_size: int = 1000):
+        self.conn = conn
+        self.upsert = upsert
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.seconds = 0.0
+
+    def write(self, patient_ids: Sequence[str], embeddings, fingerprints: Optional[Sequence[tuple]] = None) -> int:
+        """
+        Writes and commits one batch. fingerprints holds (event_count, max_day, profile_hash)
+        per patient (see indexer.profile_fingerprint). Returns the number of rows written.
+        """
+        t0 = time.time()
+        if fingerprints is None:
+            fingerprints = [_NO_FINGERPRINT] * len(patient_ids)
+        for i in range(0, len(patient_ids), self.chunk_size):
+            chunk_ids = list(patient_ids[i:i + self.chunk_size])
+            if self.upsert:
+                self._delete(chunk_ids)
+            params = [
+                {
+                    "pid": pid,
+                    "embedding": serialize_embedding(emb),
+                    "event_count": fp[0],
+                    "max_day": fp[1],
+                    "profile_hash": fp[2],
+                }
+                for pid, emb, fp in zip(chunk_ids, embeddings[i:i + self.chunk_size], fingerprints[i:i + self.chunk_size])
+            ]
+            self.conn.execute(INSERT_SQL, params)
+        self.conn.commit()
+        self.rows += len(patient_ids)
+        self.seconds += time.time() - t0
+        return len(patient_ids)
+
+    def _delete(self, patient_ids: List[str]):
+        bindparams = {f"p{i}": pid for i, pid in enumerate(patient_ids)}
+        placeholders = ", ".join([f":p{i}" for i in range(len(patient_ids))])
+        self.conn.execute(
+            text(f"DELETE FROM DATA.PatientEmbeddings WHERE ID_PACIENT IN ({placeholders})"), bindparams
+        )
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "rows": self.rows,
+            "seconds": round(self.seconds, 2),
+            "rows_per_sec": round(self.rows / self.seconds, 1) if self.seconds > 0 else 0.0,
+        }
+
+
+class StagedEmbeddingWriter(EmbeddingWriter):
+    """
+    Writes each batch to a staging file and moves it into DATA.PatientEmbeddings with
+    LOAD DATA + INSERT ... SELECT TO_VECTOR (the same bulk path load_data.sql uses),
+    instead of binding one parameter set per row.
+    """
+
+    def __init__(self, conn, upsert: bool = False, host_dir: str = STAGING_HOST_DIR,
+                 server_dir: str = STAGING_SERVER_DIR):
+        super().__init__(conn, upsert=upsert)
+        self.host_path = os.path.join(host_dir, STAGING_FILE)
+        self.server_path = f"{server_dir.rstrip('/')}/{STAGING_FILE}"
+
+    def write(self, patient_ids: Sequence[str], embeddings, fingerprints: Optional[Sequence[tuple]] = None) -> int:
+        t0 = time.time()
+        if fingerprints is None:
+            fingerprints = [_NO_FINGERPRINT] * len(patient_ids)
+        with open(self.host_path, "w", encoding="utf-8") as f:
+            for pid, emb, fp in zip(patient_ids, embeddings, fingerprints):
+                fields = [pid, serialize_embedding(emb)] + ["" if v is None else str(v) for v in fp]
+                f.write("\t".join(fields) + "\n")
+
+        self.conn.execute(text("DELETE FROM DATA.PatientEmbeddingsStaging"))
+        self.conn.execute(text(
+            f"LOAD DATA FROM FILE '{self.server_path}' INTO DATA.PatientEmbeddingsStaging "
+            """USING {"from":{"file":{"header":"0", "columnseparator":"\\t", "charset":"UTF-8"}}}"""
+        ))
+        if self.upsert:
+            self.conn.execute(text(
+                "DELETE FROM DATA.PatientEmbeddings WHERE ID_PACIENT IN (SELECT ID_PACIENT FROM DATA.PatientEmbeddingsStaging)"
+            ))
+        self.conn.execute(text(
+            "INSERT INTO DATA.PatientEmbeddings (ID_PACIENT, Embedding, EVENT_COUNT, MAX_DAY, PROFILE_HASH) "
+            "SELECT ID_PACIENT, TO_VECTOR(EmbeddingText, DECIMAL), EVENT_COUNT, MAX_DAY, PROFILE_HASH "
+            "FROM DATA.PatientEmbeddingsStaging"
+        ))
+        self.conn.commit()
+        self.rows += len(patient_ids)
+        self.seconds += time.time() - t0
+        return len(patient_ids)
+
+
+def create_writer(conn, mode: str = "executemany", upsert: bool = False) -> EmbeddingWriter:
+    """Returns a writer for the given mode ("executemany" or "staged")."""
+    if mode == "staged":
+        return StagedEmbeddingWriter(conn, upsert=upsert)
+    if mode == "executemany":
+        return EmbeddingWriter(conn, upsert=upsert)
+    raise ValueError(f"Unknown embedding write mode '{mode}'. Available: executemany, staged")
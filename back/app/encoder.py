@@ -0,0 +1,96 @@
+# encoder.py - Micro-batching front-end for SentenceTransformer.encode
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingEncoder:
+    """
+    Collects query texts from concurrent callers for up to `max_wait_ms` (or until
+    `max_batch_size` texts are waiting) and encodes them in one model call on a
+    dedicated worker thread. Callers get their embedding back through a Future.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self.batches = 0
+        self.texts = 0
+        self.max_batch_seen = 0
+        self.encode_seconds = 0.0
+
+    def submit(self, text: str) -> Future:
+        """Queues a text for encoding; the Future resolves to its embedding."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(text).result()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="batching-encoder", daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Identical texts in one window (e.g. the same patient requested twice) are encoded once
+            unique: Dict[str, int] = {}
+            for text, _ in batch:
+                unique.setdefault(text, len(unique))
+            t0 = time.time()
+            try:
+                embeddings = self.model.encode(list(unique), show_progress_bar=False)
+            except Exception as e:
+                logger.exception(f"Batch encoding failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.encode_seconds += time.time() - t0
+            self.batches += 1
+            self.texts += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for text, future in batch:
+                future.set_result(embeddings[unique[text]])
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._queue.qsize(),
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else None,
+            "max_batch_seen": self.max_batch_seen,
+            "encode_seconds": round(self.encode_seconds, 2),
+        }
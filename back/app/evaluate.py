@@ -2,42 +2,37 @@
 
 import sys
 import math
-from random import sample
-from database import get_patient_events, get_db_connection
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from random import Random, sample
+import numpy as np
+from database import get_patient_timeline, get_batch_patient_timelines, get_db_connection
 from vector_engine import vector_engine
+from label_features import label_features, timeline_label_ids, BACKTEST_CRITICAL_KEYWORDS, BACKTEST_CRITICAL
+from sequence_metrics import lcs_length, lcs_ratio as sequence_lcs_ratio
+from timeline import PatientTimeline, HEALTH_SERVICE_TYPES
 from sqlalchemy import text
 
 
-# Critical event keywords for recall/precision
-CRITICAL_KEYWORDS = [
-    "INTENZIVNÍ", "JIP", "ARO", "RESUSCIT", "OPERACE", "CHIRURG",
-    "BIOPSIE", "ONKOLOG", "CHEMOTERAPIE", "DIALÝZA", "TRANSPLANT",
-    "INFARKT", "EMBOLIE", "SEPSE", "ŠOKOVÁ", "PALIATIV"
-]
+# Critical event keywords for recall/precision (classified once per label in label_features)
+CRITICAL_KEYWORDS = BACKTEST_CRITICAL_KEYWORDS
+
+# HealthServiceType value -> index into HEALTH_SERVICE_TYPES (type_code of the timelines)
+_TYPE_VALUE_CODES = {t.value: code for code, t in enumerate(HEALTH_SERVICE_TYPES)}
 
 
 def detect_outcome_from_events(events) -> str:
-    """Detect outcome from actual PatientEvent list."""
+    """Detect outcome from actual PatientEvent list or PatientTimeline."""
     if not events:
         return "UNKNOWN"
-    last_text = " ".join(e.label.upper() for e in events[-10:])
-    if "PALIATIV" in last_text or "HOSPIC" in last_text:
-        return "END_OF_LIFE"
-    elif "ZEMŘEL" in last_text or "PROHLÍDKA ZEMŘELÉHO" in last_text:
-        return "DEATH"
-    elif "PROPUŠTĚN" in last_text:
-        return "DISCHARGED"
-    elif any(kw in last_text for kw in ["INTENZIVNÍ", "JIP", "ARO", "RESUSCIT"]):
-        return "CRITICAL"
-    elif any(kw in last_text for kw in ["REHABILITACE", "LÁZEŇ"]):
-        return "REHABILITATION"
-    return "ONGOING"
+    return label_features.outcome(timeline_label_ids(events[-10:]))
 
 
 def is_critical_event(label: str) -> bool:
     """Check if an event is critical."""
-    label_upper = label.upper()
-    return any(kw in label_upper for kw in CRITICAL_KEYWORDS)
+    return label_features.has(label, BACKTEST_CRITICAL)
 
 
 def compute_lcs_length(seq1: list, seq2: list) -> int:
@@ -45,21 +40,15 @@ def compute_lcs_length(seq1: list, seq2: list) -> int:
     Compute Longest Common Subsequence length.
     Measures sequence similarity while allowing gaps.
     """
-    m, n = len(seq1), len(seq2)
-    if m == 0 or n == 0:
-        return 0
-    
-    # DP table
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
-    
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if seq1[i-1] == seq2[j-1]:
-                dp[i][j] = dp[i-1][j-1] + 1
-            else:
-                dp[i][j] = max(dp[i-1][j], dp[i][j-1])
-    
-    return dp[m][n]
+    return lcs_length(seq1, seq2)
+
+
+def _type_code_sequence(events) -> np.ndarray:
+    """HealthServiceType codes of a PatientTimeline, or of trajectory dicts with a "type" value."""
+    if isinstance(events, PatientTimeline):
+        return events.type_code
+    values = (e["type"] if isinstance(e, dict) else getattr(e.type, "value", e.type) for e in events)
+    return np.array([_TYPE_VALUE_CODES.get(value, -1) for value in values], dtype=np.int16)
 
 
 def compute_temporal_accuracy(actual_events, predicted_events) -> dict:
@@ -109,15 +98,11 @@ def compute_critical_event_metrics(actual_events, predicted_events) -> dict:
     """
     Compute precision and recall for critical events.
     """
-    actual_critical = set()
-    for e in actual_events:
-        if is_critical_event(e.label):
-            actual_critical.add(e.label)
+    actual_ids = timeline_label_ids(actual_events)
+    actual_critical = set(actual_ids[(label_features.flags_of(actual_ids) & BACKTEST_CRITICAL) != 0].tolist())
     
-    predicted_critical = set()
-    for e in predicted_events:
-        if is_critical_event(e["label"]):
-            predicted_critical.add(e["label"])
+    predicted_ids = label_features.label_ids(e["label"] for e in predicted_events)
+    predicted_critical = set(predicted_ids[(label_features.flags_of(predicted_ids) & BACKTEST_CRITICAL) != 0].tolist())
     
     true_positives = len(actual_critical & predicted_critical)
     
@@ -133,14 +118,11 @@ def compute_critical_event_metrics(actual_events, predicted_events) -> dict:
     }
 
 
-def evaluate_patient(patient_id: str, snapshot_pct: float = 0.5) -> dict | None:
+def select_snapshot(all_events, snapshot_pct: float = 0.5) -> int | None:
     """
-    Evaluate prediction accuracy for a patient using backtesting.
-    Includes enhanced trajectory metrics.
+    Number of "known" events for backtesting a patient, or None when the patient has too
+    few events overall, in the snapshot or in the remaining "actual future".
     """
-    # Get complete history
-    all_events = get_patient_events(patient_id)
-    
     # Skip patients with too few events
     if len(all_events) < 20:
         return None
@@ -149,20 +131,38 @@ def evaluate_patient(patient_id: str, snapshot_pct: float = 0.5) -> dict | None:
     snapshot_count = int(len(all_events) * snapshot_pct)
     if snapshot_count < 10:
         return None
+    
+    if len(all_events) - snapshot_count < 5:
+        return None
+    return snapshot_count
+
+
+def evaluate_patient(patient_id: str, snapshot_pct: float = 0.5) -> dict | None:
+    """
+    Evaluate prediction accuracy for a patient using backtesting.
+    Includes enhanced trajectory metrics.
+    """
+    # Get complete history (columnar, no per-event pydantic objects)
+    all_events = get_patient_timeline(patient_id)
+    
+    snapshot_count = select_snapshot(all_events, snapshot_pct)
+    if snapshot_count is None:
+        return None
         
     known_events = all_events[:snapshot_count]
     actual_future = all_events[snapshot_count:]
     
-    if len(actual_future) < 5:
-        return None
-    
     # Get predictions using only known events
     trajectories = vector_engine.get_future_trajectories(
         patient_history=known_events,
         snapshot_events=snapshot_count,
         top_k=5
     )
-    
+    return compute_patient_metrics(patient_id, snapshot_count, actual_future, trajectories)
+
+
+def compute_patient_metrics(patient_id: str, snapshot_count: int, actual_future, trajectories: list) -> dict:
+    """Scores the top predicted trajectory against the patient's actual future."""
     if not trajectories:
         return {
             "patient_id": patient_id,
@@ -192,17 +192,13 @@ def evaluate_patient(patient_id: str, snapshot_pct: float = 0.5) -> dict | None:
     
     # === SEQUENCE METRICS ===
     
-    # LCS on event labels (sequence similarity)
-    actual_label_seq = [e.label for e in actual_future]
-    predicted_label_seq = [e["label"] for e in predicted_events]
-    lcs_length = compute_lcs_length(actual_label_seq, predicted_label_seq)
-    lcs_ratio = lcs_length / max(len(actual_label_seq), len(predicted_label_seq)) if actual_label_seq else 0
+    # LCS on event labels (sequence similarity), compared as LABELS ids
+    actual_label_seq = timeline_label_ids(actual_future)
+    predicted_label_seq = label_features.label_ids(e["label"] for e in predicted_events)
+    lcs_ratio = sequence_lcs_ratio(actual_label_seq, predicted_label_seq)
     
-    # LCS on event types (coarser sequence similarity)
-    actual_type_seq = [e.type.value if hasattr(e.type, 'value') else str(e.type) for e in actual_future]
-    predicted_type_seq = [e["type"] for e in predicted_events]
-    type_lcs_length = compute_lcs_length(actual_type_seq, predicted_type_seq)
-    type_lcs_ratio = type_lcs_length / max(len(actual_type_seq), len(predicted_type_seq)) if actual_type_seq else 0
+    # LCS on event types (coarser sequence similarity), compared as type codes
+    type_lcs_ratio = sequence_lcs_ratio(_type_code_sequence(actual_future), _type_code_sequence(predicted_events))
     
     # === TEMPORAL METRICS ===
     temporal_metrics = compute_temporal_accuracy(actual_future, predicted_events)
@@ -257,52 +253,40 @@ def evaluate_patient(patient_id: str, snapshot_pct: float = 0.5) -> dict | None:
     }
 
 
-def run_evaluation(sample_size: int = 30, snapshot_pct: float = 0.5, verbose: bool = True):
+def summarize_results(results: list) -> dict:
     """
-    Run evaluation on multiple patients with enhanced metrics.
+    Mean metrics over evaluated patients (compute_patient_metrics results with status OK).
+    Temporal and critical-event means only count patients where the metric is defined (else None).
     """
-    print(f"\n{'='*70}")
-    print(f"TRAJECTORY PREDICTION EVALUATION (Enhanced Metrics)")
-    print(f"{'='*70}")
-    print(f"Snapshot: {snapshot_pct:.0%} of events | Sample size: {sample_size}")
-    print(f"{'='*70}\n")
+    if not results:
+        return {}
     
-    # Get indexed patient IDs
-    with get_db_connection() as conn:
-        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."PatientEmbeddings"')).fetchall()
-        patient_ids = [row[0] for row in result]
-    
-    print(f"Total indexed patients: {len(patient_ids)}")
-    
-    # Sample patients
-    test_patients = sample(patient_ids, min(sample_size, len(patient_ids)))
-    
-    results = []
-    skipped = 0
-    no_predictions = 0
-    
-    for i, pid in enumerate(test_patients):
-        result = evaluate_patient(pid, snapshot_pct=snapshot_pct)
-        
-        if result is None:
-            skipped += 1
-            continue
-        
-        if result.get("status") == "NO_PREDICTIONS":
-            no_predictions += 1
-            if verbose:
-                print(f"[{i+1}/{len(test_patients)}] Patient {pid}: No predictions")
-            continue
-        
-        results.append(result)
-        
-        if verbose:
-            print(f"[{i+1}/{len(test_patients)}] Patient {pid}: "
-                  f"LCS={result['lcs_ratio']:.0%}, "
-                  f"Jaccard={result['label_jaccard']:.0%}, "
-                  f"Outcome={'✓' if result['outcome_match'] else '✗'}, "
-                  f"Conf={result['confidence']}%")
+    def mean(name):
+        values = [r[name] for r in results if r[name] is not None]
+        return sum(values) / len(values) if values else None
     
+    return {
+        # Set-based metrics
+        "label_jaccard": mean("label_jaccard"),
+        "type_jaccard": mean("type_jaccard"),
+        # Sequence metrics
+        "lcs_ratio": mean("lcs_ratio"),
+        "type_lcs_ratio": mean("type_lcs_ratio"),
+        # Temporal metrics
+        "temporal_rmse": mean("temporal_rmse"),
+        "temporal_mae": mean("temporal_mae"),
+        "time_span_diff": mean("time_span_diff"),
+        # Critical event metrics
+        "critical_recall": mean("critical_recall"),
+        "critical_precision": mean("critical_precision"),
+        # Outcome metrics
+        "outcome_accuracy": sum(r["outcome_match"] for r in results) / len(results),
+        "confidence": mean("confidence"),
+    }
+
+
+def print_summary(results: list, skipped: int, no_predictions: int, elapsed: float = None, sampled: int = 0):
+    """Prints aggregate metrics over all evaluated patients."""
     # === SUMMARY STATISTICS ===
     print(f"\n{'='*70}")
     print(f"SUMMARY ({len(results)} patients evaluated)")
@@ -310,31 +294,22 @@ def run_evaluation(sample_size: int = 30, snapshot_pct: float = 0.5, verbose: bo
     
     print(f"Skipped (too few events): {skipped}")
     print(f"No predictions available: {no_predictions}")
+    if elapsed:
+        print(f"Wall time: {elapsed:.1f}s ({sampled / elapsed:.1f} patients/s)")
     
     if results:
-        # Set-based metrics
-        avg_label_jaccard = sum(r["label_jaccard"] for r in results) / len(results)
-        avg_type_jaccard = sum(r["type_jaccard"] for r in results) / len(results)
-        
-        # Sequence metrics
-        avg_lcs = sum(r["lcs_ratio"] for r in results) / len(results)
-        avg_type_lcs = sum(r["type_lcs_ratio"] for r in results) / len(results)
-        
-        # Temporal metrics
-        temporal_results = [r for r in results if r["temporal_rmse"] is not None]
-        avg_temporal_rmse = sum(r["temporal_rmse"] for r in temporal_results) / len(temporal_results) if temporal_results else None
-        avg_temporal_mae = sum(r["temporal_mae"] for r in temporal_results) / len(temporal_results) if temporal_results else None
-        avg_time_diff = sum(r["time_span_diff"] for r in results) / len(results)
-        
-        # Critical event metrics
-        critical_results = [r for r in results if r["critical_recall"] is not None]
-        avg_critical_recall = sum(r["critical_recall"] for r in critical_results) / len(critical_results) if critical_results else None
-        precision_results = [r for r in results if r["critical_precision"] is not None]
-        avg_critical_precision = sum(r["critical_precision"] for r in precision_results) / len(precision_results) if precision_results else None
-        
-        # Outcome metrics
-        outcome_accuracy = sum(r["outcome_match"] for r in results) / len(results)
-        avg_confidence = sum(r["confidence"] for r in results) / len(results)
+        summary = summarize_results(results)
+        avg_label_jaccard = summary["label_jaccard"]
+        avg_type_jaccard = summary["type_jaccard"]
+        avg_lcs = summary["lcs_ratio"]
+        avg_type_lcs = summary["type_lcs_ratio"]
+        avg_temporal_rmse = summary["temporal_rmse"]
+        avg_temporal_mae = summary["temporal_mae"]
+        avg_time_diff = summary["time_span_diff"]
+        avg_critical_recall = summary["critical_recall"]
+        avg_critical_precision = summary["critical_precision"]
+        outcome_accuracy = summary["outcome_accuracy"]
+        avg_confidence = summary["confidence"]
         
         print(f"\n--- Set-Based Metrics (unordered overlap) ---")
         print(f"Event Label Overlap (Jaccard):     {avg_label_jaccard:.1%}")
@@ -388,6 +363,216 @@ def run_evaluation(sample_size: int = 30, snapshot_pct: float = 0.5, verbose: bo
         print(f"Worst LCS: Patient {sorted_by_lcs[-1]['patient_id']} - {sorted_by_lcs[-1]['lcs_ratio']:.0%}")
     
     print(f"\n{'='*70}")
+
+
+def get_indexed_patient_ids() -> list:
+    """IDs of all patients with a stored embedding."""
+    with get_db_connection() as conn:
+        result = conn.execute(text('SELECT ID_PACIENT FROM "DATA"."PatientEmbeddings"')).fetchall()
+        return [row[0] for row in result]
+
+
+def sample_patients(patient_ids: list, sample_size: int, seed: int | None = None) -> list:
+    """
+    Patients to evaluate. With a seed the sample is reproducible: it is drawn from the
+    sorted IDs, so it does not depend on the order the database returns them in.
+    """
+    sample_size = min(sample_size, len(patient_ids))
+    if seed is None:
+        return sample(patient_ids, sample_size)
+    return Random(seed).sample(sorted(patient_ids), sample_size)
+
+
+def evaluate_patients(patient_ids: list, snapshot_pct: float = 0.5, verbose: bool = False):
+    """Evaluates patients one at a time; returns (results, skipped, no_predictions)."""
+    results = []
+    skipped = 0
+    no_predictions = 0
+    
+    for i, pid in enumerate(patient_ids):
+        result = evaluate_patient(pid, snapshot_pct=snapshot_pct)
+        
+        if result is None:
+            skipped += 1
+            continue
+        
+        if result.get("status") == "NO_PREDICTIONS":
+            no_predictions += 1
+            if verbose:
+                print(f"[{i+1}/{len(patient_ids)}] Patient {pid}: No predictions")
+            continue
+        
+        results.append(result)
+        
+        if verbose:
+            print(f"[{i+1}/{len(patient_ids)}] Patient {pid}: "
+                  f"LCS={result['lcs_ratio']:.0%}, "
+                  f"Jaccard={result['label_jaccard']:.0%}, "
+                  f"Outcome={'✓' if result['outcome_match'] else '✗'}, "
+                  f"Conf={result['confidence']}%")
+    
+    return results, skipped, no_predictions
+
+
+def evaluate_patients_batch(patient_ids: list, snapshot_pct: float = 0.5, index=None, batch_size: int = 500,
+                            verbose: bool = False):
+    """
+    Evaluates patients in batches: per batch all timelines are loaded in bulk, the snapshot
+    profiles are encoded in one model call and the neighbour search is one matrix product
+    against `index` (default: an exact index over DATA.PatientEmbeddings, loaded here).
+    Returns (results, skipped, no_predictions).
+    """
+    if index is None:
+        index = vector_engine.load_index("exact")
+    
+    results = []
+    skipped = 0
+    no_predictions = 0
+    t0 = time.perf_counter()
+    
+    for start in range(0, len(patient_ids), batch_size):
+        batch = patient_ids[start:start + batch_size]
+        timelines = get_batch_patient_timelines(batch, use_cache=False)
+        
+        evaluated = []
+        for pid in batch:
+            snapshot_count = select_snapshot(timelines[pid], snapshot_pct)
+            if snapshot_count is None:
+                skipped += 1
+            else:
+                evaluated.append((pid, snapshot_count))
+        
+        trajectories = vector_engine.get_future_trajectories_batch(
+            [timelines[pid][:snapshot_count] for pid, snapshot_count in evaluated], top_k=5, index=index
+        )
+        
+        for (pid, snapshot_count), patient_trajectories in zip(evaluated, trajectories):
+            result = compute_patient_metrics(pid, snapshot_count, timelines[pid][snapshot_count:], patient_trajectories)
+            if result.get("status") == "NO_PREDICTIONS":
+                no_predictions += 1
+            else:
+                results.append(result)
+        
+        if verbose:
+            done = start + len(batch)
+            elapsed = time.perf_counter() - t0
+            print(f"[{done}/{len(patient_ids)}] {len(results)} evaluated, "
+                  f"{elapsed:.1f}s ({done / elapsed:.1f} patients/s)")
+    
+    return results, skipped, no_predictions
+
+
+def run_evaluation(sample_size: int = 30, snapshot_pct: float = 0.5, verbose: bool = True, seed: int | None = None):
+    """
+    Run evaluation on multiple patients with enhanced metrics.
+    """
+    print(f"\n{'='*70}")
+    print(f"TRAJECTORY PREDICTION EVALUATION (Enhanced Metrics)")
+    print(f"{'='*70}")
+    print(f"Snapshot: {snapshot_pct:.0%} of events | Sample size: {sample_size} | Seed: {seed}")
+    print(f"{'='*70}\n")
+    
+    # Get indexed patient IDs
+    patient_ids = get_indexed_patient_ids()
+    
+    print(f"Total indexed patients: {len(patient_ids)}")
+    
+    # Sample patients
+    test_patients = sample_patients(patient_ids, sample_size, seed)
+    
+    t0 = time.perf_counter()
+    results, skipped, no_predictions = evaluate_patients(test_patients, snapshot_pct, verbose)
+    elapsed = time.perf_counter() - t0
+    print_summary(results, skipped, no_predictions, elapsed, len(test_patients))
+    
+    return results
+
+
+def run_batch_evaluation(sample_size: int = 1000, snapshot_pct: float = 0.5, batch_size: int = 500,
+                         verbose: bool = True, seed: int | None = None):
+    """
+    Batch variant of run_evaluation for large backtests (see evaluate_patients_batch).
+    Uses an exact index, so neighbours match the SQL VECTOR_DOT_PRODUCT ranking of run_evaluation.
+    """
+    print(f"\n{'='*70}")
+    print(f"TRAJECTORY PREDICTION EVALUATION (Batch)")
+    print(f"{'='*70}")
+    print(f"Snapshot: {snapshot_pct:.0%} of events | Sample size: {sample_size} | Batch size: {batch_size} | Seed: {seed}")
+    print(f"{'='*70}\n")
+    
+    index = vector_engine.load_index("exact")
+    patient_ids = list(index.ids)
+    print(f"Total indexed patients: {len(patient_ids)}")
+    
+    test_patients = sample_patients(patient_ids, sample_size, seed)
+    
+    t0 = time.perf_counter()
+    results, skipped, no_predictions = evaluate_patients_batch(test_patients, snapshot_pct, index, batch_size, verbose)
+    elapsed = time.perf_counter() - t0
+    print_summary(results, skipped, no_predictions, elapsed, len(test_patients))
+    
+    return results
+
+
+def _init_worker(torch_threads: int):
+    # Workers share the machine; keep each model's intra-op threads to its share of the cores
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def _evaluate_shard(patient_ids: list, snapshot_pct: float, batch: bool, batch_size: int):
+    """Runs in a worker process, which has its own model, engine and connections."""
+    if batch:
+        return evaluate_patients_batch(patient_ids, snapshot_pct, batch_size=batch_size)
+    return evaluate_patients(patient_ids, snapshot_pct)
+
+
+def run_parallel_evaluation(sample_size: int = 30, snapshot_pct: float = 0.5, workers: int = 2, seed: int = 0,
+                            batch: bool = False, batch_size: int = 500, verbose: bool = True):
+    """
+    run_evaluation (or run_batch_evaluation with batch=True) over a process pool.
+    The seeded sample is split round-robin into one shard per worker; the merged per-patient
+    results are put back in sample order, so the summary equals the serial run with the same seed.
+    """
+    print(f"\n{'='*70}")
+    print(f"TRAJECTORY PREDICTION EVALUATION ({'Batch, ' if batch else ''}{workers} workers)")
+    print(f"{'='*70}")
+    print(f"Snapshot: {snapshot_pct:.0%} of events | Sample size: {sample_size} | Seed: {seed}")
+    print(f"{'='*70}\n")
+    
+    patient_ids = get_indexed_patient_ids()
+    print(f"Total indexed patients: {len(patient_ids)}")
+    
+    test_patients = sample_patients(patient_ids, sample_size, seed)
+    shards = [test_patients[i::workers] for i in range(workers)]
+    
+    results = []
+    skipped = 0
+    no_predictions = 0
+    t0 = time.perf_counter()
+    
+    # spawn: forked children would inherit the parent's pooled IRIS connections and model threads
+    torch_threads = max(1, (os.cpu_count() or workers) // workers)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(torch_threads,)) as pool:
+        futures = {
+            pool.submit(_evaluate_shard, shard, snapshot_pct, batch, batch_size): i
+            for i, shard in enumerate(shards) if shard
+        }
+        for future in as_completed(futures):
+            shard_results, shard_skipped, shard_no_predictions = future.result()
+            results.extend(shard_results)
+            skipped += shard_skipped
+            no_predictions += shard_no_predictions
+            if verbose:
+                print(f"Shard {futures[future] + 1}/{workers} done: {len(shard_results)} evaluated "
+                      f"({time.perf_counter() - t0:.1f}s)")
+    
+    order = {pid: i for i, pid in enumerate(test_patients)}
+    results.sort(key=lambda r: order[r["patient_id"]])
+    
+    elapsed = time.perf_counter() - t0
+    print_summary(results, skipped, no_predictions, elapsed, len(test_patients))
     
     return results
 
@@ -399,11 +584,37 @@ if __name__ == "__main__":
     parser.add_argument("--sample", type=int, default=30, help="Number of patients to evaluate")
     parser.add_argument("--snapshot", type=float, default=0.5, help="Snapshot percentage (0.0-1.0)")
     parser.add_argument("--quiet", action="store_true", help="Only show summary")
+    parser.add_argument("--batch", action="store_true",
+                        help="Batch mode: bulk loading, batched encoding and in-memory neighbour search")
+    parser.add_argument("--batch-size", type=int, default=500, help="Patients per batch in batch mode")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed for a reproducible patient sample (default: unseeded; 0 with --workers)")
+    parser.add_argument("--workers", type=int, default=1, help="Evaluate in N worker processes (seeded sharding)")
     
     args = parser.parse_args()
     
-    run_evaluation(
-        sample_size=args.sample,
-        snapshot_pct=args.snapshot,
-        verbose=not args.quiet
-    )
+    if args.workers > 1:
+        run_parallel_evaluation(
+            sample_size=args.sample,
+            snapshot_pct=args.snapshot,
+            workers=args.workers,
+            seed=args.seed if args.seed is not None else 0,
+            batch=args.batch,
+            batch_size=args.batch_size,
+            verbose=not args.quiet
+        )
+    elif args.batch:
+        run_batch_evaluation(
+            sample_size=args.sample,
+            snapshot_pct=args.snapshot,
+            batch_size=args.batch_size,
+            verbose=not args.quiet,
+            seed=args.seed
+        )
+    else:
+        run_evaluation(
+            sample_size=args.sample,
+            snapshot_pct=args.snapshot,
+            verbose=not args.quiet,
+            seed=args.seed
+        )
@@ -0,0 +1,112 @@
+# executors.py - Bounded worker pools for blocking work called from async endpoints
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool already has max_workers running and max_queue waiting tasks."""
+
+    def __init__(self, pool: str):
+        super().__init__(f"Executor pool '{pool}' is saturated")
+        self.pool = pool
+
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor with an admission limit: at most max_workers tasks run and
+    max_queue wait, anything beyond that is rejected immediately with PoolSaturated
+    instead of growing an unbounded backlog (the API turns it into a 429).
+    Tracks queue depth and queue wait time for the /metrics endpoint.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self.active + self.queued >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturated(self.name)
+            self.queued += 1
+            self.submitted += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        return self._executor.submit(self._call, time.monotonic(), fn, args, kwargs)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Awaitable submit() for use inside async endpoints."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _call(self, enqueued_at: float, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        waited = time.monotonic() - enqueued_at
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+                if not ok:
+                    self.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self.completed + self.active
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "queued": self.queued,
+                "peak_queued": self.peak_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds / started * 1000, 2) if started else None,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            }
+
+
+# IRIS round-trips: mostly waiting on the database, so more threads than cores
+io_pool = BoundedExecutor(
+    "io",
+    max_workers=int(os.getenv("IO_POOL_WORKERS", 16)),
+    max_queue=int(os.getenv("IO_POOL_QUEUE", 64)),
+)
+
+# Linearisation and query encoding: CPU-bound, sized to the cores
+cpu_pool = BoundedExecutor(
+    "cpu",
+    max_workers=int(os.getenv("CPU_POOL_WORKERS", os.cpu_count() or 4)),
+    max_queue=int(os.getenv("CPU_POOL_QUEUE", 32)),
+)
+
+POOLS = (io_pool, cpu_pool)
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    return {pool.name: pool.stats() for pool in POOLS}
@@ -0,0 +1,429 @@
+# indexer.py - Pipelined, resumable embedding indexer for DATA.PatientEmbeddings
+#
+# Stages (connected by bounded queues, so a slow stage applies backpressure):
+#   fetch      - thread pool running get_batch_patient_timelines
+#   linearize  - process pool running linearizer.linearize_batch
+#   encode     - single thread running SentenceTransformer.encode
+#   write      - single thread bulk-writing embeddings, updating the ANN index and the checkpoint
+#
+# Incremental mode walks all patients, but the linearize stage drops everyone whose profile
+# fingerprint matches the stored one, so only changed or new patients are encoded and written.
+#
+# Resuming: a default run indexes the patients missing from DATA.PatientEmbeddings, so the table
+# itself records its progress. Incremental and explicit --patients runs also cover patients that
+# are already in the table; they record finished batches in the checkpoint file and skip those
+# patients when restarted after a crash.
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from database import get_db_connection, get_batch_patient_timelines
+from embedding_store import create_writer
+from linearizer import linearize_batch
+
+logger = logging.getLogger(__name__)
+
+# Next to this module rather than in the working directory (ignored by git)
+DEFAULT_CHECKPOINT_PATH = os.getenv(
+    "INDEX_CHECKPOINT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_checkpoint.txt")
+)
+
+_DONE = object()  # End-of-stream sentinel passed between stages
+
+
+# (event_count, max_day, profile_hash) stored next to each embedding
+Fingerprint = Tuple[int, int, str]
+
+
+def profile_fingerprint(events, profile: str) -> Fingerprint:
+    """Fingerprint of a patient's linearised profile; the embedding only changes when the hash does."""
+    max_day = int(max(e.date for e in events)) if len(events) else 0
+    return len(events), max_day, hashlib.sha256(profile.encode("utf-8")).hexdigest()
+
+
+def _linearize_batch(items: List[Tuple[str, object]], stored_hashes: Optional[Dict[str, str]] = None
+                     ) -> Tuple[List[Tuple[str, str, Fingerprint]], float]:
+    """
+    Process-pool worker: linearises (patient_id, timeline) pairs, skipping empty histories
+    and, when stored_hashes is given, patients whose profile hash is unchanged.
+    Returns (patient_id, text, fingerprint) triples and the seconds spent inside the worker.
+    """
+    t0 = time.time()
+    texts = []
+    items = [(pid, events) for pid, events in items if events]
+    profiles = linearize_batch([events for _, events in items], [pid for pid, _ in items])
+    for (pid, events), text_rep in zip(items, profiles):
+        fingerprint = profile_fingerprint(events, text_rep)
+        if stored_hashes is not None and stored_hashes.get(pid) == fingerprint[2]:
+            continue
+        texts.append((pid, text_rep, fingerprint))
+    return texts, time.time() - t0
+
+
+class StageStats:
+    """
+    Counts patients handled by a stage and the time its workers spent on them.
+    Throughput is reported for the whole stage, i.e. with all workers busy.
+    """
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.patients = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, patients: int, seconds: float):
+        with self._lock:
+            self.patients += patients
+            self.busy_seconds += seconds
+
+    def summary(self) -> Dict[str, float]:
+        rate = self.patients * self.workers / self.busy_seconds if self.busy_seconds > 0 else 0.0
+        return {
+            "workers": self.workers,
+            "patients": self.patients,
+            "busy_seconds": round(self.busy_seconds, 2),
+            "patients_per_sec": round(rate, 1),
+        }
+
+
+class Checkpoint:
+    """
+    Append-only list of patient ids that are fully processed (written or known to be empty).
+    Entries are appended after each committed batch, so a crashed run resumes where it stopped.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: set = set()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def record(self, patient_ids: List[str]):
+        if not self.path or not patient_ids:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{pid}\n" for pid in patient_ids))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(patient_ids)
+
+    def retain(self, patient_ids):
+        """Drops entries not in patient_ids (e.g. rows lost when DATA.PatientEmbeddings was recreated)."""
+        stale = self.done - set(patient_ids)
+        if not stale:
+            return
+        self.done -= stale
+        if self.path:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(f"{pid}\n" for pid in sorted(self.done)))
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.done = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PipelinedIndexer:
+    """
+    Embeds patients missing from DATA.PatientEmbeddings with overlapping
+    fetch / linearize / encode / write stages.
+    """
+
+    def __init__(self, engine, batch_size: int = 50, fetch_workers: int = 4,
+                 linearize_workers: int = os.cpu_count() or 1, queue_size: int = 8,
+                 checkpoint_path: Optional[str] = DEFAULT_CHECKPOINT_PATH,
+                 write_mode: str = "executemany", upsert: bool = False, incremental: bool = False):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.fetch_workers = max(1, fetch_workers)
+        self.linearize_workers = max(0, linearize_workers)
+        self.queue_size = max(1, queue_size)
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.write_mode = write_mode
+        # Incremental runs replace stale rows in place
+        self.incremental = incremental
+        self.upsert = upsert or incremental
+        self.stored_hashes: Optional[Dict[str, str]] = None
+        self.skipped = 0  # Empty histories, plus unchanged profiles in incremental mode
+        self.writer_summary: Dict[str, float] = {}
+        self.stats = {
+            "fetch": StageStats("fetch", self.fetch_workers),
+            "linearize": StageStats("linearize", max(1, self.linearize_workers)),
+            "encode": StageStats("encode"),
+            "write": StageStats("write"),
+        }
+        self.use_checkpoint = False  # Set per run, see run()
+        self._error: Optional[BaseException] = None
+        self._stop = threading.Event()
+
+    def pending_patient_ids(self, limit: Optional[int] = None) -> List[str]:
+        """
+        Patients not yet in the embeddings table. The table itself records progress here, so
+        the checkpoint is not consulted: its ids may predate a reload that recreated the table.
+        """
+        with get_db_connection() as conn:
+            # Find patients not yet in embeddings table
+            query = text("""
+                SELECT DISTINCT p.ID_PACIENT
+                FROM DATA.Pacienti p
+                LEFT JOIN DATA.PatientEmbeddings e ON p.ID_PACIENT = e.ID_PACIENT
+                WHERE e.ID_PACIENT IS NULL
+            """)
+            patient_ids = [row[0] for row in conn.execute(query).fetchall()]
+        if limit:
+            patient_ids = patient_ids[:limit]
+        return patient_ids
+
+    def all_patient_ids(self, limit: Optional[int] = None) -> List[str]:
+        """Every patient (incremental mode), minus those already done in the checkpoint."""
+        with get_db_connection() as conn:
+            result = conn.execute(text("SELECT DISTINCT ID_PACIENT FROM DATA.Pacienti")).fetchall()
+        patient_ids = [row[0] for row in result if row[0] not in self.checkpoint.done]
+        if limit:
+            patient_ids = patient_ids[:limit]
+        return patient_ids
+
+    def stored_patient_ids(self) -> List[str]:
+        with get_db_connection() as conn:
+            return [row[0] for row in conn.execute(text("SELECT ID_PACIENT FROM DATA.PatientEmbeddings")).fetchall()]
+
+    def load_stored_fingerprints(self) -> Dict[str, Fingerprint]:
+        """Reads the fingerprints stored next to the embeddings."""
+        with get_db_connection() as conn:
+            result = conn.execute(text(
+                "SELECT ID_PACIENT, EVENT_COUNT, MAX_DAY, PROFILE_HASH FROM DATA.PatientEmbeddings"
+            )).fetchall()
+        return {row[0]: (row[1], row[2], row[3]) for row in result}
+
+    def run(self, patient_ids: Optional[List[str]] = None, limit: Optional[int] = None) -> Dict[str, dict]:
+        """Runs the pipeline to completion and returns per-stage throughput."""
+        # A default run resumes from the table alone and leaves the checkpoint untouched
+        self.use_checkpoint = bool(self.checkpoint.path) and (self.incremental or patient_ids is not None)
+        if self.incremental:
+            fingerprints = self.load_stored_fingerprints()
+            self.stored_hashes = {pid: fp[2] for pid, fp in fingerprints.items() if fp[2]}
+            stored_ids = fingerprints.keys()
+        elif self.use_checkpoint:
+            stored_ids = self.stored_patient_ids()
+        if self.use_checkpoint:
+            # Only resume past patients whose refreshed rows are still in the table
+            self.checkpoint.retain(stored_ids)
+        if patient_ids is None:
+            patient_ids = self.all_patient_ids(limit) if self.incremental else self.pending_patient_ids(limit)
+        else:
+            patient_ids = [pid for pid in patient_ids if pid not in self.checkpoint.done]
+            if limit:
+                patient_ids = patient_ids[:limit]
+        logger.info(f"Found {len(patient_ids)} patients to {'check' if self.incremental else 'index'}.")
+
+        batches: "queue.Queue" = queue.Queue()
+        for i in range(0, len(patient_ids), self.batch_size):
+            batches.put(patient_ids[i:i + self.batch_size])
+
+        fetched: "queue.Queue" = queue.Queue(self.queue_size)
+        linearized: "queue.Queue" = queue.Queue(self.queue_size)
+        encoded: "queue.Queue" = queue.Queue(self.queue_size)
+
+        started = time.time()
+        fetchers = [
+            threading.Thread(target=self._guard, args=(self._fetch_stage, batches, fetched), daemon=True)
+            for _ in range(self.fetch_workers)
+        ]
+        stages = [
+            threading.Thread(target=self._guard, args=(self._linearize_stage, fetched, linearized), daemon=True),
+            threading.Thread(target=self._guard, args=(self._encode_stage, linearized, encoded), daemon=True),
+            threading.Thread(target=self._guard, args=(self._write_stage, encoded, None), daemon=True),
+        ]
+        for thread in fetchers + stages:
+            thread.start()
+        for thread in fetchers:
+            thread.join()
+        self._put(fetched, _DONE)
+        for thread in stages:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        wall = time.time() - started
+        summary = {name: stage.summary() for name, stage in self.stats.items()}
+        summary["write"].update({f"db_{key}": value for key, value in self.writer_summary.items()})
+        summary["total"] = {
+            "patients": self.stats["fetch"].patients,
+            "encoded": self.stats["write"].patients,
+            "skipped": self.skipped,
+            "wall_seconds": round(wall, 2),
+            "patients_per_sec": round(self.stats["fetch"].patients / wall, 1) if wall > 0 else 0.0,
+        }
+        for name, row in summary.items():
+            logger.info(f"  {name:<10} {row}")
+        # A finished run starts from scratch next time; only crashed runs resume
+        if self.use_checkpoint:
+            self.checkpoint.reset()
+        return summary
+
+    # --- Stage plumbing ---
+
+    def _guard(self, stage, inbox, outbox):
+        try:
+            stage(inbox, outbox)
+        except BaseException as e:
+            logger.exception(f"Indexing stage failed: {e}")
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+            if outbox is not None:
+                self._put(outbox, _DONE)
+
+    def _put(self, q: "queue.Queue", item):
+        """
+        Blocking put that gives up once the pipeline is stopping. That includes _DONE: a failed
+        stage may have stopped consuming q, and its downstream stages stop via _get anyway.
+        """
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self._stop.is_set():
+                    return
+
+    def _get(self, q: "queue.Queue"):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _DONE
+
+    # --- Stages ---
+
+    def _fetch_stage(self, batches: "queue.Queue", fetched: "queue.Queue"):
+        while not self._stop.is_set():
+            try:
+                batch_ids = batches.get_nowait()
+            except queue.Empty:
+                return
+            t0 = time.time()
+            # Bypass the event cache so a bulk run doesn't evict hot API patients
+            timelines = get_batch_patient_timelines(batch_ids, use_cache=False)
+            self.stats["fetch"].record(len(batch_ids), time.time() - t0)
+            self._put(fetched, (batch_ids, [(pid, timelines[pid]) for pid in batch_ids]))
+
+    def _linearize_stage(self, fetched: "queue.Queue", linearized: "queue.Queue"):
+        if self.linearize_workers == 0:
+            while (item := self._get(fetched)) is not _DONE:
+                batch_ids, items = item
+                texts, seconds = _linearize_batch(items, self._stored_hashes_for(batch_ids))
+                self.stats["linearize"].record(len(batch_ids), seconds)
+                self._put(linearized, (batch_ids, texts))
+            self._put(linearized, _DONE)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.linearize_workers) as pool:
+            in_flight = deque()
+
+            def drain_one():
+                batch_ids, future = in_flight.popleft()
+                texts, seconds = future.result()
+                self.stats["linearize"].record(len(batch_ids), seconds)
+                self._put(linearized, (batch_ids, texts))
+
+            while (item := self._get(fetched)) is not _DONE:
+                batch_ids, items = item
+                in_flight.append((batch_ids, pool.submit(_linearize_batch, items, self._stored_hashes_for(batch_ids))))
+                if len(in_flight) >= 2 * self.linearize_workers:
+                    drain_one()
+            while in_flight and not self._stop.is_set():
+                drain_one()
+        self._put(linearized, _DONE)
+
+    def _stored_hashes_for(self, batch_ids: List[str]) -> Optional[Dict[str, str]]:
+        if self.stored_hashes is None:
+            return None
+        return {pid: self.stored_hashes[pid] for pid in batch_ids if pid in self.stored_hashes}
+
+    def _encode_stage(self, linearized: "queue.Queue", encoded: "queue.Queue"):
+        while (item := self._get(linearized)) is not _DONE:
+            batch_ids, texts = item
+            t0 = time.time()
+            embeddings = self.engine.model.encode([t for _, t, _ in texts], show_progress_bar=False) if texts else []
+            self.stats["encode"].record(len(texts), time.time() - t0)
+            self._put(encoded, (batch_ids, [pid for pid, _, _ in texts], embeddings, [fp for _, _, fp in texts]))
+        self._put(encoded, _DONE)
+
+    def _write_stage(self, encoded: "queue.Queue", _):
+        with get_db_connection() as conn:
+            writer = create_writer(conn, mode=self.write_mode, upsert=self.upsert)
+            while (item := self._get(encoded)) is not _DONE:
+                batch_ids, pids, embeddings, fingerprints = item
+                t0 = time.time()
+                if len(pids):
+                    writer.write(pids, embeddings, fingerprints)
+                # Keep the in-process index in sync with the table
+                if self.engine.ann_index is not None and len(pids):
+                    self.engine.ann_index.add(pids, embeddings)
+                # Whole batches, including patients without events (those have no row, so
+                # retain() drops them again on resume and they are just re-fetched)
+                if self.use_checkpoint:
+                    self.checkpoint.record(batch_ids)
+                self.stats["write"].record(len(pids), time.time() - t0)
+                self.skipped += len(batch_ids) - len(pids)
+            self.writer_summary = writer.summary()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Index patient embeddings")
+    parser.add_argument("--batch-size", type=int, default=50, help="Patients per batch")
+    parser.add_argument("--limit", type=int, default=None, help="Max patients to index")
+    parser.add_argument("--fetch-workers", type=int, default=4, help="Threads fetching timelines from IRIS")
+    parser.add_argument("--linearize-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes linearising histories (0 = inline)")
+    parser.add_argument("--queue-size", type=int, default=8, help="Max batches buffered between stages")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH,
+                        help="Checkpoint file for resuming incremental and --patients runs")
+    parser.add_argument("--reset-checkpoint", action="store_true", help="Ignore and delete an existing checkpoint")
+    parser.add_argument("--write-mode", choices=["executemany", "staged"], default="executemany",
+                        help="Bulk insert via executemany or staged file + LOAD DATA")
+    parser.add_argument("--upsert", action="store_true", help="Replace existing embeddings of the given patients")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-check all patients and re-embed only those whose profile fingerprint changed")
+    parser.add_argument("--patients", default=None,
+                        help="Comma-separated patient ids to (re)index instead of all missing ones")
+
+    args = parser.parse_args()
+
+    from vector_engine import vector_engine
+
+    indexer = PipelinedIndexer(
+        vector_engine,
+        batch_size=args.batch_size,
+        fetch_workers=args.fetch_workers,
+        linearize_workers=args.linearize_workers,
+        queue_size=args.queue_size,
+        checkpoint_path=args.checkpoint,
+        write_mode=args.write_mode,
+        upsert=args.upsert,
+        incremental=args.incremental,
+    )
+    if args.reset_checkpoint:
+        indexer.checkpoint.reset()
+    patient_ids = args.patients.split(",") if args.patients else None
+    print(json.dumps(indexer.run(patient_ids=patient_ids, limit=args.limit), indent=2))
@@ -0,0 +1,201 @@
+# label_features.py - Keyword classification computed once per distinct label
+#
+# Critical-keyword, ignore and outcome checks used to re-scan the same label strings for
+# every event. There are far fewer distinct labels (DRG names, procedure/segment names,
+# HVLP medication names) than event rows, so the checks run once per label id in the
+# LABELS pool and every caller looks the result up by id.
+
+import logging
+import re
+import threading
+from typing import Iterable, List
+
+import numpy as np
+from sqlalchemy import text
+
+from timeline import PatientTimeline, LABELS, DEPARTMENTS
+from processor import CRITICAL_KEYWORDS, IGNORED_TERMS, DEPT_CATEGORIES, categorize_department
+
+logger = logging.getLogger(__name__)
+
+# Critical event keywords for the backtest recall/precision metrics (evaluate.py)
+BACKTEST_CRITICAL_KEYWORDS = [
+    "INTENZIVNÍ", "JIP", "ARO", "RESUSCIT", "OPERACE", "CHIRURG",
+    "BIOPSIE", "ONKOLOG", "CHEMOTERAPIE", "DIALÝZA", "TRANSPLANT",
+    "INFARKT", "EMBOLIE", "SEPSE", "ŠOKOVÁ", "PALIATIV"
+]
+
+# Flag bits in LabelFeatures.flags
+IGNORED = 1 << 0             # processor.IGNORED_TERMS (on the stripped label)
+REGULATORY_FEE = 1 << 1      # "REGULAČNÍ POPLATEK", dropped from trajectories
+BACKTEST_CRITICAL = 1 << 2   # BACKTEST_CRITICAL_KEYWORDS
+PALLIATIVE = 1 << 3          # PALIATIV / HOSPIC
+DEATH = 1 << 4               # ZEMŘEL (covers PROHLÍDKA ZEMŘELÉHO)
+DISCHARGED = 1 << 5          # PROPUŠTĚN
+ESCALATION = 1 << 6          # INTENZIVNÍ / JIP / ARO / RESUSCIT
+REHABILITATION = 1 << 7      # REHABILITACE / LÁZEŇ
+
+_FLAG_TERMS = (
+    (REGULATORY_FEE, ("REGULAČNÍ POPLATEK",)),
+    (BACKTEST_CRITICAL, tuple(BACKTEST_CRITICAL_KEYWORDS)),
+    (PALLIATIVE, ("PALIATIV", "HOSPIC")),
+    (DEATH, ("ZEMŘEL", "PROHLÍDKA ZEMŘELÉHO")),
+    (DISCHARGED, ("PROPUŠTĚN",)),
+    (ESCALATION, ("INTENZIVNÍ", "JIP", "ARO", "RESUSCIT")),
+    (REHABILITATION, ("REHABILITACE", "LÁZEŇ")),
+)
+
+# Outcome of a trajectory from the flags of its last events, in priority order
+OUTCOME_RULES = (
+    (PALLIATIVE, "END_OF_LIFE"),
+    (DEATH, "DEATH"),
+    (DISCHARGED, "DISCHARGED"),
+    (ESCALATION, "CRITICAL"),
+    (REHABILITATION, "REHABILITATION"),
+)
+OUTCOME_WINDOW = 10
+
+# One regex pass per label instead of a substring scan per keyword; the critical pattern is
+# only a pre-filter (keywords overlap, e.g. "ARO" inside other words), the ignored one is exact
+_CRITICAL_RE = re.compile("|".join(map(re.escape, CRITICAL_KEYWORDS)))
+_IGNORED_RE = re.compile("|".join(re.escape(term.upper()) for term in IGNORED_TERMS))
+
+DEPARTMENT_CATEGORIES = ["OTHER"] + list(DEPT_CATEGORIES)
+_CATEGORY_IDS = {c: i for i, c in enumerate(DEPARTMENT_CATEGORIES)}
+
+
+class LabelFeatures:
+    """
+    Per-label-id feature table, grown lazily as new labels are interned into LABELS:
+    critical = bitmask over processor.CRITICAL_KEYWORDS (bit i = keyword i present),
+    flags = the flag bits above, short_labels = stripped label truncated to 40 chars
+    as shown in the [RECENT] profile section.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.critical = np.zeros(0, dtype=np.int64)
+        self.flags = np.zeros(0, dtype=np.int32)
+        self.short_labels: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.short_labels)
+
+    def ensure(self, max_id: int) -> None:
+        """Makes sure features exist for all label ids up to max_id (and anything interned so far)."""
+        if max_id < len(self.short_labels):
+            return
+        with self._lock:
+            start = len(self.short_labels)
+            strings = LABELS.strings[start:max(max_id + 1, len(LABELS))]
+            if not strings:
+                return
+            critical = np.zeros(len(strings), dtype=np.int64)
+            flags = np.zeros(len(strings), dtype=np.int32)
+            short_labels = []
+            for i, label in enumerate(strings):
+                upper = label.upper()
+                if _CRITICAL_RE.search(upper):
+                    mask = 0
+                    for bit, keyword in enumerate(CRITICAL_KEYWORDS):
+                        if keyword in upper:
+                            mask |= 1 << bit
+                    critical[i] = mask
+                label_flags = 0
+                for flag, terms in _FLAG_TERMS:
+                    if any(term in upper for term in terms):
+                        label_flags |= flag
+                stripped = label.strip()
+                if _IGNORED_RE.search(stripped.upper()):
+                    label_flags |= IGNORED
+                flags[i] = label_flags
+                short_labels.append(stripped[:40] + "..." if len(stripped) > 40 else stripped)
+            # Readers index the arrays after ensure(), so swap in complete arrays only
+            self.critical = np.concatenate([self.critical, critical])
+            self.flags = np.concatenate([self.flags, flags])
+            self.short_labels.extend(short_labels)
+
+    def flags_of(self, label_ids: np.ndarray) -> np.ndarray:
+        if len(label_ids):
+            self.ensure(int(label_ids.max()))
+        return self.flags[label_ids]
+
+    def label_ids(self, labels: Iterable[str]) -> np.ndarray:
+        """Ids for label strings (e.g. trajectory dicts); labels from timelines are interned already."""
+        return np.array([LABELS.intern(label) for label in labels], dtype=np.int32)
+
+    def has(self, label: str, flag: int) -> bool:
+        label_id = LABELS.intern(label)
+        self.ensure(label_id)
+        return bool(self.flags[label_id] & flag)
+
+    def outcome(self, label_ids: np.ndarray) -> str:
+        """
+        Outcome of a trajectory from its last OUTCOME_WINDOW labels
+        (same rules as the former substring checks on the joined, upper-cased labels).
+        """
+        if not len(label_ids):
+            return "UNKNOWN"
+        present = int(np.bitwise_or.reduce(self.flags_of(label_ids[-OUTCOME_WINDOW:])))
+        for flag, outcome in OUTCOME_RULES:
+            if present & flag:
+                return outcome
+        return "ONGOING"
+
+    def preload(self) -> int:
+        """
+        Interns and classifies every distinct label in the database up front: DRG names,
+        spa indications, care labels (NAZEV_VYKON / SEGMENT_NAZEV) and HVLP medication names.
+        Labels that appear later (e.g. with an "(N items)" suffix) are still added lazily.
+        """
+        from database import get_db_connection, PECE_SOURCE
+
+        queries = [
+            'SELECT DISTINCT DRG_NAZEV FROM "DATA"."Hospitalizace"',
+            'SELECT DISTINCT NAZEV_INDIKACNI_SKUPINA FROM "DATA"."Lazne"',
+            'SELECT DISTINCT NAZEV FROM "DATA"."CiselnikHVLP"',
+        ]
+        if PECE_SOURCE == "daily":
+            queries.append('SELECT DISTINCT LABEL FROM "DATA"."PeceDaily"')
+        else:
+            queries.append('SELECT DISTINCT COALESCE(NAZEV_VYKON, SEGMENT_NAZEV) FROM "DATA"."Pece"')
+        with get_db_connection() as conn:
+            for query in queries:
+                for row in conn.execute(text(query)).fetchall():
+                    if row[0]:
+                        LABELS.intern(str(row[0]))
+        self.ensure(len(LABELS) - 1)
+        logger.info(f"Label feature table holds {len(self)} labels")
+        return len(self)
+
+
+class DepartmentCategories:
+    """Memoised categorize_department per department id (index 0 of the table is id -1 / None)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.table = np.array([_CATEGORY_IDS["OTHER"]], dtype=np.int8)
+
+    def ensure(self, max_id: int) -> None:
+        if max_id + 1 < len(self.table):
+            return
+        with self._lock:
+            start = len(self.table) - 1
+            strings = DEPARTMENTS.strings[start:max(max_id + 1, len(DEPARTMENTS))]
+            if strings:
+                extra = np.array([_CATEGORY_IDS[categorize_department(d)] for d in strings], dtype=np.int8)
+                self.table = np.concatenate([self.table, extra])
+
+    def lookup(self, dept_ids: np.ndarray) -> np.ndarray:
+        return self.table[dept_ids + 1]
+
+
+label_features = LabelFeatures()
+department_categories = DepartmentCategories()
+
+
+def timeline_label_ids(events) -> np.ndarray:
+    """Label ids of a PatientTimeline, or of a list of events with .label."""
+    if isinstance(events, PatientTimeline):
+        return events.label_id
+    return label_features.label_ids(e.label for e in events)
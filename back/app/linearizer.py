@@ -0,0 +1,188 @@
+# linearizer.py - Columnar linearisation engine for processor.linearize_patient_history
+#
+# Produces exactly the same profile strings as the per-event implementation in processor.py,
+# but works on PatientTimeline columns: keyword checks and department categories come from the
+# per-label / per-department tables in label_features.py, and each profile section is a NumPy
+# gather or reduction over the event columns instead of a Python loop with substring scans.
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from dto.response.HealthService import HealthServiceType
+from timeline import PatientTimeline, TYPE_CODES, LABELS, DEPARTMENTS
+from processor import CRITICAL_KEYWORDS, MAX_PROFILE_LENGTH, Events, compute_care_intensity
+from label_features import (
+    label_features, department_categories, DEPARTMENT_CATEGORIES, IGNORED, PALLIATIVE, ESCALATION,
+)
+
+_MEDICATION = TYPE_CODES[HealthServiceType.MEDICATION]
+_HOSPITALIZATION = TYPE_CODES[HealthServiceType.HOSPITALIZATION]
+
+
+def _as_timeline(events: Events) -> PatientTimeline:
+    """Columns for a PatientTimeline or a list of events, keeping the given event order."""
+    if isinstance(events, PatientTimeline):
+        return events
+    return PatientTimeline(
+        np.array([e.date for e in events], dtype=np.int32),
+        np.array([TYPE_CODES[e.type] for e in events], dtype=np.int8),
+        np.array([LABELS.intern(e.label) for e in events], dtype=np.int32),
+        np.array([DEPARTMENTS.intern(e.department or None) for e in events], dtype=np.int32),
+        np.zeros(len(events), dtype=np.int32),
+        np.full(len(events), -1, dtype=np.int32),
+    )
+
+
+def _critical_section(critical_masks: np.ndarray) -> str:
+    # Counter order in extract_critical_markers: first event containing the keyword,
+    # ties within one event in CRITICAL_KEYWORDS order; then a stable sort by count
+    rows = np.flatnonzero(critical_masks)
+    if len(rows) == 0:
+        return ""
+    masks = critical_masks[rows]
+    found = []
+    for bit, keyword in enumerate(CRITICAL_KEYWORDS):
+        hits = (masks >> bit) & 1
+        count = int(hits.sum())
+        if count:
+            found.append((int(rows[int(np.argmax(hits))]), bit, keyword, count))
+    found.sort()
+    top = sorted(found, key=lambda x: -x[3])[:5]
+    return " ".join(f"{keyword}:{count}" for _, _, keyword, count in top)
+
+
+def _departments_section(categories: np.ndarray, top_n: int = 4) -> str:
+    # Counter.most_common order: count desc, ties by first occurrence
+    unique, first, counts = np.unique(categories, return_index=True, return_counts=True)
+    order = sorted(range(len(unique)), key=lambda i: (-counts[i], first[i]))[:top_n]
+    return " ".join(f"{DEPARTMENT_CATEGORIES[unique[i]]}:{counts[i]}" for i in order)
+
+
+def _trajectory(dates: np.ndarray, label_ids: np.ndarray) -> str:
+    n = len(dates)
+    if n < 6:
+        return "LIMITED_DATA"
+    third = n // 3
+
+    def span(lo, hi):
+        if hi - lo < 2:
+            return 1
+        return max(1, int(dates[hi - 1]) - int(dates[lo]))
+
+    early_density = third / span(0, third)
+    late_density = (n - 2 * third) / span(2 * third, n)
+
+    late = label_ids[2 * third:]
+    late_flags = np.bitwise_or.reduce(label_features.flags[late])
+    if late_flags & PALLIATIVE:
+        return "END_OF_LIFE"
+    elif late_flags & ESCALATION:
+        return "ESCALATING"
+    elif late_density > early_density * 1.5:
+        return "INTENSIFYING"
+    elif late_density < early_density * 0.5:
+        return "IMPROVING"
+    else:
+        return "STABLE"
+
+
+def _recent_section(timeline: PatientTimeline, categories: np.ndarray, max_events: int = 4) -> str:
+    significant = ((label_features.flags[timeline.label_id] & IGNORED) == 0) & (timeline.type_code != _MEDICATION)
+    rows = np.flatnonzero(significant)[-max_events:]
+    short_labels = label_features.short_labels
+    return " | ".join(
+        f"T{int(timeline.date[i]):+d}:{DEPARTMENT_CATEGORIES[categories[i]]}:{short_labels[timeline.label_id[i]]}"
+        for i in rows.tolist()
+    )
+
+
+def linearize(events: Events, patient_id: str = None) -> str:
+    """Columnar equivalent of processor.linearize_patient_history (byte-identical output)."""
+    if not len(events):
+        return "PROFILE:EMPTY | No recorded history"
+    timeline = _as_timeline(events)
+    label_features.ensure(int(timeline.label_id.max()))
+    department_categories.ensure(int(timeline.dept_id.max()))
+    return _profile(timeline, patient_id)
+
+
+def _profile(timeline: PatientTimeline, patient_id: Optional[str],
+             categories: Optional[np.ndarray] = None, critical_masks: Optional[np.ndarray] = None,
+             top_departments: int = 4, recent_events: int = 4, max_length: int = MAX_PROFILE_LENGTH) -> str:
+    dates = timeline.date
+    total_events = len(dates)
+    span_days = int(dates.max()) - int(dates.min())
+    hosp_count = int(np.count_nonzero(timeline.type_code == _HOSPITALIZATION))
+    intensity = compute_care_intensity(timeline, span_days)
+    trajectory = _trajectory(dates, timeline.label_id)
+    if categories is None:
+        categories = department_categories.lookup(timeline.dept_id)
+    if critical_masks is None:
+        critical_masks = label_features.critical[timeline.label_id]
+
+    header = f"[PROFILE] Events:{total_events} Span:{span_days}d Hosp:{hosp_count} Intensity:{intensity}"
+    if patient_id:
+        header = f"PID:{patient_id} " + header
+    parts = [header]
+
+    dept_str = _departments_section(categories, top_departments)
+    if dept_str:
+        parts.append(f"[DEPTS] {dept_str}")
+
+    crit_str = _critical_section(critical_masks)
+    if crit_str:
+        parts.append(f"[CRITICAL] {crit_str}")
+
+    parts.append(f"[TRAJECTORY] {trajectory}")
+
+    recent = _recent_section(timeline, categories, recent_events)
+    if recent:
+        parts.append(f"[RECENT] {recent}")
+
+    profile = " ".join(parts)
+    if len(profile) > max_length:
+        profile = profile[:max_length-3] + "..."
+    return profile
+
+
+def linearize_batch(histories: Sequence[Events], patient_ids: Optional[Sequence[str]] = None,
+                    top_departments: int = 4, recent_events: int = 4,
+                    max_length: int = MAX_PROFILE_LENGTH) -> List[str]:
+    """
+    Linearises many patients at once. Feature tables are grown once for the whole batch and
+    the department/critical gathers run over the concatenated columns; per-patient work is
+    reduced to slicing those arrays.
+    top_departments, recent_events and max_length size the [DEPTS] and [RECENT] sections and
+    the whole profile; the defaults give the production profiles (see sweep.py for tuning).
+    """
+    if patient_ids is None:
+        patient_ids = [None] * len(histories)
+    timelines = [_as_timeline(events) for events in histories]
+    lengths = np.array([len(t) for t in timelines], dtype=np.int64)
+    if lengths.sum() == 0:
+        return ["PROFILE:EMPTY | No recorded history"] * len(timelines)
+
+    label_ids = np.concatenate([t.label_id for t in timelines])
+    dept_ids = np.concatenate([t.dept_id for t in timelines])
+    label_features.ensure(int(label_ids.max()))
+    department_categories.ensure(int(dept_ids.max()))
+    categories = department_categories.lookup(dept_ids)
+    critical_masks = label_features.critical[label_ids]
+
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    profiles = []
+    for i, (timeline, pid) in enumerate(zip(timelines, patient_ids)):
+        if not lengths[i]:
+            profiles.append("PROFILE:EMPTY | No recorded history")
+            continue
+        lo, hi = offsets[i], offsets[i + 1]
+        profiles.append(_profile(timeline, pid, categories[lo:hi], critical_masks[lo:hi],
+                                 top_departments, recent_events, max_length))
+    return profiles
+
+
+def linearize_batch_for_query(histories: Sequence[Events], **profile_options) -> List[str]:
+    """Batch equivalent of processor.linearize_for_query (profile_options as in linearize_batch)."""
+    return linearize_batch([events[-100:] if len(events) > 100 else events for events in histories],
+                           **profile_options)
@@ -1,5 +1,8 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Body, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Literal
+import asyncio
 import json
 import logging
 
@@ -16,10 +19,17 @@ from dto.response.patient.PatientHistory import PatientHistory
 from dto.response.patient.PatientFuture import PatientFuture
 from dto.response.EWS import EWS
 from fastapi.middleware.cors import CORSMiddleware
-from vector_engine import vector_engine
-from database import get_patient_events, search_suggestions
+from vector_engine import vector_engine, SearchMode
+from database import event_cache, invalidate_patient_cache, get_pool_stats
+from database_async import get_patient_timeline_async, get_patient_history_async, search_suggestions_async
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from executors import io_pool, cpu_pool, PoolSaturated, pool_stats
+from suggest_index import suggest_index
+from label_features import label_features
+from timeline_rollup import get_history_rollup
+from responses import FastJSONResponse, dumps_lines, GZIP_MINIMUM_SIZE, GZIP_LEVEL
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +39,21 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# History and trajectory payloads are large and repetitive (labels, detail keys); NDJSON streams are compressed per chunk
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    # Shed load instead of queueing without bound, so latency of admitted requests stays bounded
+    return JSONResponse(status_code=429, headers={"Retry-After": "1"},
+                        content={"detail": f"Server busy ({exc.pool} pool saturated), retry later"})
+
+@app.exception_handler(PoolTimeoutError)
+async def db_pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # No IRIS connection became free within DB_POOL_TIMEOUT
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                        content={"detail": "Database connection pool exhausted, retry later"})
+
 @app.on_event("startup")
 def save_openapi():
     with open("openapi.json", "w") as f:
@@ -36,14 +61,47 @@ def save_openapi():
     # Optional: Trigger indexing on startup
     # vector_engine.index_patients()
 
+@app.on_event("startup")
+def load_ann_index():
+    # Without the in-process index, similarity search falls back to the exact SQL scan
+    try:
+        vector_engine.load_index()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Failed to load ANN index, using SQL search: {e}")
+
+@app.on_event("startup")
+def preload_label_features():
+    # Classify all known labels once; anything missing is still classified on first use
+    try:
+        label_features.preload()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Failed to preload label features: {e}")
+
+@app.on_event("startup")
+def start_suggest_index():
+    # Built in the background; /suggest uses the SQL search until the first build finishes
+    suggest_index.start_refresh()
+
+def rebuild_after_reload():
+    # Reloads everything derived from the whole dataset (see invalidate_cache)
+    load_ann_index()
+    preload_label_features()
+    try:
+        suggest_index.build()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Failed to rebuild suggest index: {e}")
+
 @app.get("/suggest", response_model=list[SuggestResult])
 async def suggest(query: str = ""):
     if not query:
         return []
 
-    # Use the real database search implemented in database.py
-    results = search_suggestions(query)
-    return JSONResponse(content=[r.model_dump() for r in results])
+    if suggest_index.ready:
+        results = suggest_index.search(query)
+    else:
+        # Use the real database search implemented in database.py
+        results = await search_suggestions_async(query)
+    return FastJSONResponse(content=[r.model_dump() for r in results])
 
 @app.get("/patients", description="Get list of patients", response_model=list[Patient])
 async def get_patients():
@@ -55,33 +113,77 @@ async def get_patients():
 
 @app.get("/patients/{patient_id}", description="Get detail of a patient", response_model=Patient)
 async def get_patient(patient_id):
-    return JSONResponse(content={
+    return FastJSONResponse(content={
         "patient_id": 234321,
         "name": "Franz Kafka"
     })
 
+HistoryFormat = Literal["json", "ndjson"]
+HistoryResolution = Literal["event", "day", "week", "month"]
+NDJSON_CHUNK_EVENTS = 500
+
+
+def _ndjson_lines(timeline):
+    # Serialised in chunks so the first events go out before the whole history is encoded
+    for start in range(0, len(timeline), NDJSON_CHUNK_EVENTS):
+        yield dumps_lines(timeline[start:start + NDJSON_CHUNK_EVENTS].to_api_dicts())
+
+
+def _ndjson_buckets(buckets):
+    yield dumps_lines(buckets)
+
+
 @app.get("/patients/{patient_id}/history", description="Get history of this patient", response_model=PatientHistory)
-async def get_patient_history(patient_id):
-    events = get_patient_events(patient_id)
-    
+async def get_patient_history(patient_id, from_day: int = None, to_day: int = None,
+                              limit: int = Query(None, ge=1), cursor: str = None,
+                              response_format: HistoryFormat = Query("json", alias="format"),
+                              resolution: HistoryResolution = "event"):
+    """
+    Returns the patient's health services in date order.
+
+    Args:
+        from_day / to_day: Only events within this window of days (inclusive)
+        limit: Page size; pages go from the newest events towards older ones and always
+               end on a day boundary, so a page may hold a few more than `limit` events
+        cursor: next_cursor of the previous page
+        format: "json" (one document) or "ndjson" (one event per line, streamed;
+                the next cursor is sent in the X-Next-Cursor header)
+        resolution: "event" (every health service) or "day" / "week" / "month": per-bucket
+                    counts by type and department category in `buckets` instead of the events
+                    (buckets are 1 / 7 / 30 days aligned at day 0; limit and cursor are ignored)
+    """
+    before_day = None
+    if cursor is not None:
+        try:
+            before_day = int(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if resolution != "event":
+        buckets = await io_pool.run(get_history_rollup, patient_id, resolution, from_day, to_day)
+        if response_format == "ndjson":
+            return StreamingResponse(_ndjson_buckets(buckets), media_type="application/x-ndjson")
+        return FastJSONResponse(content={"received_health_services": [], "buckets": buckets})
+
+    timeline, next_before_day = await get_patient_history_async(patient_id, limit, before_day, from_day, to_day)
+    next_cursor = str(next_before_day) if next_before_day is not None else None
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+
+    if response_format == "ndjson":
+        return StreamingResponse(_ndjson_lines(timeline), media_type="application/x-ndjson", headers=headers)
+
     # Map database events to API response format
-    api_events = [
-        {
-            "label": event.label,
-            "type": event.type,  # Already a HealthServiceType from database layer
-            "delta_days": event.date,
-            "detail": event.detail
-        }
-        for event in events
-    ]
+    api_events = timeline.to_api_dicts()
         
-    return JSONResponse(content={
-        "received_health_services": api_events
-    })
+    return FastJSONResponse(content={
+        "received_health_services": api_events,
+        "next_cursor": next_cursor
+    }, headers=headers)
 
 
 @app.get("/patients/{patient_id}/futures", description="Get possible future trajectories for this patient", response_model=list[PatientFuture])
-async def get_patient_futures(patient_id: str, snapshot_events: int = None, top_k: int = 5):
+async def get_patient_futures(patient_id: str, snapshot_events: int = None, top_k: int = 5, search: SearchMode = "ann",
+                              reuse_stored_embedding: bool = False):
     """
     Returns k complete future trajectories based on similar patients.
     Each trajectory is a real patient's actual journey - coherent and realistic.
@@ -94,28 +196,75 @@ async def get_patient_futures(patient_id: str, snapshot_events: int = None, top_
         snapshot_events: Number of events to use as "current state" (default: all events).
                         Use this to simulate "what if we queried at event N?"
         top_k: Number of trajectory completions to return (default: 5)
+        search: Similarity backend - "ann" (in-process index, default; exact unless
+                ANN_INDEX_TYPE=ivf) or "sql" (exact scan in IRIS)
+        reuse_stored_embedding: Query with the patient's indexed embedding instead of encoding
+                                the profile (only when snapshot_events is not set)
     """
     # Get patient's complete history
-    history = get_patient_events(patient_id)
+    # Blocking work runs on bounded pools: IRIS round-trips on the io pool (the three
+    # history tables concurrently), profile linearisation and encoding on the cpu pool
+    # (429 when either is saturated)
+    history = await get_patient_timeline_async(patient_id)
 
     if not history:
-        return JSONResponse(content=[])
+        return FastJSONResponse(content=[])
+
+    reuse_stored_embedding = reuse_stored_embedding and snapshot_events is None
+    snapshot = history[:snapshot_events] if snapshot_events is not None else history
+    if not snapshot:
+        return FastJSONResponse(content=[])
+    query_pool = io_pool if reuse_stored_embedding else cpu_pool
+    query_embedding = await query_pool.run(
+        vector_engine.get_query_embedding, snapshot, patient_id, reuse_stored_embedding
+    )
     
     # Get future trajectories using event-count alignment
-    trajectories = vector_engine.get_future_trajectories(
+    trajectories = await io_pool.run(
+        vector_engine.get_future_trajectories,
         patient_history=history,
         snapshot_events=snapshot_events,
-        top_k=top_k
+        top_k=top_k,
+        search=search,
+        patient_id=patient_id,
+        query_embedding=query_embedding
     )
     
-    return JSONResponse(content=trajectories)
+    return FastJSONResponse(content=trajectories)
+
+
+@app.get("/metrics", description="Runtime cache, index, executor and connection pool statistics")
+async def get_metrics():
+    return FastJSONResponse(content={
+        "event_cache": event_cache.stats(),
+        "vector_engine": vector_engine.stats(),
+        "executors": pool_stats(),
+        "db_pool": get_pool_stats(),
+        "suggest_index": suggest_index.stats()
+    })
+
+
+@app.post("/cache/invalidate", description="Drop cached patient timelines (all when patient_ids is omitted), e.g. after a data reload")
+async def invalidate_cache(patient_ids: list[str] | None = Body(None, embed=True)):
+    removed = invalidate_patient_cache(patient_ids)
+    if patient_ids is None:
+        # Full reload: new patients, DRGs or departments may have appeared, and load_data.sql
+        # recreates DATA.PatientEmbeddings. Drop the in-process index right away (search and
+        # stored embeddings fall back to SQL) and rebuild it with the suggest index and labels.
+        vector_engine.ann_index = None
+        try:
+            io_pool.submit(rebuild_after_reload)
+        except PoolSaturated:
+            # The caches are already dropped, so rebuild before answering rather than with a 429
+            await asyncio.to_thread(rebuild_after_reload)
+    return FastJSONResponse(content={"invalidated": removed})
 
 
 @app.get("/patients/{patient_id}/ews",
          description="Get a list of possible DRGs that could happen to this person within given time frame",
          response_model=list[EWS])
 async def get_patient_ews(patient_id):
-    return JSONResponse(content=[
+    return FastJSONResponse(content=[
         {
             "drg": {
                 "code": "06-F03",
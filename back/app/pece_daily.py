@@ -0,0 +1,111 @@
+# pece_daily.py - Refresh and check DATA.PeceDaily, the pre-aggregated daily care table
+#
+# load_data.sql creates and fills DATA.PeceDaily right after loading DATA.Pece.
+# Use `refresh` after changing DATA.Pece or DATA.CiselnikHVLP outside load_data.sql,
+# and `compare` to check row counts and loader latency against the raw GROUP BY path.
+
+import time
+from random import sample
+
+from sqlalchemy import text
+
+from database import get_db_connection, MEDICATION_DICTIONARY_SQL, _fetch_patient_timelines
+
+# Same statement as the INSERT in load_data.sql: one row per patient, day, label, TYPVYK and KOD,
+# with medication codes resolved like database._care_label does for PECE_SOURCE="raw"
+REFRESH_SQL = text(f"""
+    INSERT INTO DATA.PeceDaily (ID_PACIENT, DNY_OD_ZAKLADNI_PECE, LABEL, TYPVYK, KOD, POCET, ODB_NAZEV)
+    SELECT g.ID_PACIENT, g.DNY_OD_ZAKLADNI_PECE,
+        CASE
+            WHEN g.TYPVYK IN ('1', '2') AND g.KOD IS NOT NULL AND g.KOD <> '' AND m.NAZEV IS NOT NULL THEN m.NAZEV
+            WHEN g.TYPVYK IN ('1', '2') AND g.KOD IS NOT NULL AND g.KOD <> ''
+                AND (g.LABEL = '' OR g.LABEL = 'Unknown Care') THEN 'Unknown Medication'
+            ELSE g.LABEL
+        END,
+        g.TYPVYK, g.KOD, g.N, g.ODB_NAZEV
+    FROM (
+        SELECT ID_PACIENT, DNY_OD_ZAKLADNI_PECE,
+            COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care') AS LABEL,
+            TYPVYK, KOD, COUNT(*) AS N, MIN(ODB_NAZEV) AS ODB_NAZEV
+        FROM DATA.Pece
+        GROUP BY ID_PACIENT, DNY_OD_ZAKLADNI_PECE, COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care'), TYPVYK, KOD
+    ) g
+    LEFT JOIN ({MEDICATION_DICTIONARY_SQL}) m ON m.KOD = g.KOD
+    ORDER BY g.ID_PACIENT, g.DNY_OD_ZAKLADNI_PECE
+""")
+
+
+def refresh() -> int:
+    """Rebuilds DATA.PeceDaily from DATA.Pece in one transaction. Returns the new row count."""
+    t0 = time.time()
+    with get_db_connection() as conn:
+        conn.execute(text("DELETE FROM DATA.PeceDaily"))
+        conn.execute(REFRESH_SQL)
+        conn.commit()
+        rows = conn.execute(text("SELECT COUNT(*) FROM DATA.PeceDaily")).scalar()
+    print(f"Refreshed DATA.PeceDaily: {rows} rows in {time.time()-t0:.1f}s")
+    print("Running backends keep cached timelines; POST /cache/invalidate to drop them.")
+    return rows
+
+
+def _timeline_rows(timeline) -> list:
+    # Same-day rows may come back in a different order from the two sources
+    return sorted((e.date, e.type.value, e.label, e.department or "", e.count, e.extra or "") for e in timeline)
+
+
+def compare(patients: int = 50, batch_size: int = 10):
+    """
+    Row counts of DATA.Pece vs DATA.PeceDaily, and timeline loader latency/equality
+    for a random patient sample on both sources.
+    """
+    with get_db_connection() as conn:
+        raw_rows = conn.execute(text("SELECT COUNT(*) FROM DATA.Pece")).scalar()
+        daily_rows = conn.execute(text("SELECT COUNT(*) FROM DATA.PeceDaily")).scalar()
+        patient_ids = [row[0] for row in conn.execute(text("SELECT ID_PACIENT FROM DATA.Pacienti")).fetchall()]
+
+    print(f"\n{'='*70}")
+    print("PECE DAILY AGGREGATE COMPARISON")
+    print(f"{'='*70}")
+    print(f"DATA.Pece rows:      {raw_rows:>12}")
+    print(f"DATA.PeceDaily rows: {daily_rows:>12}  ({daily_rows / max(raw_rows, 1):.1%} of raw)")
+
+    sampled = sample(patient_ids, min(patients, len(patient_ids)))
+    batches = [sampled[i:i + batch_size] for i in range(0, len(sampled), batch_size)]
+    seconds = {"raw": 0.0, "daily": 0.0}
+    timelines = {"raw": {}, "daily": {}}
+    for i, batch in enumerate(batches):
+        # Alternate the order so neither source always runs on a warm IRIS buffer cache
+        for source in ("raw", "daily") if i % 2 == 0 else ("daily", "raw"):
+            t0 = time.perf_counter()
+            timelines[source].update(_fetch_patient_timelines(batch, pece_source=source))
+            seconds[source] += time.perf_counter() - t0
+
+    mismatches = [pid for pid in sampled
+                  if _timeline_rows(timelines["raw"][pid]) != _timeline_rows(timelines["daily"][pid])]
+    events = sum(len(t) for t in timelines["daily"].values())
+
+    print(f"Sample: {len(sampled)} patients, {events} events, batches of {batch_size}")
+    for source in ("raw", "daily"):
+        print(f"  {source:<6} {seconds[source] / max(len(batches), 1) * 1000:10.1f} ms/batch")
+    if seconds["daily"] > 0:
+        print(f"  Speedup: {seconds['raw'] / seconds['daily']:.1f}x")
+    print(f"Timelines differing: {len(mismatches)}" + (f" (e.g. {mismatches[:5]})" if mismatches else ""))
+    print(f"{'='*70}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the DATA.PeceDaily aggregate table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("refresh", help="Rebuild DATA.PeceDaily from DATA.Pece")
+    compare_parser = subparsers.add_parser("compare", help="Row counts and loader latency, raw vs daily")
+    compare_parser.add_argument("--patients", type=int, default=50, help="Patients to sample")
+    compare_parser.add_argument("--batch-size", type=int, default=10, help="Patients per loader call")
+
+    args = parser.parse_args()
+    if args.command == "refresh":
+        refresh()
+    elif args.command == "compare":
+        compare(patients=args.patients, batch_size=args.batch_size)
@@ -1,9 +1,14 @@
 # processor.py - Fixed-Size Semantic Profile for Patient Events
 
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Union
 from collections import Counter, defaultdict
 from database import PatientEvent
 from dto.response.HealthService import HealthServiceType
+from timeline import PatientTimeline
+
+# Processor functions accept either PatientEvent lists or columnar timelines
+# (both expose .date, .type, .label and .department per event and support slicing)
+Events = Union[List[PatientEvent], PatientTimeline]
 
 # --- Configuration ---
 
@@ -51,7 +56,7 @@ def categorize_department(dept: str) -> str:
     return "OTHER"
 
 
-def extract_critical_markers(events: List[PatientEvent]) -> Dict[str, int]:
+def extract_critical_markers(events: Events) -> Dict[str, int]:
     """Count occurrences of critical keywords across all events."""
     markers = Counter()
     for event in events:
@@ -62,7 +67,7 @@ def extract_critical_markers(events: List[PatientEvent]) -> Dict[str, int]:
     return dict(markers)
 
 
-def compute_care_intensity(events: List[PatientEvent], span_days: int) -> str:
+def compute_care_intensity(events: Events, span_days: int) -> str:
     """Classify care intensity based on event density."""
     if span_days <= 0:
         return "ACUTE"
@@ -77,7 +82,7 @@ def compute_care_intensity(events: List[PatientEvent], span_days: int) -> str:
         return "LOW"
 
 
-def detect_trajectory(events: List[PatientEvent]) -> str:
+def detect_trajectory(events: Events) -> str:
     """
     Detect care trajectory pattern based on event density over time.
     Split timeline into thirds and compare density.
@@ -119,17 +124,17 @@ def detect_trajectory(events: List[PatientEvent]) -> str:
         return "STABLE"
 
 
-def get_top_departments(events: List[PatientEvent], top_n: int = 5) -> List[Tuple[str, int]]:
+def get_top_departments(events: Events, top_n: int = 5) -> List[Tuple[str, int]]:
     """Get top department categories by event count."""
     category_counts = Counter()
     for event in events:
-        dept = event.detail.get("department", "")
+        dept = event.department
         category = categorize_department(dept)
         category_counts[category] += 1
     return category_counts.most_common(top_n)
 
 
-def get_recent_significant_events(events: List[PatientEvent], max_events: int = 5) -> List[str]:
+def get_recent_significant_events(events: Events, max_events: int = 5) -> List[str]:
     """Get the most recent significant (non-routine) events."""
     significant = []
     for event in reversed(events):
@@ -141,7 +146,7 @@ def get_recent_significant_events(events: List[PatientEvent], max_events: int =
         if event.type == HealthServiceType.MEDICATION:
             continue
         
-        dept = event.detail.get("department", "")
+        dept = event.department
         category = categorize_department(dept)
         
         # Truncate long labels
@@ -154,7 +159,17 @@ def get_recent_significant_events(events: List[PatientEvent], max_events: int =
     return list(reversed(significant))
 
 
-def linearize_patient_history(events: List[PatientEvent], patient_id: str = None) -> str:
+def linearize_patient_history(events: Events, patient_id: str = None) -> str:
+    """
+    Creates a fixed-size semantic profile from patient events.
+    Runs the columnar engine in linearizer.py, which produces the same string as
+    linearize_patient_history_reference with per-label memoised keyword checks.
+    """
+    from linearizer import linearize
+    return linearize(events, patient_id)
+
+
+def linearize_patient_history_reference(events: Events, patient_id: str = None) -> str:
     """
     Creates a fixed-size semantic profile from patient events.
     Guaranteed to fit in embedding model context window.
@@ -232,7 +247,7 @@ def linearize_patient_history(events: List[PatientEvent], patient_id: str = None
     return profile
 
 
-def linearize_for_query(events: List[PatientEvent]) -> str:
+def linearize_for_query(events: Events) -> str:
     """
     Query-optimized profile - same as regular but focuses on recent state.
     Uses last 100 events max for trajectory calculation.
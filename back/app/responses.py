@@ -0,0 +1,42 @@
+# responses.py - Fast JSON encoding for API responses
+#
+# History and trajectory payloads are lists of thousands of small dicts; the stdlib encoder
+# behind JSONResponse spends most of the request time on them. orjson (a declared backend
+# dependency) encodes the same documents several times faster; should it be missing, e.g. in
+# a bare scripting environment, the stdlib encoder produces the same output shape.
+
+import json
+import os
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Declared in pyproject.toml; the stdlib encoder is only a fallback
+    orjson = None
+
+# Responses smaller than this are sent uncompressed (GZipMiddleware minimum_size)
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def dumps(content: Any) -> bytes:
+    """UTF-8 JSON bytes, via orjson when available (numpy values are serialised as well)."""
+    if orjson is not None:
+        return orjson.dumps(content, option=_ORJSON_OPTIONS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_lines(items) -> bytes:
+    """NDJSON chunk: one JSON document per line."""
+    return b"".join(dumps(item) + b"\n" for item in items)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse with the encoder above; the documents themselves are unchanged."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,105 @@
+# sequence_metrics.py - Longest-common-subsequence kernels for the backtest sequence metrics
+#
+# evaluate.py compares label and type sequences of thousands of events per patient. Instead of
+# the full (m+1) x (n+1) DP table, short pairs use a two-row DP (O(min(m, n)) memory) and long
+# pairs the bit-parallel LCS of Allison-Dix / Hyyrö: one Python big integer holds a DP row as a
+# bit vector, so each step over the other sequence is a handful of word-parallel operations.
+# Symbols only need to be hashable; integer ids (LABELS / TYPE_CODES) are the cheapest.
+
+from typing import Dict, Hashable, List, Sequence
+
+import numpy as np
+
+# Pairs with fewer DP cells than this use the two-row DP (big-int setup costs more there)
+BIT_PARALLEL_MIN_CELLS = 256
+
+
+def _as_list(seq) -> list:
+    return seq.tolist() if isinstance(seq, np.ndarray) else list(seq)
+
+
+def lcs_length_full_table(seq1: Sequence[Hashable], seq2: Sequence[Hashable]) -> int:
+    """Textbook DP over the full table (the former evaluate.compute_lcs_length), for reference."""
+    m, n = len(seq1), len(seq2)
+    if m == 0 or n == 0:
+        return 0
+    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if seq1[i-1] == seq2[j-1]:
+                dp[i][j] = dp[i-1][j-1] + 1
+            else:
+                dp[i][j] = max(dp[i-1][j], dp[i][j-1])
+    return dp[m][n]
+
+
+def lcs_length_two_row(seq1: Sequence[Hashable], seq2: Sequence[Hashable]) -> int:
+    """The same DP keeping only the previous row, over the shorter sequence."""
+    a, b = _as_list(seq1), _as_list(seq2)
+    if len(b) > len(a):
+        a, b = b, a
+    if not b:
+        return 0
+    prev = [0] * (len(b) + 1)
+    for x in a:
+        cur = [0]
+        for j, y in enumerate(b):
+            if x == y:
+                cur.append(prev[j] + 1)
+            else:
+                left, up = cur[j], prev[j + 1]
+                cur.append(left if left > up else up)
+        prev = cur
+    return prev[-1]
+
+
+def _match_masks(seq: list) -> Dict[Hashable, int]:
+    """Bit j of masks[symbol] is set where seq[j] == symbol."""
+    positions: Dict[Hashable, List[int]] = {}
+    for j, symbol in enumerate(seq):
+        positions.setdefault(symbol, []).append(j)
+    masks = {}
+    for symbol, js in positions.items():
+        bits = np.zeros(len(seq), dtype=np.uint8)
+        bits[js] = 1
+        masks[symbol] = int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+    return masks
+
+
+def lcs_length_bit_parallel(seq1: Sequence[Hashable], seq2: Sequence[Hashable]) -> int:
+    """
+    Bit-parallel LCS (Hyyrö 2004): V holds the complemented DP row differences over the longer
+    sequence; per symbol of the shorter one, U = V & M[symbol] and V = (V + U) | (V - U).
+    The LCS length is the number of zero bits left in V. O(m * n / 64) word operations.
+    """
+    a, b = _as_list(seq1), _as_list(seq2)
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return 0
+    masks = _match_masks(b)
+    full = (1 << len(b)) - 1
+    v = full
+    for symbol in a:
+        m = masks.get(symbol)
+        if m is None:
+            continue
+        u = v & m
+        v = ((v + u) | (v - u)) & full
+    return len(b) - v.bit_count()
+
+
+def lcs_length(seq1: Sequence[Hashable], seq2: Sequence[Hashable]) -> int:
+    """Length of the longest common subsequence, picking the kernel by problem size."""
+    if len(seq1) == 0 or len(seq2) == 0:
+        return 0
+    if len(seq1) * len(seq2) < BIT_PARALLEL_MIN_CELLS:
+        return lcs_length_two_row(seq1, seq2)
+    return lcs_length_bit_parallel(seq1, seq2)
+
+
+def lcs_ratio(seq1: Sequence[Hashable], seq2: Sequence[Hashable]) -> float:
+    """LCS length relative to the longer sequence (0 when seq1 is empty), as in the backtest metrics."""
+    if len(seq1) == 0:
+        return 0
+    return lcs_length(seq1, seq2) / max(len(seq1), len(seq2))
@@ -0,0 +1,190 @@
+# suggest_index.py - In-memory typeahead index for /suggest
+
+import logging
+import os
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from database import get_db_connection, PECE_SOURCE
+from dto.response.SuggestResult import SuggestResult, SuggestResultType
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_INDEX_REFRESH_SECONDS = float(os.getenv("SUGGEST_INDEX_REFRESH_SECONDS", 3600))
+SUGGEST_PER_TYPE_LIMIT = int(os.getenv("SUGGEST_PER_TYPE_LIMIT", 5))
+SUGGEST_TOTAL_LIMIT = 20
+MIN_QUERY_LENGTH = 2
+
+# Result order of the types, as in database.search_suggestions
+SUGGEST_TYPES = (SuggestResultType.PATIENT, SuggestResultType.DRG, SuggestResultType.SERVICE_PROVIDER)
+
+
+def normalize(value: str) -> str:
+    """Accent- and case-insensitive form used for matching ("Kardiologie" == "KARDIOLOGIE", "léčba" == "lecba")."""
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _grams(value: str, n: int) -> set:
+    return {value[i:i + n] for i in range(len(value) - n + 1)}
+
+
+class _TypeIndex:
+    """
+    Substring index over one suggestion type. Labels are sorted by (length, normalised form),
+    so smaller ids are shorter labels; postings map every 2- and 3-gram to a sorted id array,
+    and a lexicographically sorted copy answers prefix queries with two bisections.
+    """
+
+    def __init__(self, labels: List[str]):
+        entries = sorted({(normalize(label), label) for label in labels if label},
+                         key=lambda entry: (len(entry[0]), entry[0], entry[1]))
+        self.normalized = [entry[0] for entry in entries]
+        self.labels = [entry[1] for entry in entries]
+        postings: Dict[str, List[int]] = {}
+        for entry_id, norm in enumerate(self.normalized):
+            for gram in _grams(norm, 2) | _grams(norm, 3):
+                postings.setdefault(gram, []).append(entry_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        lex_order = sorted(range(len(self.normalized)), key=self.normalized.__getitem__)
+        self.lex_keys = [self.normalized[i] for i in lex_order]
+        self.lex_ids = np.array(lex_order, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def _candidates(self, query: str) -> np.ndarray:
+        n = 3 if len(query) >= 3 else 2
+        lists = []
+        for gram in _grams(query, n):
+            ids = self.postings.get(gram)
+            if ids is None:
+                return np.zeros(0, dtype=np.int32)
+            lists.append(ids)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        return candidates
+
+    def search(self, query: str, limit: int) -> List[str]:
+        """
+        Ranks substring matches: exact > label prefix > word prefix > elsewhere,
+        then shorter labels first (id order).
+        """
+        # Prefix matches (ranks 0/1) first; short queries like "12" over patient ids
+        # usually fill the limit here without touching the large posting lists
+        lo = bisect_left(self.lex_keys, query)
+        hi = bisect_left(self.lex_keys, query + "\U0010ffff", lo)
+        prefix_ids = np.sort(self.lex_ids[lo:hi])
+        if len(prefix_ids) >= limit:
+            return [self.labels[entry_id] for entry_id in prefix_ids[:limit].tolist()]
+
+        ranked: List[Tuple[int, int]] = []
+        for entry_id in self._candidates(query).tolist():
+            norm = self.normalized[entry_id]
+            pos = norm.find(query)
+            if pos < 0:
+                continue  # Grams matched, but not contiguously
+            if norm == query:
+                rank = 0
+            elif pos == 0:
+                rank = 1
+            elif not norm[pos - 1].isalnum():
+                rank = 2
+            else:
+                rank = 3
+            ranked.append((rank, entry_id))
+        ranked.sort()
+        return [self.labels[entry_id] for _, entry_id in ranked[:limit]]
+
+
+class SuggestIndex:
+    """
+    Typeahead over patient ids, DRG names and department names, built from the distinct
+    values in IRIS so /suggest never runs LIKE '%q%' scans. Rebuilt periodically in a
+    background thread; a rebuild swaps the whole index at once, readers never block.
+    """
+
+    def __init__(self):
+        self._indexes: Optional[Dict[SuggestResultType, _TypeIndex]] = None
+        self._refresh_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self.built_at: Optional[float] = None
+        self.build_seconds = 0.0
+        self.queries = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._indexes is not None
+
+    def build(self) -> None:
+        """Loads the distinct values from IRIS and replaces the index."""
+        with self._refresh_lock:
+            t0 = time.time()
+            pece_table = "DATA.PeceDaily" if PECE_SOURCE == "daily" else "DATA.Pece"
+            with get_db_connection() as conn:
+                patients = [str(r[0]) for r in conn.execute(text("SELECT ID_PACIENT FROM DATA.Pacienti")).fetchall()]
+                drgs = [r[0] for r in conn.execute(text("SELECT DISTINCT DRG_NAZEV FROM DATA.Hospitalizace")).fetchall()]
+                providers = [r[0] for r in conn.execute(text(f"SELECT DISTINCT ODB_NAZEV FROM {pece_table}")).fetchall()]
+            self._indexes = {
+                SuggestResultType.PATIENT: _TypeIndex(patients),
+                SuggestResultType.DRG: _TypeIndex(drgs),
+                SuggestResultType.SERVICE_PROVIDER: _TypeIndex(providers),
+            }
+            self.built_at = time.time()
+            self.build_seconds = self.built_at - t0
+            logger.info(f"Built suggest index ({self.sizes()}) in {self.build_seconds:.2f}s")
+
+    def start_refresh(self, interval: float = SUGGEST_INDEX_REFRESH_SECONDS) -> None:
+        """Builds the index now and then every `interval` seconds in a daemon thread."""
+        if self._refresher is not None:
+            return
+
+        def refresh_loop():
+            while True:
+                try:
+                    self.build()
+                except Exception as e:
+                    logger.warning(f"Suggest index refresh failed: {e}")
+                time.sleep(interval)
+
+        self._refresher = threading.Thread(target=refresh_loop, name="suggest-index-refresh", daemon=True)
+        self._refresher.start()
+
+    def search(self, query_text: str, per_type_limit: int = SUGGEST_PER_TYPE_LIMIT) -> List[SuggestResult]:
+        """Same contract as database.search_suggestions, answered from memory."""
+        indexes = self._indexes
+        query = normalize(query_text.strip()) if query_text else ""
+        if indexes is None or len(query) < MIN_QUERY_LENGTH:
+            return []
+        self.queries += 1
+        results = []
+        for result_type in SUGGEST_TYPES:
+            for label in indexes[result_type].search(query, per_type_limit):
+                results.append(SuggestResult(label=label, type=result_type))
+        return results[:SUGGEST_TOTAL_LIMIT]
+
+    def sizes(self) -> Dict[str, int]:
+        indexes = self._indexes or {}
+        return {result_type.value: len(index) for result_type, index in indexes.items()}
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "entries": self.sizes(),
+            "built_at": self.built_at,
+            "build_seconds": round(self.build_seconds, 2),
+            "queries": self.queries,
+        }
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,284 @@
+# sweep.py - Parameter sweeps over the backtest with shared intermediate results
+#
+# Usage:
+#   python sweep.py --sample 500 --snapshot 0.3,0.5,0.7 --top-k 1,5,10 \
+#       --max-profile-length 600,900 --recent-events 2,4 --workers 4 --out sweep.csv
+#
+# Re-running evaluate.py per setting re-fetches every timeline and re-encodes every profile.
+# Here each intermediate result is computed once and keyed by the parameters it depends on:
+#   sampled patients' timelines       - once per run (loaded in the parent, shipped to workers)
+#   corpus embeddings (the index)     - linearisation parameters; the stored DATA.PatientEmbeddings
+#                                       for the production defaults, otherwise re-encoded once
+#                                       and cached on disk in --cache-dir
+#   query embeddings, neighbour lists - linearisation parameters + snapshot_pct, searched once at
+#                                       the largest top_k of the grid
+#   neighbour timelines               - once per neighbour and worker
+# Only trajectory building and scoring run per grid point. Grid points are grouped by their
+# linearisation parameters and the groups run in parallel worker processes.
+# The output has one row per (grid point, sampled patient): the grid parameters, the status
+# (OK, NO_PREDICTIONS, SKIPPED) and the evaluate.compute_patient_metrics fields.
+
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from ann_index import ExactIndex
+from database import get_batch_patient_timelines
+from evaluate import (
+    compute_patient_metrics, get_indexed_patient_ids, sample_patients, select_snapshot, summarize_results, _init_worker,
+)
+from linearizer import linearize_batch, linearize_batch_for_query
+from processor import MAX_PROFILE_LENGTH
+from vector_engine import vector_engine
+
+# Next to this module rather than in the working directory (ignored by git)
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SWEEP_CACHE_DIR = os.getenv("SWEEP_CACHE_DIR", os.path.join(_APP_DIR, ".sweep_cache"))
+SWEEP_RESULTS_DIR = os.getenv("SWEEP_RESULTS_DIR", os.path.join(_APP_DIR, "sweep_results"))
+
+# Grid parameters in output column order; the first three only affect linearisation
+LINEARIZE_PARAMS = ("max_profile_length", "top_departments", "recent_events")
+GRID_PARAMS = LINEARIZE_PARAMS + ("snapshot_pct", "top_k")
+# Production profile settings (processor.linearize_patient_history), i.e. the stored embeddings
+LINEARIZE_DEFAULTS = (MAX_PROFILE_LENGTH, 4, 4)
+
+
+def expand_grid(grid: dict) -> list:
+    """All combinations of the per-parameter value lists in `grid`, as dicts."""
+    values = [grid[name] for name in GRID_PARAMS]
+    return [dict(zip(GRID_PARAMS, combination)) for combination in itertools.product(*values)]
+
+
+def _profile_options(linearize_key: tuple) -> dict:
+    max_profile_length, top_departments, recent_events = linearize_key
+    return {"max_length": max_profile_length, "top_departments": top_departments, "recent_events": recent_events}
+
+
+def load_corpus_index(linearize_key: tuple, corpus_ids: list, cache_dir: str = SWEEP_CACHE_DIR,
+                      batch_size: int = 500) -> ExactIndex:
+    """
+    Exact index over the corpus profiles linearised with `linearize_key`. The defaults use the
+    stored embeddings; other settings re-encode every corpus patient once and keep the matrix
+    in cache_dir, keyed by the settings and the corpus ids.
+    """
+    if tuple(linearize_key) == LINEARIZE_DEFAULTS:
+        return vector_engine.load_index("exact")
+
+    corpus_ids = sorted(corpus_ids)
+    digest = hashlib.blake2b("\n".join(corpus_ids).encode("utf-8"), digest_size=8).hexdigest()
+    path = Path(cache_dir) / f"corpus_{'_'.join(map(str, linearize_key))}_{digest}.npy"
+    if path.exists():
+        embeddings = np.load(path)
+    else:
+        options = _profile_options(linearize_key)
+        chunks = []
+        for start in range(0, len(corpus_ids), batch_size):
+            batch = corpus_ids[start:start + batch_size]
+            timelines = get_batch_patient_timelines(batch, use_cache=False)
+            profiles = linearize_batch([timelines[pid] for pid in batch], batch, **options)
+            chunks.append(vector_engine.model.encode(profiles, show_progress_bar=False))
+        embeddings = np.concatenate(chunks).astype(np.float32) if chunks else np.zeros((0, 0), np.float32)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, embeddings)
+
+    index = ExactIndex()
+    index.add(corpus_ids, embeddings)
+    index.build()
+    return index
+
+
+def _load_neighbour_timelines(neighbours: list, timelines: dict, batch_size: int) -> None:
+    """Adds the timelines of neighbours not loaded yet to `timelines`."""
+    missing = [pid for pid in dict.fromkeys(pid for similar in neighbours for pid, _ in similar) if pid not in timelines]
+    for start in range(0, len(missing), batch_size):
+        timelines.update(get_batch_patient_timelines(missing[start:start + batch_size], use_cache=False))
+
+
+def run_linearize_group(linearize_key: tuple, points: list, sample_timelines: dict, corpus_ids: list,
+                        cache_dir: str = SWEEP_CACHE_DIR, batch_size: int = 500) -> list:
+    """
+    Evaluates all grid points sharing one set of linearisation parameters (one worker's task).
+    Returns the result rows of these points.
+    """
+    t0 = time.perf_counter()
+    index = load_corpus_index(linearize_key, corpus_ids, cache_dir, batch_size)
+    options = _profile_options(linearize_key)
+    max_top_k = max(point["top_k"] for point in points)
+    neighbour_timelines = {}
+    rows = []
+
+    for snapshot_pct, group in itertools.groupby(sorted(points, key=lambda p: p["snapshot_pct"]),
+                                                 key=lambda p: p["snapshot_pct"]):
+        evaluated, skipped = [], []
+        for pid, timeline in sample_timelines.items():
+            snapshot_count = select_snapshot(timeline, snapshot_pct)
+            if snapshot_count is None:
+                skipped.append(pid)
+            else:
+                evaluated.append((pid, snapshot_count))
+
+        neighbours = []
+        if evaluated:
+            snapshots = [sample_timelines[pid][:snapshot_count] for pid, snapshot_count in evaluated]
+            embeddings = vector_engine.model.encode(linearize_batch_for_query(snapshots, **options),
+                                                    batch_size=128, show_progress_bar=False)
+            # Ranked prefixes of the widest search serve every smaller top_k
+            neighbours = index.search_batch(embeddings, max_top_k * 2)
+            _load_neighbour_timelines(neighbours, neighbour_timelines, batch_size)
+
+        for point in group:
+            top_k = point["top_k"]
+            for (pid, snapshot_count), similar in zip(evaluated, neighbours):
+                trajectories = vector_engine._build_trajectories(
+                    similar[:top_k * 2], neighbour_timelines, snapshot_count, top_k)
+                result = compute_patient_metrics(pid, snapshot_count, sample_timelines[pid][snapshot_count:], trajectories)
+                result.setdefault("status", "OK")
+                result.pop("reason", None)
+                rows.append({**point, **result})
+            rows.extend({**point, "patient_id": pid, "status": "SKIPPED"} for pid in skipped)
+
+    print(f"Linearisation {dict(zip(LINEARIZE_PARAMS, linearize_key))}: "
+          f"{len(points)} grid points in {time.perf_counter() - t0:.1f}s")
+    return rows
+
+
+def write_results(rows: list, path: str) -> None:
+    """Writes the rows as CSV, or as Parquet when path ends in .parquet (needs pandas + pyarrow)."""
+    columns = list(dict.fromkeys(name for row in rows for name in row))
+    if path.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame(rows, columns=columns).to_parquet(path, index=False)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval="")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_grid_summary(rows: list) -> None:
+    """One line of mean metrics per grid point."""
+    points = {}
+    for row in rows:
+        points.setdefault(tuple(row[name] for name in GRID_PARAMS), []).append(row)
+
+    print(f"\n{'='*110}")
+    print(f"{'length':>6} {'depts':>5} {'recent':>6} {'snap':>5} {'top_k':>5} | {'n':>5} {'no_pred':>7} "
+          f"{'jaccard':>7} {'lcs':>6} {'type_lcs':>8} {'mae':>7} {'crit_rec':>8} {'outcome':>7}")
+    print(f"{'-'*110}")
+    for key, point_rows in points.items():
+        ok = [r for r in point_rows if r["status"] == "OK"]
+        no_predictions = sum(r["status"] == "NO_PREDICTIONS" for r in point_rows)
+        summary = {name: value if value is not None else float("nan")
+                   for name, value in summarize_results(ok).items()}
+
+        def mean(name):
+            return summary.get(name, float("nan"))
+
+        print(f"{key[0]:>6} {key[1]:>5} {key[2]:>6} {key[3]:>5.2f} {key[4]:>5} | {len(ok):>5} {no_predictions:>7} "
+              f"{mean('label_jaccard'):>7.1%} {mean('lcs_ratio'):>6.1%} {mean('type_lcs_ratio'):>8.1%} "
+              f"{mean('temporal_mae'):>7.1f} {mean('critical_recall'):>8.1%} {mean('outcome_accuracy'):>7.1%}")
+    print(f"{'='*110}")
+
+
+def run_sweep(grid: dict, sample_size: int = 100, seed: int = 0, workers: int = 1, out: str = None,
+              cache_dir: str = SWEEP_CACHE_DIR, batch_size: int = 500) -> list:
+    """
+    Evaluates every combination in `grid` (value lists per GRID_PARAMS name) on one seeded
+    patient sample and writes the per-patient rows to `out`. Returns the rows.
+    """
+    points = expand_grid(grid)
+    groups = {}
+    for point in points:
+        groups.setdefault(tuple(point[name] for name in LINEARIZE_PARAMS), []).append(point)
+    if out is None:
+        os.makedirs(SWEEP_RESULTS_DIR, exist_ok=True)
+        out = os.path.join(SWEEP_RESULTS_DIR, f"sweep_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+
+    print(f"\n{'='*70}")
+    print(f"EVALUATION SWEEP ({len(points)} grid points, {len(groups)} linearisation settings)")
+    print(f"{'='*70}")
+    print(f"Sample size: {sample_size} | Seed: {seed} | Workers: {workers} | Output: {out}")
+    print(f"{'='*70}\n")
+
+    t0 = time.perf_counter()
+    corpus_ids = get_indexed_patient_ids()
+    test_patients = sample_patients(corpus_ids, sample_size, seed)
+    sample_timelines = {}
+    for start in range(0, len(test_patients), batch_size):
+        sample_timelines.update(get_batch_patient_timelines(test_patients[start:start + batch_size], use_cache=False))
+    print(f"Loaded {len(sample_timelines)} sampled timelines of {len(corpus_ids)} indexed patients "
+          f"({time.perf_counter() - t0:.1f}s)")
+
+    rows = []
+    if workers > 1 and len(groups) > 1:
+        # spawn and per-worker torch threads as in evaluate.run_parallel_evaluation
+        torch_threads = max(1, (os.cpu_count() or workers) // workers)
+        with ProcessPoolExecutor(max_workers=min(workers, len(groups)), mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(torch_threads,)) as pool:
+            futures = [
+                pool.submit(run_linearize_group, key, group, sample_timelines, corpus_ids, cache_dir, batch_size)
+                for key, group in groups.items()
+            ]
+            for future in as_completed(futures):
+                rows.extend(future.result())
+    else:
+        for key, group in groups.items():
+            rows.extend(run_linearize_group(key, group, sample_timelines, corpus_ids, cache_dir, batch_size))
+
+    # Deterministic row order regardless of worker completion order
+    order = {pid: i for i, pid in enumerate(test_patients)}
+    rows.sort(key=lambda r: tuple(r[name] for name in GRID_PARAMS) + (order[r["patient_id"]],))
+
+    write_results(rows, out)
+    print_grid_summary(rows)
+    print(f"\n{len(rows)} rows written to {out} ({time.perf_counter() - t0:.1f}s)")
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def floats(value):
+        return [float(x) for x in value.split(",")]
+
+    def ints(value):
+        return [int(x) for x in value.split(",")]
+
+    parser = argparse.ArgumentParser(description="Sweep backtest parameters over a shared patient sample")
+    parser.add_argument("--sample", type=int, default=100, help="Number of patients to evaluate")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the patient sample")
+    parser.add_argument("--snapshot", type=floats, default=[0.5], help="Comma-separated snapshot percentages")
+    parser.add_argument("--top-k", type=ints, default=[5], help="Comma-separated trajectory counts")
+    parser.add_argument("--max-profile-length", type=ints, default=[MAX_PROFILE_LENGTH],
+                        help="Comma-separated profile length limits (chars)")
+    parser.add_argument("--top-departments", type=ints, default=[4], help="Comma-separated [DEPTS] sizes")
+    parser.add_argument("--recent-events", type=ints, default=[4], help="Comma-separated [RECENT] sizes")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (one per linearisation setting)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Patients per timeline fetch / corpus encode batch")
+    parser.add_argument("--cache-dir", default=SWEEP_CACHE_DIR, help="Directory for re-encoded corpus embeddings")
+    parser.add_argument("--out", default=None, help="Results file (.csv or .parquet; default: sweep_results/sweep_<timestamp>.csv)")
+
+    args = parser.parse_args()
+
+    run_sweep(
+        grid={
+            "max_profile_length": args.max_profile_length,
+            "top_departments": args.top_departments,
+            "recent_events": args.recent_events,
+            "snapshot_pct": args.snapshot,
+            "top_k": args.top_k,
+        },
+        sample_size=args.sample,
+        seed=args.seed,
+        workers=args.workers,
+        out=args.out,
+        cache_dir=args.cache_dir,
+        batch_size=args.batch_size,
+    )
@@ -0,0 +1,224 @@
+# timeline.py - Columnar representation of patient event timelines
+
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from dto.response.HealthService import HealthServiceType
+
+# HealthServiceType <-> compact integer code used in the type_code column
+HEALTH_SERVICE_TYPES = list(HealthServiceType)
+TYPE_CODES = {t: i for i, t in enumerate(HEALTH_SERVICE_TYPES)}
+
+
+class StringPool:
+    """
+    Interns strings to dense integer ids. Pools are process-wide, so the same
+    label always maps to the same id across all timelines. Id -1 stands for None.
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __getitem__(self, string_id: int) -> Optional[str]:
+        return self.strings[string_id] if string_id >= 0 else None
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        string_id = self._ids.get(value)
+        if string_id is None:
+            with self._lock:
+                string_id = self._ids.get(value)
+                if string_id is None:
+                    string_id = len(self.strings)
+                    self.strings.append(value)
+                    self._ids[value] = string_id
+        return string_id
+
+
+LABELS = StringPool()       # Event labels (DRG, spa indication, care/medication names)
+DEPARTMENTS = StringPool()  # Pece ODB_NAZEV
+DETAILS = StringPool()      # Hospitalisation termination (UKONCENI) / spa treatment type (TYP_LECBY)
+
+
+class TimelineEvent(NamedTuple):
+    """Lightweight read-only event row, attribute-compatible with PatientEvent."""
+    date: int
+    type: HealthServiceType
+    label: str
+    department: Optional[str]
+    count: int
+    extra: Optional[str]
+
+    @property
+    def detail(self) -> dict:
+        if self.type == HealthServiceType.HOSPITALIZATION:
+            return {"termination": self.extra}
+        if self.type == HealthServiceType.SPA:
+            return {"type": self.extra}
+        return {"department": self.department, "count": self.count}
+
+
+class PatientTimeline:
+    """
+    One patient's events as parallel NumPy columns, sorted by date:
+    date, type_code (index into HEALTH_SERVICE_TYPES), label_id (LABELS),
+    dept_id (DEPARTMENTS), count (aggregated Pece rows) and detail_id (DETAILS).
+    Supports len(), slicing and iteration (yielding TimelineEvent rows), so it can
+    be passed wherever a list of PatientEvent was expected.
+    """
+    __slots__ = ("date", "type_code", "label_id", "dept_id", "count", "detail_id")
+
+    COLUMNS = (
+        ("date", np.int32),
+        ("type_code", np.int8),
+        ("label_id", np.int32),
+        ("dept_id", np.int32),
+        ("count", np.int32),
+        ("detail_id", np.int32),
+    )
+
+    def __init__(self, date, type_code, label_id, dept_id, count, detail_id):
+        self.date = date
+        self.type_code = type_code
+        self.label_id = label_id
+        self.dept_id = dept_id
+        self.count = count
+        self.detail_id = detail_id
+
+    @classmethod
+    def empty(cls) -> "PatientTimeline":
+        return cls(*(np.zeros(0, dtype=dtype) for _, dtype in cls.COLUMNS))
+
+    @classmethod
+    def from_columns(cls, *columns, presorted: bool = False) -> "PatientTimeline":
+        """
+        Builds a timeline from column lists, stable-sorted by date
+        (presorted=True skips the sort for rows the database already ordered by date).
+        """
+        arrays = [np.asarray(col, dtype=dtype) for col, (_, dtype) in zip(columns, cls.COLUMNS)]
+        if not presorted:
+            order = np.argsort(arrays[0], kind="stable")
+            arrays = [arr[order] for arr in arrays]
+        for arr in arrays:
+            # Timelines are shared through the event cache, so keep them immutable
+            arr.setflags(write=False)
+        return cls(*arrays)
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return PatientTimeline(*(getattr(self, name)[key] for name, _ in self.COLUMNS))
+        return self._row(range(len(self))[key])
+
+    def __iter__(self) -> Iterator[TimelineEvent]:
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def __reversed__(self) -> Iterator[TimelineEvent]:
+        for i in range(len(self) - 1, -1, -1):
+            yield self._row(i)
+
+    def _row(self, i: int) -> TimelineEvent:
+        return TimelineEvent(
+            int(self.date[i]),
+            HEALTH_SERVICE_TYPES[self.type_code[i]],
+            LABELS.strings[self.label_id[i]],
+            DEPARTMENTS[self.dept_id[i]],
+            int(self.count[i]),
+            DETAILS[self.detail_id[i]],
+        )
+
+    def window(self, from_day: Optional[int] = None, to_day: Optional[int] = None) -> "PatientTimeline":
+        """Events with from_day <= date <= to_day (either bound optional)."""
+        lo = 0 if from_day is None else int(np.searchsorted(self.date, from_day, side="left"))
+        hi = len(self) if to_day is None else int(np.searchsorted(self.date, to_day, side="right"))
+        return self[lo:hi]
+
+    @property
+    def labels(self) -> List[str]:
+        strings = LABELS.strings
+        return [strings[i] for i in self.label_id.tolist()]
+
+    @property
+    def types(self) -> List[HealthServiceType]:
+        return [HEALTH_SERVICE_TYPES[i] for i in self.type_code.tolist()]
+
+    def __reduce__(self):
+        # Ids are only meaningful within this process's pools, so ship the strings
+        # along and re-intern them on unpickling (e.g. in a ProcessPoolExecutor worker)
+        return (_restore_timeline, (
+            self.date, self.type_code, self.count,
+            _localize(self.label_id, LABELS),
+            _localize(self.dept_id, DEPARTMENTS),
+            _localize(self.detail_id, DETAILS),
+        ))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name, _ in self.COLUMNS)
+
+    def to_api_dicts(self, anchor_day: int = 0) -> List[dict]:
+        """Serialises events to HealthService-shaped dicts (delta_days relative to anchor_day)."""
+        return [
+            {
+                "label": event.label,
+                "type": event.type.value,
+                "delta_days": event.date - anchor_day,
+                "detail": event.detail,
+            }
+            for event in self
+        ]
+
+
+def _localize(ids: np.ndarray, pool: StringPool):
+    unique, inverse = np.unique(ids, return_inverse=True)
+    return [pool[i] for i in unique.tolist()], inverse.astype(np.int32)
+
+
+def _relocalize(localized, pool: StringPool) -> np.ndarray:
+    strings, inverse = localized
+    mapping = np.array([pool.intern(s) for s in strings], dtype=np.int32)
+    return mapping[inverse] if len(mapping) else np.zeros(0, dtype=np.int32)
+
+
+def _restore_timeline(date, type_code, count, labels, departments, details) -> "PatientTimeline":
+    return PatientTimeline(
+        date, type_code,
+        _relocalize(labels, LABELS),
+        _relocalize(departments, DEPARTMENTS),
+        count,
+        _relocalize(details, DETAILS),
+    )
+
+
+class TimelineBuilder:
+    """Accumulates rows for one patient and produces a sorted PatientTimeline."""
+    __slots__ = ("columns",)
+
+    def __init__(self):
+        self.columns = tuple([] for _ in PatientTimeline.COLUMNS)
+
+    def append(self, date: Optional[int], service_type: HealthServiceType, label: str,
+               department: Optional[str] = None, count: int = 1, extra: Optional[str] = None):
+        date_col, type_col, label_col, dept_col, count_col, detail_col = self.columns
+        date_col.append(date if date is not None else 0)
+        type_col.append(TYPE_CODES[service_type])
+        label_col.append(LABELS.intern(label))
+        dept_col.append(DEPARTMENTS.intern(department))
+        count_col.append(count)
+        detail_col.append(DETAILS.intern(extra))
+
+    def build(self, presorted: bool = False) -> PatientTimeline:
+        if not self.columns[0]:
+            return PatientTimeline.empty()
+        return PatientTimeline.from_columns(*self.columns, presorted=presorted)
@@ -0,0 +1,103 @@
+# timeline_rollup.py - Bucketed history summaries for zoomed-out timeline views
+#
+# Instead of every event, /history?resolution=week|month returns one bucket per period with
+# event counts per HealthServiceType and department category. Buckets are fixed-size runs of
+# days on the relative day axis (day = 1, week = 7, month = 30 days), aligned at day 0.
+
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from database import (
+    PECE_SOURCE, event_cache, fetch_rows, _in_clause, _window_params, _timeline_union_branches,
+    _map_typvyk_to_health_service_type,
+)
+from dto.response.HealthService import HealthServiceType
+from timeline import PatientTimeline, HEALTH_SERVICE_TYPES, TYPE_CODES, DEPARTMENTS
+from label_features import department_categories, DEPARTMENT_CATEGORIES
+
+RESOLUTION_DAYS = {"day": 1, "week": 7, "month": 30}
+
+
+def _buckets(bucket_ids: np.ndarray, type_codes: np.ndarray, categories: np.ndarray,
+             counts: np.ndarray, bucket_days: int) -> List[dict]:
+    """Assembles bucket dicts from (bucket, type code, category, count) rows, in bucket order."""
+    buckets: Dict[int, dict] = {}
+    for bucket, type_code, category, count in sorted(zip(
+            bucket_ids.tolist(), type_codes.tolist(), categories.tolist(), counts.tolist())):
+        entry = buckets.get(bucket)
+        if entry is None:
+            start = bucket * bucket_days
+            entry = buckets[bucket] = {
+                "start_day": start, "end_day": start + bucket_days - 1, "total": 0, "types": {}, "categories": {},
+            }
+        type_name = HEALTH_SERVICE_TYPES[type_code].value
+        category_name = DEPARTMENT_CATEGORIES[category]
+        entry["total"] += count
+        entry["types"][type_name] = entry["types"].get(type_name, 0) + count
+        entry["categories"][category_name] = entry["categories"].get(category_name, 0) + count
+    return list(buckets.values())
+
+
+def rollup_timeline(timeline: PatientTimeline, bucket_days: int) -> List[dict]:
+    """Buckets an in-memory timeline (e.g. from event_cache)."""
+    if not len(timeline):
+        return []
+    department_categories.ensure(int(timeline.dept_id.max()))
+    categories = department_categories.lookup(timeline.dept_id)
+    keys = np.stack([timeline.date // bucket_days, timeline.type_code, categories]).astype(np.int64)
+    unique, counts = np.unique(keys, axis=1, return_counts=True)
+    return _buckets(unique[0], unique[1], unique[2], counts, bucket_days)
+
+
+def _rollup_sql(patient_id: str, bucket_days: int, from_day: Optional[int], to_day: Optional[int]) -> List[dict]:
+    """
+    Buckets in IRIS: the timeline branches grouped by (bucket, source table, TYPVYK, department),
+    so only a few rows per bucket come back; departments are mapped to categories here.
+    """
+    placeholders, bindparams = _in_clause([patient_id])
+    bindparams.update(_window_params(from_day, to_day))
+    bucket = f"FLOOR(COALESCE(u.EVENT_DAY, 0) / {int(bucket_days)})"
+    query = text(f"""
+        SELECT {bucket} AS BUCKET, u.SRC, u.TYPVYK, u.EVENT_DEPT, COUNT(*)
+        FROM ({_timeline_union_branches(placeholders, PECE_SOURCE, from_day, to_day)}) u
+        GROUP BY {bucket}, u.SRC, u.TYPVYK, u.EVENT_DEPT
+    """)
+    rows = fetch_rows(query, bindparams)
+    if not rows:
+        return []
+
+    type_codes, dept_ids = [], []
+    for row in rows:
+        if row[1] == 0:
+            service_type = HealthServiceType.HOSPITALIZATION
+        elif row[1] == 1:
+            service_type = HealthServiceType.SPA
+        else:
+            service_type = _map_typvyk_to_health_service_type(row[2])
+        type_codes.append(TYPE_CODES[service_type])
+        dept_ids.append(DEPARTMENTS.intern(row[3]))
+    dept_ids = np.array(dept_ids, dtype=np.int32)
+    department_categories.ensure(int(dept_ids.max()))
+    return _buckets(
+        np.array([int(row[0]) for row in rows], dtype=np.int64),
+        np.array(type_codes, dtype=np.int64),
+        department_categories.lookup(dept_ids).astype(np.int64),
+        np.array([int(row[4]) for row in rows], dtype=np.int64),
+        bucket_days,
+    )
+
+
+def get_history_rollup(patient_id: str, resolution: str, from_day: Optional[int] = None,
+                       to_day: Optional[int] = None) -> List[dict]:
+    """
+    Buckets of a patient's history at the given resolution ("day", "week" or "month"),
+    optionally limited to [from_day, to_day]. Uses the cached timeline when there is one,
+    otherwise aggregates in SQL without loading the events.
+    """
+    bucket_days = RESOLUTION_DAYS[resolution]
+    cached = event_cache.get_many([patient_id]).get(patient_id)
+    if cached is None:
+        return _rollup_sql(patient_id, bucket_days, from_day, to_day)
+    return rollup_timeline(cached.window(from_day, to_day), bucket_days)
@@ -1,116 +1,140 @@
-from tqdm import tqdm
+import hashlib
 import logging
+import os
 import time
+from typing import Literal
 from sentence_transformers import SentenceTransformer
 from sqlalchemy import text
-from database import get_db_connection, get_patient_events, get_batch_patient_events, PatientEvent
-from processor import linearize_patient_history, linearize_for_query
+from database import get_db_connection, get_batch_patient_timelines, get_patient_event_counts
+from processor import linearize_patient_history, linearize_for_query, Events
+from ann_index import ExactIndex, create_index, parse_vector
+from cache import LRUCache
+from encoder import BatchingEncoder
+from label_features import label_features, REGULATORY_FEE
 import json
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Similarity search backends selectable per request:
+# - "sql": exact VECTOR_DOT_PRODUCT scan in IRIS
+# - "ann": in-process index loaded from DATA.PatientEmbeddings (falls back to "sql" if not loaded)
+SearchMode = Literal["sql", "ann"]
+
+# In-process index kind: "exact" (brute-force, same neighbours as "sql") by default; "ivf" is
+# approximate (nprobe cells only) and opt-in - check its recall with `benchmark.py ann` first
+ANN_INDEX_TYPE = os.getenv("ANN_INDEX_TYPE", "exact")
+
+# Query embeddings keyed by a hash of the linearize_for_query output
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+
+# Micro-batching of concurrent query encodes
+ENCODER_MAX_BATCH_SIZE = int(os.getenv("ENCODER_MAX_BATCH_SIZE", 32))
+ENCODER_MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", 5))
+
 class VectorEngine:
     def __init__(self):
         logger.info("Initializing VectorEngine...")
         self.model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        self.ann_index: ExactIndex | None = None
+        self.query_cache = LRUCache("query_embeddings", max_entries=QUERY_EMBEDDING_CACHE_SIZE)
+        self.encoder = BatchingEncoder(self.model, max_batch_size=ENCODER_MAX_BATCH_SIZE, max_wait_ms=ENCODER_MAX_WAIT_MS)
+        self.stored_embedding_reuses = 0
         # self.index_patients() # Uncomment to run indexing on startup, or call explicitly
 
+    def load_index(self, kind: str = ANN_INDEX_TYPE, batch_size: int = 5000) -> ExactIndex:
+        """
+        Loads all stored embeddings from DATA.PatientEmbeddings into an in-process
+        nearest-neighbour index. Afterwards index_patients keeps it up to date.
+        """
+        t0 = time.time()
+        index = create_index(kind)
+        with get_db_connection() as conn:
+            result = conn.execute(text("SELECT ID_PACIENT, Embedding FROM DATA.PatientEmbeddings"))
+            while rows := result.fetchmany(batch_size):
+                index.add([row[0] for row in rows], [parse_vector(row[1]) for row in rows])
+        index.build()
+        self.ann_index = index
+        logger.info(f"Loaded {kind} index with {len(index)} embeddings in {time.time()-t0:.2f}s")
+        return index
+
 
-    def events_to_string(self, events: list[PatientEvent], patient_id: str = None) -> str:
+    def events_to_string(self, events: Events, patient_id: str = None) -> str:
         """
         Converts a list of events into a semantic string using Smart String linearization.
         Uses the enhanced processor for better signal-to-noise ratio.
         """
         return linearize_patient_history(events, patient_id)
 
-    def index_patients(self, batch_size=50, limit=None):
-        """Fetches patients without embeddings and generates them."""
+    def index_patients(self, batch_size=50, limit=None, patient_ids=None, **pipeline_options):
+        """
+        Fetches patients without embeddings and generates them.
+        Pass patient_ids together with upsert=True to re-embed specific patients in place,
+        or incremental=True to re-embed only patients whose profile fingerprint changed.
+        Runs the pipelined indexer (see indexer.PipelinedIndexer for options such as
+        fetch_workers, linearize_workers, queue_size, checkpoint_path, write_mode and upsert)
+        and returns its per-stage throughput summary.
+        """
+        from indexer import PipelinedIndexer
+
         logger.info("Starting patient indexing...")
+        indexer = PipelinedIndexer(self, batch_size=batch_size, **pipeline_options)
+        return indexer.run(patient_ids=patient_ids, limit=limit)
+
+    def encode_query(self, text_rep: str):
+        """
+        Encodes a query profile, reusing the embedding of an identical profile text.
+        Cache misses go through the batching encoder, so concurrent requests share one model call.
+        """
+        key = hashlib.blake2b(text_rep.encode("utf-8"), digest_size=16).digest()
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.encoder.encode(text_rep)
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    def get_stored_embedding(self, patient_id: str):
+        """Returns the patient's embedding from the ANN index or DATA.PatientEmbeddings, if indexed."""
+        if self.ann_index is not None and patient_id in self.ann_index:
+            return self.ann_index.get(patient_id)
         with get_db_connection() as conn:
-            # Find patients not yet in embeddings table
-            query_str = """
-                SELECT DISTINCT p.ID_PACIENT 
-                FROM DATA.Pacienti p
-                LEFT JOIN DATA.PatientEmbeddings e ON p.ID_PACIENT = e.ID_PACIENT
-                WHERE e.ID_PACIENT IS NULL
-            """
-            query = text(query_str)
-            result = conn.execute(query).fetchall()
-            patient_ids = [row[0] for row in result]
-            
-            if limit:
-                patient_ids = patient_ids[:limit]
-            
-            logger.info(f"Found {len(patient_ids)} patients to index.")
-            
-            # Process in batches to avoid OOM
-            for i in tqdm(range(0, len(patient_ids), batch_size), desc="Indexing Patients"):
-                batch_start = time.time()
-                batch_ids = patient_ids[i:i+batch_size]
-                
-                # Fetch events for entire batch with single connection and 3 queries
-                t0 = time.time()
-                events_map = get_batch_patient_events(batch_ids)
-                t1 = time.time()
-                logger.info(f"  DB Fetch: {t1-t0:.2f}s")
-                
-                batch_texts = []
-                batch_pids = []
-                
-                t0 = time.time()
-                for pid in batch_ids:
-                    events = events_map.get(pid, [])
-                    if pid == batch_ids[0]:
-                        logger.info(f"  Patient {pid} event count: {len(events)}")
-                    if not events:
-                        continue
-                    
-                    # USE THE NEW SMART STRING LINEARIZATION
-                    text_rep = self.events_to_string(events, patient_id=pid)
-                    
-                    # Log first example for debugging
-                    if pid == batch_ids[0]:
-                        logger.info(f"  Sample linearization ({len(text_rep)} chars): {text_rep[:200]}...")
-                    
-                    batch_texts.append(text_rep)
-                    batch_pids.append(pid)
-                t1 = time.time()
-                logger.info(f"  Text Conversion: {t1-t0:.2f}s")
-                
-                if not batch_texts:
-                    continue
-                    
-                # Batch encode
-                t0 = time.time()
-                embeddings = self.model.encode(batch_texts, show_progress_bar=False)
-                t1 = time.time()
-                logger.info(f"  Embedding Generation: {t1-t0:.2f}s")
-                
-                # Insert embeddings
-                t0 = time.time()
-                for pid, embedding in zip(batch_pids, embeddings):
-                    embedding_str = str(embedding.tolist())
-                    conn.execute(
-                        text("INSERT INTO DATA.PatientEmbeddings (ID_PACIENT, Embedding) VALUES (:pid, TO_VECTOR(:embedding, DECIMAL))"), 
-                        {"pid": pid, "embedding": embedding_str}
-                    )
-                conn.commit()
-                t1 = time.time()
-                logger.info(f"  DB Insert: {t1-t0:.2f}s")
-                
-                batch_end = time.time()
-                logger.info(f"Batch total: {batch_end-batch_start:.2f}s")
-
-    def find_similar_patients_with_scores(self, patient_history: list[PatientEvent], top_k: int = 5) -> list[tuple[str, float]]:
+            row = conn.execute(
+                text("SELECT Embedding FROM DATA.PatientEmbeddings WHERE ID_PACIENT = :pid"), {"pid": patient_id}
+            ).fetchone()
+        return parse_vector(row[0]) if row and row[0] is not None else None
+
+    def find_similar_patients_with_scores(self, patient_history: Events, top_k: int = 5,
+                                          search: SearchMode = "ann", patient_id: str = None,
+                                          reuse_stored_embedding: bool = False) -> list[tuple[str, float]]:
         """
         Finds similar patients with similarity scores.
+        With reuse_stored_embedding and a patient_id, the indexed embedding of that patient
+        is used as the query (no encoding); only valid when querying on the full history.
         Returns list of (patient_id, similarity_score) tuples.
         """
-        text_rep = linearize_for_query(patient_history)
-        query_embedding = self.model.encode(text_rep).tolist()
-        query_embedding_str = str(query_embedding)
+        query_embedding = self.get_query_embedding(patient_history, patient_id, reuse_stored_embedding)
+        return self.search_embedding(query_embedding, top_k=top_k, search=search)
+
+    def get_query_embedding(self, patient_history: Events, patient_id: str = None,
+                            reuse_stored_embedding: bool = False):
+        """
+        Embedding used as the similarity query: the patient's indexed embedding when
+        reuse_stored_embedding is set and available, otherwise the encoded profile.
+        """
+        if reuse_stored_embedding and patient_id is not None:
+            query_embedding = self.get_stored_embedding(patient_id)
+            if query_embedding is not None:
+                self.stored_embedding_reuses += 1
+                return query_embedding
+        return self.encode_query(linearize_for_query(patient_history))
+
+    def search_embedding(self, query_embedding, top_k: int = 5, search: SearchMode = "ann") -> list[tuple[str, float]]:
+        """Runs the nearest-neighbour query for an already encoded profile."""
+        if search == "ann" and self.ann_index is not None and len(self.ann_index) > 0:
+            return self.ann_index.search(query_embedding, top_k)
+
+        query_embedding_str = str(query_embedding.tolist())
 
         with get_db_connection() as conn:
             sql = text("""
@@ -123,26 +147,11 @@ class VectorEngine:
 
     def _detect_outcome(self, events: list[dict]) -> str:
         """Detect the likely outcome from a trajectory's events."""
-        if not events:
-            return "UNKNOWN"
-        
-        # Check last few events for outcome indicators
-        last_events_text = " ".join(e["label"].upper() for e in events[-10:])
-        
-        if "PALIATIV" in last_events_text or "HOSPIC" in last_events_text:
-            return "END_OF_LIFE"
-        elif "ZEMŘEL" in last_events_text or "PROHLÍDKA ZEMŘELÉHO" in last_events_text:
-            return "DEATH"
-        elif "PROPUŠTĚN" in last_events_text:
-            return "DISCHARGED"
-        elif any(kw in last_events_text for kw in ["INTENZIVNÍ", "JIP", "ARO", "RESUSCIT"]):
-            return "CRITICAL"
-        elif any(kw in last_events_text for kw in ["REHABILITACE", "LÁZEŇ"]):
-            return "REHABILITATION"
-        else:
-            return "ONGOING"
+        return label_features.outcome(label_features.label_ids(e["label"] for e in events))
 
-    def get_future_trajectories(self, patient_history: list[PatientEvent], snapshot_events: int = None, top_k: int = 5) -> list[dict]:
+    def get_future_trajectories(self, patient_history: Events, snapshot_events: int = None, top_k: int = 5,
+                                search: SearchMode = "ann", patient_id: str = None,
+                                reuse_stored_embedding: bool = False, query_embedding=None) -> list[dict]:
         """
         Returns k complete future trajectories from similar patients.
         Each trajectory is a real patient's actual journey - coherent and realistic.
@@ -154,12 +163,21 @@ class VectorEngine:
             patient_history: Full event history of the query patient
             snapshot_events: Number of events to use as "current state" (default: all events)
             top_k: Number of trajectory completions to return
+            search: Similarity backend, "ann" (in-process index) or "sql" (exact scan in IRIS)
+            patient_id: ID of the query patient, needed for reuse_stored_embedding
+            reuse_stored_embedding: Use the patient's indexed embedding instead of encoding
+                                    (ignored when snapshot_events is set)
+            query_embedding: Precomputed query embedding for the snapshot (see get_query_embedding),
+                             so callers can run the encoding step on a separate pool
             
         Returns:
             List of trajectory completions matching PatientFuture schema:
             - expected_health_services: complete event sequence (the trajectory)
             - probability: confidence score (similarity * 100)
         """
+        # The stored embedding describes the full history, so it can't stand in for a snapshot
+        reuse_stored_embedding = reuse_stored_embedding and snapshot_events is None
+
         # Determine how many events define "current state"
         if snapshot_events is None:
             snapshot_events = len(patient_history)
@@ -173,42 +191,92 @@ class VectorEngine:
             return []
         
         # Find similar patients with scores (get extra to account for filtering)
-        similar_patients = self.find_similar_patients_with_scores(snapshot_history, top_k=top_k * 2)
+        if query_embedding is not None:
+            similar_patients = self.search_embedding(query_embedding, top_k=top_k * 2, search=search)
+        else:
+            similar_patients = self.find_similar_patients_with_scores(
+                snapshot_history, top_k=top_k * 2, search=search,
+                patient_id=patient_id, reuse_stored_embedding=reuse_stored_embedding
+            )
         
+        # Skip similar patients with fewer or equal events (no future to show).
+        # The filter runs on per-patient counts, so short neighbours are never fetched,
+        # and all remaining timelines come back in one batched call.
+        candidate_ids = [pid for pid, _ in similar_patients]
+        event_counts = get_patient_event_counts(candidate_ids)
+        eligible_ids = [pid for pid in candidate_ids if event_counts.get(pid, 0) > snapshot_events]
+        neighbour_timelines = get_batch_patient_timelines(eligible_ids)
+        
+        return self._build_trajectories(similar_patients, neighbour_timelines, snapshot_events, top_k)
+
+    def get_future_trajectories_batch(self, snapshots: list[Events], top_k: int = 5, index: ExactIndex = None,
+                                      encode_batch_size: int = 128, fetch_batch_size: int = 500) -> list[list[dict]]:
+        """
+        get_future_trajectories for many query snapshots at once (used by the batch backtest):
+        all profiles are encoded in one model call, the neighbour search is one matrix product
+        per chunk against `index` (default: the loaded ANN index), and the event counts and
+        timelines of all distinct neighbours are fetched in batches of fetch_batch_size.
+        Each snapshot is aligned at its own length, i.e. snapshot_events = len(snapshot).
+        """
+        from linearizer import linearize_batch_for_query
+
+        index = index if index is not None else self.ann_index
+        if not snapshots:
+            return []
+        if index is None:
+            raise ValueError("Batch trajectories need an in-process index (see load_index)")
+
+        embeddings = self.model.encode(linearize_batch_for_query(snapshots), batch_size=encode_batch_size,
+                                       show_progress_bar=False)
+        neighbours = index.search_batch(embeddings, top_k * 2)
+
+        candidate_ids = list(dict.fromkeys(pid for similar in neighbours for pid, _ in similar))
+        min_snapshot = min(len(snapshot) for snapshot in snapshots)
+        neighbour_timelines = {}
+        for i in range(0, len(candidate_ids), fetch_batch_size):
+            batch = candidate_ids[i:i + fetch_batch_size]
+            event_counts = get_patient_event_counts(batch)
+            eligible_ids = [pid for pid in batch if event_counts.get(pid, 0) > min_snapshot]
+            neighbour_timelines.update(get_batch_patient_timelines(eligible_ids, use_cache=False))
+        return [
+            self._build_trajectories(similar, neighbour_timelines, len(snapshot), top_k)
+            for snapshot, similar in zip(snapshots, neighbours)
+        ]
+
+    def _build_trajectories(self, similar_patients: list[tuple[str, float]], neighbour_timelines: dict,
+                            snapshot_events: int, top_k: int) -> list[dict]:
+        """Future trajectories of the neighbours, aligned at their snapshot_events-th event."""
         trajectories = []
         
         for pid, similarity in similar_patients:
             # Get this patient's complete event history
-            similar_events = get_patient_events(pid)
-            
-            # Skip if similar patient has fewer or equal events (no future to show)
-            if len(similar_events) <= snapshot_events:
+            similar_events = neighbour_timelines.get(pid)
+            if similar_events is None or len(similar_events) <= snapshot_events:
                 continue
             
             # Event-count alignment: find their Nth event as anchor
-            anchor_event = similar_events[snapshot_events - 1]
-            anchor_day = anchor_event.date
+            anchor_day = int(similar_events.date[snapshot_events - 1])
             
             # Extract future events (after the alignment point)
-            future_events = []
-            for event in similar_events[snapshot_events:]:
-                # Light filtering - only remove truly administrative noise
-                if "REGULAČNÍ POPLATEK" in event.label.upper():
-                    continue
-                
-                future_events.append({
+            # Light filtering - only remove truly administrative noise
+            future = similar_events[snapshot_events:]
+            keep = (label_features.flags_of(future.label_id) & REGULATORY_FEE) == 0
+            future_events = [
+                {
                     "label": event.label,
-                    "type": event.type.value if hasattr(event.type, 'value') else str(event.type),
+                    "type": event.type.value,
                     "delta_days": event.date - anchor_day,  # Relative to alignment point
                     "detail": event.detail
-                })
+                }
+                for event, kept in zip(future, keep.tolist()) if kept
+            ]
             
             # Skip if no future events after filtering
             if not future_events:
                 continue
             
             # Detect outcome from the trajectory
-            outcome = self._detect_outcome(future_events)
+            outcome = label_features.outcome(future.label_id[keep])
             
             # Calculate confidence as percentage (similarity score is typically 0-1 for normalized vectors)
             # Clamp to 0-100 range
@@ -234,5 +302,13 @@ class VectorEngine:
         
         return trajectories
 
+    def stats(self) -> dict:
+        return {
+            "query_embedding_cache": self.query_cache.stats(),
+            "encoder": self.encoder.stats(),
+            "stored_embedding_reuses": self.stored_embedding_reuses,
+            "ann_index_size": len(self.ann_index) if self.ann_index is not None else None,
+        }
+
 # Singleton instance
 vector_engine = VectorEngine()
@@ -0,0 +1,59 @@
+# Run from back/: python -m unittest discover tests
+
+import os
+import sys
+import threading
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import indexer  # noqa: E402
+
+
+class _Writer:
+    def write(self, pids, embeddings, fingerprints):
+        pass
+
+    def summary(self):
+        return {}
+
+
+def _empty_timelines(patient_ids, use_cache=True):
+    return {pid: [] for pid in patient_ids}
+
+
+@contextmanager
+def _no_connection():
+    yield None
+
+
+class PipelinedIndexerFailureTest(unittest.TestCase):
+    def test_run_raises_when_a_stage_fails(self):
+        """A failing linearize stage must not leave run() blocked on a full fetched queue."""
+        engine = mock.Mock(ann_index=None)
+        pipeline = indexer.PipelinedIndexer(engine, batch_size=1, fetch_workers=2, linearize_workers=0,
+                                            queue_size=1, checkpoint_path=None)
+        outcome = {}
+
+        def run():
+            try:
+                pipeline.run(patient_ids=[str(i) for i in range(50)])
+            except BaseException as e:
+                outcome["error"] = e
+
+        with mock.patch.object(indexer, "get_batch_patient_timelines", _empty_timelines), \
+                mock.patch.object(indexer, "_linearize_batch", side_effect=RuntimeError("worker failed")), \
+                mock.patch.object(indexer, "get_db_connection", _no_connection), \
+                mock.patch.object(indexer, "create_writer", lambda conn, mode, upsert: _Writer()):
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+            thread.join(timeout=30)
+
+        self.assertFalse(thread.is_alive(), "run() did not return after a stage failed")
+        self.assertIsInstance(outcome.get("error"), RuntimeError)
+
+
+if __name__ == "__main__":
+    unittest.main()
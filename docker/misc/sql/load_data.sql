@@ -23,5 +23,13 @@ LOAD DATA FROM FILE '/data/pruchod/Ciselnik_ICZ.csv' INTO DATA.CiselnikICZ USING
 CREATE INDEX idx_hospitalizace_patient ON DATA.Hospitalizace (ID_PACIENT)
 CREATE INDEX idx_lazne_patient ON DATA.Lazne (ID_PACIENT)
 CREATE INDEX idx_pece_patient ON DATA.Pece (ID_PACIENT)
+DROP TABLE IF EXISTS DATA.PeceDaily
+CREATE TABLE DATA.PeceDaily (ID_PACIENT VARCHAR(50), DNY_OD_ZAKLADNI_PECE INTEGER, LABEL VARCHAR(2000), TYPVYK VARCHAR(50), KOD VARCHAR(50), POCET INTEGER, ODB_NAZEV VARCHAR(255))
+INSERT INTO DATA.PeceDaily (ID_PACIENT, DNY_OD_ZAKLADNI_PECE, LABEL, TYPVYK, KOD, POCET, ODB_NAZEV) SELECT g.ID_PACIENT, g.DNY_OD_ZAKLADNI_PECE, CASE WHEN g.TYPVYK IN ('1', '2') AND g.KOD IS NOT NULL AND g.KOD <> '' AND m.NAZEV IS NOT NULL THEN m.NAZEV WHEN g.TYPVYK IN ('1', '2') AND g.KOD IS NOT NULL AND g.KOD <> '' AND (g.LABEL = '' OR g.LABEL = 'Unknown Care') THEN 'Unknown Medication' ELSE g.LABEL END, g.TYPVYK, g.KOD, g.N, g.ODB_NAZEV FROM (SELECT ID_PACIENT, DNY_OD_ZAKLADNI_PECE, COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care') AS LABEL, TYPVYK, KOD, COUNT(*) AS N, MIN(ODB_NAZEV) AS ODB_NAZEV FROM DATA.Pece GROUP BY ID_PACIENT, DNY_OD_ZAKLADNI_PECE, COALESCE(NAZEV_VYKON, SEGMENT_NAZEV, 'Unknown Care'), TYPVYK, KOD) g LEFT JOIN (SELECT KOD, MAX(NAZEV) AS NAZEV FROM DATA.CiselnikHVLP WHERE KOD IS NOT NULL AND KOD <> '' AND NAZEV IS NOT NULL AND NAZEV <> '' GROUP BY KOD) m ON m.KOD = g.KOD ORDER BY g.ID_PACIENT, g.DNY_OD_ZAKLADNI_PECE
+CREATE INDEX idx_pece_daily_patient ON DATA.PeceDaily (ID_PACIENT, DNY_OD_ZAKLADNI_PECE)
+CREATE INDEX idx_pece_daily_odb ON DATA.PeceDaily (ODB_NAZEV)
 DROP TABLE IF EXISTS DATA.PatientEmbeddings
-CREATE TABLE DATA.PatientEmbeddings (ID_PACIENT VARCHAR(50),Embedding VECTOR(DECIMAL, 384))
+CREATE TABLE DATA.PatientEmbeddings (ID_PACIENT VARCHAR(50),Embedding VECTOR(DECIMAL, 384), EVENT_COUNT INTEGER, MAX_DAY INTEGER, PROFILE_HASH VARCHAR(64))
+CREATE INDEX idx_embeddings_patient ON DATA.PatientEmbeddings (ID_PACIENT)
+DROP TABLE IF EXISTS DATA.PatientEmbeddingsStaging
+CREATE TABLE DATA.PatientEmbeddingsStaging (ID_PACIENT VARCHAR(50), EmbeddingText VARCHAR(10000), EVENT_COUNT INTEGER, MAX_DAY INTEGER, PROFILE_HASH VARCHAR(64))
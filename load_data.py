@@ -1,5 +1,7 @@
 import os
+import json
 import subprocess
+import urllib.request
 import gdown
 import py7zr
 import pandas as pd # New dependency for xlsx
@@ -7,6 +9,7 @@ import pandas as pd # New dependency for xlsx
 # --- CONFIGURATION ---
 DATA_DIR = "docker/data/pruchod" # Ensure this matches your folder structure
 SQL_SCRIPT = "docker/misc/sql/load_data.sql"
+BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
@@ -99,6 +102,7 @@ for filename in cp1250_files:
         print(f"   ⚠️ Source file {filename} not found.")
 
 # 5. RUN SQL LOADER
+data_loaded = False
 print("🚀 Running SQL Loader in Docker...")
 # Only try to load if the SQL file exists
 if os.path.exists(SQL_SCRIPT):
@@ -115,10 +119,27 @@ if os.path.exists(SQL_SCRIPT):
         if result.returncode == 0:
             print("✅ Data Loaded Successfully!")
             print(result.stdout)
+            data_loaded = True
         else:
             print("❌ SQL Error:")
             print(result.stderr)
     except Exception as e:
         print(f"❌ Failed to run Docker command: {e}")
 else:
-    print(f"⚠️  SQL file not found at {SQL_SCRIPT}. Skipping load.")
\ No newline at end of file
+    print(f"⚠️  SQL file not found at {SQL_SCRIPT}. Skipping load.")
+
+# 6. INVALIDATE BACKEND CACHES
+# A running backend keeps patient timelines in memory; drop them so the reload is visible
+if data_loaded:
+    print("🧹 Invalidating backend caches...")
+    try:
+        request = urllib.request.Request(
+            f"{BACKEND_URL}/cache/invalidate",
+            data=b"{}",
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            print(f"   Invalidated {json.load(response)['invalidated']} cached timelines.")
+    except Exception as e:
+        print(f"   Skipping (backend not reachable at {BACKEND_URL}: {e})")